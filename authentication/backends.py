@@ -1,26 +1,73 @@
+import hashlib
+import logging
+
+from django.conf import settings
 from django.contrib.auth.backends import ModelBackend
 from django.contrib.auth import get_user_model
-from django.db.models import Q
+from django.core.cache import cache
+
+from .models import normalize_email_key
+
+logger = logging.getLogger(__name__)
+
+
+def _miss_key(identifier):
+    # Hashed so the cache never holds the addresses people tried.
+    digest = hashlib.sha256(identifier.strip().lower().encode()).hexdigest()
+    return f"login-miss:{digest}"
+
+
+def forget_missing_login(*identifiers):
+    """Drop cached misses for ``identifiers``, e.g. once a user with that name or email exists."""
+    cache.delete_many([_miss_key(identifier) for identifier in identifiers if identifier])
+
 
 class EmailOrUsernameModelBackend(ModelBackend):
-    # In your backends.py file, add these lines:
+    """Log in with either the username or the email address.
+
+    Anything shaped like an email address is looked up through the unique
+    ``Profile.email_key`` index, anything else by an exact match on the
+    username's unique index, so each attempt is one indexed query. Usernames
+    are therefore only case-insensitive where the database collation makes
+    them so: MySQL/MariaDB's default ``_ci`` collations do, SQLite and
+    PostgreSQL don't. Email addresses are case-insensitive everywhere.
+    An address that matches no email is still tried as a username, since
+    usernames may contain ``@``. Identifiers that match nobody are remembered
+    for ``LOGIN_MISS_CACHE_TTL`` seconds, so repeated guesses at them (as in
+    credential stuffing) skip the database.
+    """
+
     def authenticate(self, request, username=None, password=None, **kwargs):
-        print(f"Attempting authentication with: {username}")
         UserModel = get_user_model()
-        try:
-            # Try to fetch the user by username or email
-            user = UserModel.objects.get(
-                Q(username__iexact=username) | Q(email__iexact=username)
-            )
-            print(f"Found user: {user.username}, email: {user.email}")
-            if user.check_password(password):
-                print("Password check successful")
-                return user
-            else:
-                print("Password check failed")
-        except UserModel.DoesNotExist:
-            print("User does not exist")
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if not username or password is None:
+            return None
+        user = self.find_user(username)
+        if user is None:
+            logger.debug("No user matches the given username or email")
             # Run the default password hasher once to reduce the timing
             # difference between an existing and a nonexistent user.
             UserModel().set_password(password)
-        return None
\ No newline at end of file
+            return None
+        if user.check_password(password):
+            return user
+        logger.debug("Password check failed for user %s", user.pk)
+        return None
+
+    def find_user(self, identifier):
+        ttl = settings.LOGIN_MISS_CACHE_TTL
+        if ttl and cache.get(_miss_key(identifier)):
+            return None
+        UserModel = get_user_model()
+        lookups = [{UserModel.USERNAME_FIELD: identifier}]
+        if '@' in identifier:
+            lookups.insert(0, {'profile__email_key': normalize_email_key(identifier)})
+        for lookup in lookups:
+            try:
+                return UserModel._default_manager.get(**lookup)
+            except UserModel.DoesNotExist:
+                pass
+        if ttl:
+            cache.set(_miss_key(identifier), True, ttl)
+        return None
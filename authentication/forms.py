@@ -2,6 +2,8 @@ from django import forms
 from django.contrib.auth.forms import UserCreationForm, AuthenticationForm
 from django.contrib.auth.models import User
 
+from .models import Profile, normalize_email_key
+
 class UserRegistrationForm(UserCreationForm):
     email = forms.EmailField(required=True)
     first_name = forms.CharField(required=True)
@@ -13,7 +15,7 @@ class UserRegistrationForm(UserCreationForm):
         
     def clean_email(self):
         email = self.cleaned_data.get('email')
-        if User.objects.filter(email=email).exists():
+        if Profile.objects.filter(email_key=normalize_email_key(email)).exists():
             raise forms.ValidationError("This email is already in use")
         return email
         
@@ -0,0 +1,57 @@
+# Generated by Django 5.2 on 2026-10-18 09:47
+
+from django.conf import settings
+from django.db import migrations, models
+
+BATCH_SIZE = 1000
+
+
+def backfill_email_keys(apps, schema_editor):
+    """Give every user a profile and every profile its lower-cased email.
+
+    Where several users share an address (ignoring case) only the oldest
+    keeps it as a login.
+    """
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split("."))
+    Profile = apps.get_model("authentication", "Profile")
+    Profile.objects.bulk_create(
+        [Profile(user_id=user_id) for user_id in User.objects.filter(profile__isnull=True).values_list("id", flat=True)],
+        batch_size=BATCH_SIZE,
+    )
+    seen = set()
+    last = 0
+    while True:
+        batch = list(
+            Profile.objects.filter(user_id__gt=last).order_by("user_id").values_list("id", "user_id", "user__email")[:BATCH_SIZE]
+        )
+        if not batch:
+            break
+        profiles = []
+        for profile_id, user_id, email in batch:
+            key = (email or "").strip().lower() or None
+            if key in seen:
+                key = None
+            elif key:
+                seen.add(key)
+            profiles.append(Profile(id=profile_id, email_key=key))
+        Profile.objects.bulk_update(profiles, ["email_key"])
+        last = batch[-1][1]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("authentication", "0001_initial"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="profile",
+            name="email_key",
+            field=models.CharField(
+                blank=True, editable=False, max_length=254, null=True, unique=True
+            ),
+        ),
+        migrations.RunPython(backfill_email_keys, migrations.RunPython.noop),
+    ]
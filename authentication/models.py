@@ -3,19 +3,45 @@ from django.contrib.auth.models import User
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 
+
+def normalize_email_key(email):
+    """The lookup form of an email address: stripped and lower-cased, ``None`` when blank."""
+    return (email or '').strip().lower() or None
+
+
 class Profile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='profile')
     bio = models.TextField(max_length=500, blank=True)
     avatar = models.ImageField(upload_to='profile_images/', blank=True, null=True)
-    
+    # ``user.email`` lower-cased, kept in step on every user save. auth_user.email
+    # has no index and can't get a case-insensitive one portably, so logins by
+    # email look this up instead. Queryset ``update()``s of the email bypass it.
+    email_key = models.CharField(max_length=254, unique=True, null=True, blank=True, editable=False)
+
     def __str__(self):
         return f"{self.user.username}'s profile"
 
+def email_key_for(user):
+    """``user``'s email key, or ``None`` while another user already logs in with that address."""
+    key = normalize_email_key(user.email)
+    if key and Profile.objects.filter(email_key=key).exclude(user_id=user.pk).exists():
+        return None
+    return key
+
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
     if created:
-        Profile.objects.create(user=instance)
+        Profile.objects.create(user=instance, email_key=email_key_for(instance))
 
 @receiver(post_save, sender=User)
-def save_user_profile(sender, instance, **kwargs):
-    instance.profile.save()
\ No newline at end of file
+def save_user_profile(sender, instance, created, update_fields=None, **kwargs):
+    from .backends import forget_missing_login
+
+    # Every login saves last_login; that changes nothing here.
+    if update_fields is not None and set(update_fields) == {'last_login'}:
+        return
+    profile = instance.profile
+    if not created and profile.email_key != normalize_email_key(instance.email):
+        profile.email_key = email_key_for(instance)
+    profile.save()
+    forget_missing_login(instance.username, instance.email)
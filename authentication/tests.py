@@ -1,3 +1,56 @@
-from django.test import TestCase
+from django.contrib.auth import authenticate
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
 
-# Create your tests here.
+from .forms import UserRegistrationForm
+
+
+@override_settings(LOGIN_MISS_CACHE_TTL=30)
+class EmailOrUsernameLoginTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("alice", "Alice@Example.com", "pw")
+
+    def test_logs_in_by_username_or_email_in_one_query(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(authenticate(username="alice@example.COM", password="pw"), self.user)
+        with self.assertNumQueries(1):
+            self.assertEqual(authenticate(username="alice", password="pw"), self.user)
+        self.assertIsNone(authenticate(username="alice", password="wrong"))
+
+    def test_username_case_follows_the_database_collation(self):
+        user = authenticate(username="ALICE", password="pw")
+        if connection.vendor == "mysql":
+            # The default _ci collation compares usernames case-insensitively.
+            self.assertEqual(user, self.user)
+        else:
+            self.assertIsNone(user)
+        # Email addresses ignore case on every database.
+        self.assertEqual(authenticate(username="ALICE@EXAMPLE.COM", password="pw"), self.user)
+
+    def test_email_key_follows_the_email(self):
+        self.user.email = "alice@new.example.com"
+        self.user.save()
+        self.assertEqual(authenticate(username="ALICE@new.example.com", password="pw"), self.user)
+        self.assertIsNone(authenticate(username="alice@example.com", password="pw"))
+        # A second user with the same address can't take over its logins.
+        other = User.objects.create_user("bob", "Alice@New.example.com", "pw")
+        self.assertIsNone(other.profile.email_key)
+        self.assertEqual(authenticate(username="alice@new.example.com", password="pw"), self.user)
+
+    def test_misses_are_cached_until_the_user_exists(self):
+        self.assertIsNone(authenticate(username="carol@example.com", password="pw"))
+        with self.assertNumQueries(0):
+            self.assertIsNone(authenticate(username="carol@example.com", password="pw"))
+        User.objects.create_user("carol", "carol@example.com", "pw")
+        self.assertIsNotNone(authenticate(username="carol@example.com", password="pw"))
+
+    def test_registration_rejects_an_email_in_use_in_any_case(self):
+        form = UserRegistrationForm(data={
+            "username": "alice2", "email": "ALICE@example.com", "first_name": "A", "last_name": "B",
+            "password1": "a-long-passphrase-1", "password2": "a-long-passphrase-1",
+        })
+        self.assertFalse(form.is_valid())
+        self.assertIn("email", form.errors)
@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import CodeSession, CodeInteraction
+from .models import CodeSession, CodeInteraction, GenerationJob
+from .search import matching
 
 @admin.register(CodeSession)
 class CodeSessionAdmin(admin.ModelAdmin):
@@ -11,4 +12,16 @@ class CodeSessionAdmin(admin.ModelAdmin):
 class CodeInteractionAdmin(admin.ModelAdmin):
     list_display = ('session', 'language', 'created_at')
     list_filter = ('language', 'created_at')
-    search_fields = ('prompt', 'response', 'code_snippet')
\ No newline at end of file
+    # Matched through the full-text index in coder/search.py, not LIKE.
+    search_fields = ('prompt', 'response')
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term:
+            return queryset, False
+        return queryset.filter(pk__in=matching(search_term).values('interaction_id')), False
+
+@admin.register(GenerationJob)
+class GenerationJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'status', 'priority', 'attempts', 'worker', 'created_at', 'finished_at')
+    list_filter = ('status', 'created_at')
+    raw_id_fields = ('interaction',)
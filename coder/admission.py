@@ -0,0 +1,230 @@
+# coder/admission.py
+"""Admission control in front of Ollama.
+
+At most ``ADMISSION_MAX_CONCURRENCY`` generations run at once per process, and
+at most ``ADMISSION_MAX_PER_USER`` of them for any one user. Requests over
+either cap wait in a bounded queue that is served round-robin across users,
+so one user's burst can't push everyone else to the back. A request that
+can't be queued, or waits longer than ``ADMISSION_QUEUE_TIMEOUT``, is
+rejected with a Retry-After estimate. So is a generation whose model is
+loading on every backend: it would only wait out the load holding a slot.
+"""
+import asyncio
+import threading
+import time
+from collections import deque
+
+from .metrics import ADMISSION_REJECTED, ADMISSION_WAIT
+from .settings import (
+    ADMISSION_ENABLED,
+    ADMISSION_MAX_CONCURRENCY,
+    ADMISSION_MAX_PER_USER,
+    ADMISSION_QUEUE_PER_USER,
+    ADMISSION_QUEUE_SIZE,
+    ADMISSION_QUEUE_TIMEOUT,
+    MODEL_LOADING_RETRY_AFTER,
+)
+from .routing import get_router
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, reason, retry_after, subject="generations"):
+        super().__init__(f"Too many {subject} in progress ({reason}), retry in {int(retry_after)}s")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class Ticket:
+    def __init__(self, user, loop=None):
+        self.user = user
+        self.queued_at = time.monotonic()
+        self.admitted_at = None
+        self.released = False
+        self.event = threading.Event()
+        # Async waiters are woken on their own event loop.
+        self.loop = loop
+        self.future = loop.create_future() if loop else None
+
+    @property
+    def waited(self):
+        return self.admitted_at is not None and self.admitted_at - self.queued_at > 0.001
+
+    def grant(self):
+        self.admitted_at = time.monotonic()
+        if self.future is None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(lambda: self.future.done() or self.future.set_result(True))
+
+
+class AdmissionController:
+    # Recent wait times kept for the percentiles in ``stats``.
+    window = 1000
+
+    def __init__(self, max_concurrency=ADMISSION_MAX_CONCURRENCY, max_per_user=ADMISSION_MAX_PER_USER,
+                 queue_size=ADMISSION_QUEUE_SIZE, queue_per_user=ADMISSION_QUEUE_PER_USER,
+                 queue_timeout=ADMISSION_QUEUE_TIMEOUT, enabled=ADMISSION_ENABLED, subject="generations",
+                 router=None):
+        self.max_concurrency = max_concurrency
+        self.max_per_user = max_per_user
+        self.queue_size = queue_size
+        self.queue_per_user = queue_per_user
+        self.queue_timeout = queue_timeout
+        self.enabled = enabled
+        # What is being admitted, for error messages.
+        self.subject = subject
+        self._router = router
+        self.active = 0
+        self.active_by_user = {}
+        self.queues = {}
+        # Users with someone waiting, in the order they'll next be served.
+        self.turns = deque()
+        self.queued = 0
+        self.waits = deque(maxlen=self.window)
+        self.hold_time = None
+        self.counts = {"admitted": 0, "rejected": 0, "timed_out": 0}
+        self._lock = threading.Lock()
+
+    @property
+    def router(self):
+        return self._router or get_router()
+
+    def acquire(self, user, model=None):
+        """Block until ``user`` may start a generation; pair with ``release``."""
+        self._check_model(model)
+        ticket = self._enqueue(Ticket(user))
+        if ticket.admitted_at is None and not ticket.event.wait(self.queue_timeout):
+            self._give_up(ticket)
+        return ticket
+
+    async def aacquire(self, user, model=None):
+        self._check_model(model)
+        ticket = self._enqueue(Ticket(user, asyncio.get_running_loop()))
+        if ticket.admitted_at is None:
+            try:
+                await asyncio.wait_for(asyncio.shield(ticket.future), self.queue_timeout)
+            except asyncio.TimeoutError:
+                self._give_up(ticket)
+            except asyncio.CancelledError:
+                # Client went away while queued; don't leave a slot to a dead request.
+                if not self._withdraw(ticket):
+                    self.release(ticket)
+                raise
+        return ticket
+
+    def release(self, ticket):
+        if ticket is None or ticket.released:
+            return
+        with self._lock:
+            ticket.released = True
+            if ticket.admitted_at is None:
+                return
+            held = time.monotonic() - ticket.admitted_at
+            self.hold_time = held if self.hold_time is None else self.hold_time + 0.2 * (held - self.hold_time)
+            self.active -= 1
+            self.active_by_user[ticket.user] -= 1
+            if not self.active_by_user[ticket.user]:
+                del self.active_by_user[ticket.user]
+            self._dispatch()
+
+    def retry_after(self):
+        # Roughly how long the queue ahead would take to drain.
+        hold = self.hold_time or 1.0
+        return max(1, int(hold * (self.queued + 1) / max(self.max_concurrency, 1)) + 1)
+
+    def stats(self):
+        with self._lock:
+            waits = sorted(self.waits)
+            return {
+                "enabled": self.enabled,
+                "active": self.active,
+                "queued": self.queued,
+                "waiting_users": len(self.turns),
+                "max_concurrency": self.max_concurrency,
+                "max_per_user": self.max_per_user,
+                **self.counts,
+                "wait_p50_ms": round(waits[len(waits) // 2] * 1000, 1) if waits else 0.0,
+                "wait_p95_ms": round(waits[int(len(waits) * 0.95)] * 1000, 1) if waits else 0.0,
+                "hold_avg_ms": round(self.hold_time * 1000, 1) if self.hold_time is not None else None,
+            }
+
+    def _check_model(self, model):
+        if self.enabled and model is not None and self.router.loading_everywhere(model):
+            with self._lock:
+                self.counts["rejected"] += 1
+            ADMISSION_REJECTED.inc(subject=self.subject, reason="model loading")
+            raise AdmissionRejected("model loading", MODEL_LOADING_RETRY_AFTER, self.subject)
+
+    def _enqueue(self, ticket):
+        with self._lock:
+            if not self.enabled or (self.active < self.max_concurrency and not self.queued
+                                    and self.active_by_user.get(ticket.user, 0) < self.max_per_user):
+                self._admit(ticket)
+                return ticket
+            queue = self.queues.get(ticket.user)
+            if self.queued >= self.queue_size:
+                reason = "queue full"
+            elif queue is not None and len(queue) >= self.queue_per_user:
+                reason = "per-user queue full"
+            else:
+                if queue is None:
+                    queue = self.queues[ticket.user] = deque()
+                    self.turns.append(ticket.user)
+                queue.append(ticket)
+                self.queued += 1
+                # A slot may be free for this user even though others are waiting.
+                self._dispatch()
+                return ticket
+            self.counts["rejected"] += 1
+        ADMISSION_REJECTED.inc(subject=self.subject, reason=reason)
+        raise AdmissionRejected(reason, self.retry_after(), self.subject)
+
+    def _admit(self, ticket):
+        self.active += 1
+        self.active_by_user[ticket.user] = self.active_by_user.get(ticket.user, 0) + 1
+        self.counts["admitted"] += 1
+        waited = time.monotonic() - ticket.queued_at
+        self.waits.append(waited)
+        ADMISSION_WAIT.observe(waited, subject=self.subject)
+        ticket.grant()
+
+    def _dispatch(self):
+        """Hand free slots to waiting users in round-robin order."""
+        skipped = 0
+        while self.turns and self.active < self.max_concurrency and skipped < len(self.turns):
+            user = self.turns[0]
+            self.turns.rotate(-1)
+            if self.active_by_user.get(user, 0) >= self.max_per_user:
+                skipped += 1
+                continue
+            skipped = 0
+            queue = self.queues[user]
+            self.queued -= 1
+            self._admit(queue.popleft())
+            if not queue:
+                del self.queues[user]
+                self.turns.remove(user)
+
+    def _withdraw(self, ticket):
+        """Take a still-waiting ticket out of the queue; False if it was admitted meanwhile."""
+        with self._lock:
+            if ticket.admitted_at is not None:
+                return False
+            queue = self.queues[ticket.user]
+            queue.remove(ticket)
+            self.queued -= 1
+            if not queue:
+                del self.queues[ticket.user]
+                self.turns.remove(ticket.user)
+            ticket.released = True
+            return True
+
+    def _give_up(self, ticket):
+        if self._withdraw(ticket):
+            with self._lock:
+                self.counts["timed_out"] += 1
+            ADMISSION_REJECTED.inc(subject=self.subject, reason="queue timeout")
+            raise AdmissionRejected("queue timeout", self.retry_after(), self.subject)
+
+
+admission = AdmissionController()
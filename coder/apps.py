@@ -1,6 +1,23 @@
+import threading
+
 from django.apps import AppConfig
 
 
 class CoderConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'coder'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from .formatting import formatter
+        from .middleware import install_query_timers
+        from .settings import FORMAT_PREWARM, MODEL_WARMUP
+        install_query_timers()
+        # Toolchain probes and cache seeding take a while; keep them off startup and requests.
+        from .runners import resolve_toolchains
+        threading.Thread(target=resolve_toolchains, name="resolve-toolchains", daemon=True).start()
+        if FORMAT_PREWARM:
+            formatter.start()
+        if MODEL_WARMUP:
+            from .warmup import model_warmer
+            model_warmer.start()
@@ -0,0 +1,87 @@
+# coder/cache.py
+"""Exact-match cache of finished generations.
+
+Entries are keyed on a hash of everything that determines Ollama's answer
+(model, system prompt, earlier turns, prompt, options) and live in the
+Django cache configured under ``RESPONSE_CACHE_ALIAS``, so local-memory,
+file and Redis backends all work. TTL comes from the cache's ``TIMEOUT`` and
+eviction from the backend (LRU for locmem, ``maxmemory-policy`` for Redis).
+"""
+import hashlib
+import json
+
+from django.core.cache import caches
+
+from .settings import RESPONSE_CACHE_ALIAS, RESPONSE_CACHE_ENABLED, RESPONSE_CACHE_MAX_TEMPERATURE
+
+KEY_VERSION = 2
+
+
+class ResponseCache:
+    def __init__(self, alias=RESPONSE_CACHE_ALIAS, prefix="coder:response"):
+        self.alias = alias
+        self.prefix = prefix
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def accepts(self, options, think_mode=False):
+        """Whether a request is deterministic enough to be answered from cache."""
+        if not RESPONSE_CACHE_ENABLED or think_mode:
+            return False
+        return options.get("temperature", 0) <= RESPONSE_CACHE_MAX_TEMPERATURE
+
+    def key(self, model, system, prompt, options, history=(), affinity=None):
+        # ``affinity`` only picks the backend; it doesn't change the answer.
+        material = json.dumps([KEY_VERSION, model, system, list(history), prompt, options], sort_keys=True)
+        return f"{self.prefix}:{hashlib.sha256(material.encode()).hexdigest()}"
+
+    def get(self, key):
+        value = self.cache.get(key)
+        self._count("hits" if value is not None else "misses")
+        return value
+
+    def set(self, key, value):
+        self.cache.set(key, value)
+
+    async def aget(self, key):
+        value = await self.cache.aget(key)
+        await self._acount("hits" if value is not None else "misses")
+        return value
+
+    async def aset(self, key, value):
+        await self.cache.aset(key, value)
+
+    def stats(self):
+        counts = self.cache.get_many([f"{self.prefix}:stats:hits", f"{self.prefix}:stats:misses"])
+        hits = counts.get(f"{self.prefix}:stats:hits", 0)
+        misses = counts.get(f"{self.prefix}:stats:misses", 0)
+        total = hits + misses
+        return {
+            "backend": self.cache.__class__.__name__,
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": round(hits / total, 4) if total else 0.0,
+        }
+
+    def _count(self, name):
+        key = f"{self.prefix}:stats:{name}"
+        # Counters never expire so the ratio covers the cache's whole lifetime.
+        self.cache.add(key, 0, timeout=None)
+        try:
+            self.cache.incr(key)
+        except ValueError:
+            # Evicted between add() and incr(); losing one sample is fine.
+            pass
+
+    async def _acount(self, name):
+        key = f"{self.prefix}:stats:{name}"
+        await self.cache.aadd(key, 0, timeout=None)
+        try:
+            await self.cache.aincr(key)
+        except ValueError:
+            pass
+
+
+response_cache = ResponseCache()
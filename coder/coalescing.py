@@ -0,0 +1,296 @@
+# coder/coalescing.py
+"""Single-flight deduplication of identical generations.
+
+When the same prompt arrives several times while the first is still being
+generated, only the first request (the leader) calls Ollama; the others
+(followers) subscribe to its flight, receive the same tokens as they are
+produced and the same final payload, and then save their own interaction.
+
+Within a process flights live in a dict. With ``COALESCE_ACROSS_WORKERS`` a
+leader also claims a lock in the ``COALESCE_ALIAS`` cache, so a leader in
+another gunicorn worker waits for that worker's result instead of generating
+again (the cache must then be shared, e.g. Redis).
+"""
+import asyncio
+import threading
+import time
+
+from django.core.cache import caches
+
+from .settings import (
+    COALESCE_ACROSS_WORKERS,
+    COALESCE_ALIAS,
+    COALESCE_ENABLED,
+    COALESCE_POLL_INTERVAL,
+    COALESCE_WAIT_TIMEOUT,
+)
+
+
+class FlightAbandoned(Exception):
+    pass
+
+
+class Flight:
+    """One in-flight generation that any number of requests can follow."""
+
+    def __init__(self):
+        self.chunks = []
+        self.payload = None
+        self.error = None
+        # Set when the leader got its payload from another worker.
+        self.shared = False
+        self.done = threading.Event()
+        self._cond = threading.Condition()
+
+    def publish(self, chunk):
+        with self._cond:
+            self.chunks.append(chunk)
+            self._cond.notify_all()
+
+    def finish(self, payload):
+        with self._cond:
+            # A non-streaming leader has no chunks; hand streaming followers the whole text.
+            if not self.chunks and payload["response"]:
+                self.chunks.append(payload["response"])
+            self.payload = payload
+            self.done.set()
+            self._cond.notify_all()
+
+    def fail(self, error):
+        with self._cond:
+            if not self.done.is_set():
+                self.error = error
+                self.done.set()
+                self._cond.notify_all()
+
+    def result(self, timeout=COALESCE_WAIT_TIMEOUT):
+        if not self.done.wait(timeout):
+            raise FlightAbandoned("Timed out waiting for an identical generation")
+        if self.error is not None:
+            raise self.error
+        return self.payload
+
+    def follow(self, timeout=COALESCE_WAIT_TIMEOUT):
+        """Yield the leader's chunks, including those published before we joined."""
+        seen = 0
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._cond:
+                while seen == len(self.chunks) and not self.done.is_set():
+                    if not self._cond.wait(deadline - time.monotonic()):
+                        raise FlightAbandoned("Timed out waiting for an identical generation")
+                chunks = self.chunks[seen:]
+                finished = self.done.is_set()
+            seen += len(chunks)
+            yield from chunks
+            if finished and seen == len(self.chunks):
+                break
+        if self.error is not None:
+            raise self.error
+
+    async def aresult(self, timeout=COALESCE_WAIT_TIMEOUT):
+        deadline = time.monotonic() + timeout
+        while not self.done.is_set():
+            if time.monotonic() > deadline:
+                raise FlightAbandoned("Timed out waiting for an identical generation")
+            await asyncio.sleep(COALESCE_POLL_INTERVAL)
+        return self.result(0)
+
+    async def afollow(self, timeout=COALESCE_WAIT_TIMEOUT):
+        # Polls rather than blocking on the condition, which would stall the event loop.
+        seen = 0
+        deadline = time.monotonic() + timeout
+        while True:
+            finished = self.done.is_set()
+            chunks = self.chunks[seen:]
+            seen += len(chunks)
+            for chunk in chunks:
+                yield chunk
+            if finished and seen == len(self.chunks):
+                break
+            if not chunks:
+                if time.monotonic() > deadline:
+                    raise FlightAbandoned("Timed out waiting for an identical generation")
+                await asyncio.sleep(COALESCE_POLL_INTERVAL)
+        if self.error is not None:
+            raise self.error
+
+
+class Coalescer:
+    def __init__(self, alias=COALESCE_ALIAS, prefix="coder:flight", enabled=COALESCE_ENABLED,
+                 across_workers=COALESCE_ACROSS_WORKERS):
+        self.alias = alias
+        self.prefix = prefix
+        self.enabled = enabled
+        self.across_workers = across_workers
+        self.flights = {}
+        self._lock = threading.Lock()
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def join(self, key):
+        """Return ``(flight, leader)``; the leader must eventually call ``release``."""
+        if not self.enabled or key is None:
+            return Flight(), True
+        with self._lock:
+            flight = self.flights.get(key)
+            if flight is not None:
+                self._count_saved()
+                return flight, False
+            flight = self.flights[key] = Flight()
+            return flight, True
+
+    def in_flight(self, key):
+        return key is not None and key in self.flights
+
+    def release(self, key, flight):
+        if flight.payload is None:
+            # Failed or disconnected: let followers and other workers stop waiting.
+            flight.fail(FlightAbandoned("The identical generation was abandoned"))
+            self.abandon_remote(key)
+        with self._lock:
+            if self.flights.get(key) is flight:
+                del self.flights[key]
+
+    def run(self, key, produce):
+        """Call ``produce()`` once for all concurrent callers with ``key``.
+
+        Returns ``(payload, shared)`` where ``shared`` is true when another
+        request (here or in another worker) did the work.
+        """
+        flight, leader = self.join(key)
+        if not leader:
+            return flight.result(), True
+        try:
+            payload = self.remote_result(key)
+            flight.shared = payload is not None
+            if not flight.shared:
+                payload = produce()
+            self.finish(key, flight, payload)
+            return payload, flight.shared
+        except Exception as e:
+            flight.fail(e)
+            raise
+        finally:
+            self.release(key, flight)
+
+    async def arun(self, key, produce):
+        flight, leader = self.join(key)
+        if not leader:
+            return await flight.aresult(), True
+        try:
+            payload = await self.aremote_result(key)
+            flight.shared = payload is not None
+            if not flight.shared:
+                payload = await produce()
+            await self.afinish(key, flight, payload)
+            return payload, flight.shared
+        except Exception as e:
+            flight.fail(e)
+            raise
+        finally:
+            self.release(key, flight)
+
+    def lead(self, key, flight, open_stream):
+        """Token source for a streaming leader; every chunk is also published to ``flight``.
+
+        Finish with ``finish`` once the payload is built and always ``release``.
+        """
+        payload = self.remote_result(key)
+        if payload is not None:
+            flight.shared = True
+            yield payload["response"]
+            return
+        for chunk in open_stream():
+            flight.publish(chunk)
+            yield chunk
+
+    async def alead(self, key, flight, open_stream):
+        payload = await self.aremote_result(key)
+        if payload is not None:
+            flight.shared = True
+            yield payload["response"]
+            return
+        async for chunk in open_stream():
+            flight.publish(chunk)
+            yield chunk
+
+    def finish(self, key, flight, payload):
+        if not flight.shared:
+            self.publish_remote(key, payload)
+        flight.finish(payload)
+
+    async def afinish(self, key, flight, payload):
+        if not flight.shared:
+            await self.apublish_remote(key, payload)
+        flight.finish(payload)
+
+    def remote_result(self, key):
+        """Claim ``key`` across workers, or wait for the worker that already has.
+
+        Returns ``None`` when this worker should generate, otherwise the
+        other worker's payload.
+        """
+        if not self.enabled or not self.across_workers or key is None:
+            return None
+        deadline = time.monotonic() + COALESCE_WAIT_TIMEOUT
+        while True:
+            # Check the result before the lock: the other worker drops the lock once it publishes.
+            payload = self.cache.get(f"{self.prefix}:result:{key}")
+            if payload is not None:
+                self._count_saved()
+                return payload
+            if self.cache.add(f"{self.prefix}:lock:{key}", 1, timeout=COALESCE_WAIT_TIMEOUT):
+                return None
+            if time.monotonic() > deadline:
+                return None
+            time.sleep(COALESCE_POLL_INTERVAL)
+
+    async def aremote_result(self, key):
+        if not self.enabled or not self.across_workers or key is None:
+            return None
+        deadline = time.monotonic() + COALESCE_WAIT_TIMEOUT
+        while True:
+            payload = await self.cache.aget(f"{self.prefix}:result:{key}")
+            if payload is not None:
+                self._count_saved()
+                return payload
+            if await self.cache.aadd(f"{self.prefix}:lock:{key}", 1, timeout=COALESCE_WAIT_TIMEOUT):
+                return None
+            if time.monotonic() > deadline:
+                return None
+            await asyncio.sleep(COALESCE_POLL_INTERVAL)
+
+    def publish_remote(self, key, payload):
+        if self.enabled and self.across_workers and key is not None:
+            # Long enough for waiting workers to poll it, not a second response cache.
+            self.cache.set(f"{self.prefix}:result:{key}", payload, timeout=max(COALESCE_POLL_INTERVAL * 20, 5))
+            self.cache.delete(f"{self.prefix}:lock:{key}")
+
+    async def apublish_remote(self, key, payload):
+        if self.enabled and self.across_workers and key is not None:
+            await self.cache.aset(f"{self.prefix}:result:{key}", payload, timeout=max(COALESCE_POLL_INTERVAL * 20, 5))
+            await self.cache.adelete(f"{self.prefix}:lock:{key}")
+
+    def abandon_remote(self, key):
+        if self.enabled and self.across_workers and key is not None:
+            self.cache.delete(f"{self.prefix}:lock:{key}")
+
+    def stats(self):
+        return {
+            "saved_calls": self.cache.get(f"{self.prefix}:stats:saved", 0),
+            "in_flight": len(self.flights),
+        }
+
+    def _count_saved(self):
+        key = f"{self.prefix}:stats:saved"
+        self.cache.add(key, 0, timeout=None)
+        try:
+            self.cache.incr(key)
+        except ValueError:
+            pass
+
+
+coalescer = Coalescer()
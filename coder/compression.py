@@ -0,0 +1,205 @@
+# coder/compression.py
+"""Compression for the large text columns of ``CodeInteraction``.
+
+Every stored value starts with a one-byte tag naming its codec; values
+compressed against a shared dictionary follow it with the dictionary's id
+(4 bytes, big endian). Dictionaries live in ``CompressionDictionary`` and are
+never changed or deleted once written, so any value can always be read back.
+
+zstd needs the optional ``zstandard`` package; without it writes fall back to
+zlib, and reading zstd values raises ``CompressionError``.
+"""
+import threading
+import zlib
+from collections import Counter
+
+from django.db import DatabaseError
+
+from .settings import COMPRESSION_ALGORITHM, COMPRESSION_DICTIONARY, COMPRESSION_LEVEL, COMPRESSION_MIN_BYTES
+
+try:
+    import zstandard
+except ImportError:  # optional dependency
+    zstandard = None
+
+PLAIN = 0x01
+ZLIB = 0x02
+ZLIB_DICT = 0x03
+ZSTD = 0x04
+ZSTD_DICT = 0x05
+TAGS = {PLAIN, ZLIB, ZLIB_DICT, ZSTD, ZSTD_DICT}
+
+# zlib only looks back 32 KiB, so a longer dictionary would be wasted.
+ZLIB_DICT_MAX = 32 * 1024
+
+
+class CompressionError(Exception):
+    pass
+
+
+def is_compressed(value):
+    """Whether a raw column value was written by ``Codec.compress``.
+
+    Anything else is taken for plain UTF-8 (or ``str`` on SQLite); text never
+    starts with one of the tag bytes, which are control characters.
+    """
+    return isinstance(value, (bytes, bytearray, memoryview)) and len(value) > 0 and value[0] in TAGS
+
+
+class Codec:
+    def __init__(self, algorithm=COMPRESSION_ALGORITHM, level=COMPRESSION_LEVEL,
+                 min_bytes=COMPRESSION_MIN_BYTES, use_dictionary=COMPRESSION_DICTIONARY, dictionary=None):
+        if algorithm == "zstd" and zstandard is None:
+            algorithm = "zlib"
+        if algorithm not in ("zstd", "zlib", "none"):
+            raise CompressionError(f"Unknown compression algorithm {algorithm!r}")
+        self.algorithm = algorithm
+        self.level = level
+        self.min_bytes = min_bytes
+        self.use_dictionary = use_dictionary
+        self._dictionaries = {}
+        # ``dictionary`` pins ``(id, data)`` instead of looking it up, for benchmarks.
+        self._active = None
+        if dictionary is not None:
+            self._dictionaries[dictionary[0]] = dictionary[1]
+            self._active = (dictionary,)
+        self._lock = threading.Lock()
+        # zstd (de)compressors are reusable but not safe to share between threads.
+        self._local = threading.local()
+
+    def compress(self, text):
+        data = text.encode("utf-8")
+        if self.algorithm == "none" or len(data) < self.min_bytes:
+            return bytes([PLAIN]) + data
+        dictionary = self.active_dictionary() if self.use_dictionary else None
+        if self.algorithm == "zstd":
+            if dictionary:
+                header = bytes([ZSTD_DICT]) + dictionary[0].to_bytes(4, "big")
+            else:
+                header = bytes([ZSTD])
+            packed = header + self._zstd_compressor(dictionary).compress(data)
+        else:
+            if dictionary:
+                header = bytes([ZLIB_DICT]) + dictionary[0].to_bytes(4, "big")
+                compressor = zlib.compressobj(self.level, zdict=dictionary[1])
+            else:
+                header = bytes([ZLIB])
+                compressor = zlib.compressobj(self.level)
+            packed = header + compressor.compress(data) + compressor.flush()
+        # Short or already dense text can come out larger.
+        if len(packed) >= len(data) + 1:
+            return bytes([PLAIN]) + data
+        return packed
+
+    def decompress(self, value):
+        if isinstance(value, str):
+            return value
+        value = bytes(value)
+        if not is_compressed(value):
+            return value.decode("utf-8")
+        tag = value[0]
+        if tag == PLAIN:
+            return value[1:].decode("utf-8")
+        if tag in (ZLIB_DICT, ZSTD_DICT):
+            dictionary_id = int.from_bytes(value[1:5], "big")
+            dictionary = (dictionary_id, self.dictionary(dictionary_id))
+            payload = value[5:]
+        else:
+            dictionary = None
+            payload = value[1:]
+        if tag in (ZLIB, ZLIB_DICT):
+            decompressor = zlib.decompressobj(zdict=dictionary[1]) if dictionary else zlib.decompressobj()
+            data = decompressor.decompress(payload) + decompressor.flush()
+        else:
+            if zstandard is None:
+                raise CompressionError("zstd-compressed value, but the zstandard package is not installed")
+            data = self._zstd_decompressor(dictionary).decompress(payload)
+        return data.decode("utf-8")
+
+    def dictionary(self, dictionary_id):
+        data = self._dictionaries.get(dictionary_id)
+        if data is None:
+            from .models import CompressionDictionary
+
+            try:
+                data = bytes(CompressionDictionary.objects.values_list('data', flat=True).get(pk=dictionary_id))
+            except CompressionDictionary.DoesNotExist:
+                raise CompressionError(f"Compression dictionary {dictionary_id} is missing")
+            self._dictionaries[dictionary_id] = data
+        return data
+
+    def active_dictionary(self):
+        """``(id, data)`` of the newest dictionary for this algorithm, or ``None``.
+
+        Looked up once per process; a newly trained dictionary is used for
+        writes after the workers restart.
+        """
+        if self._active is None:
+            with self._lock:
+                if self._active is None:
+                    self._active = (self._load_active(),)
+        return self._active[0]
+
+    def _load_active(self):
+        from .models import CompressionDictionary
+
+        try:
+            row = CompressionDictionary.objects.filter(algorithm=self.algorithm).order_by('-id').first()
+        except DatabaseError:
+            # Table not migrated yet.
+            return None
+        if row is None:
+            return None
+        self._dictionaries[row.pk] = bytes(row.data)
+        return row.pk, self._dictionaries[row.pk]
+
+    def _zstd_compressor(self, dictionary):
+        cache = self._local.__dict__.setdefault("compressors", {})
+        key = dictionary[0] if dictionary else None
+        if key not in cache:
+            cache[key] = zstandard.ZstdCompressor(
+                level=self.level,
+                dict_data=zstandard.ZstdCompressionDict(dictionary[1]) if dictionary else None,
+                # The tag and header already say which dictionary; skip zstd's own copy.
+                write_dict_id=False,
+            )
+        return cache[key]
+
+    def _zstd_decompressor(self, dictionary):
+        cache = self._local.__dict__.setdefault("decompressors", {})
+        key = dictionary[0] if dictionary else None
+        if key not in cache:
+            cache[key] = zstandard.ZstdDecompressor(
+                dict_data=zstandard.ZstdCompressionDict(dictionary[1]) if dictionary else None
+            )
+        return cache[key]
+
+
+def train_dictionary(algorithm, samples, size):
+    """Build a shared dictionary from sample texts.
+
+    zstd trains one with ``zstandard.train_dictionary``. zlib can only use a
+    preset window, so it gets the lines recurring across the most samples,
+    the most valuable last because zlib prefers closer matches.
+    """
+    if algorithm == "zstd":
+        if zstandard is None:
+            raise CompressionError("Training a zstd dictionary needs the zstandard package")
+        try:
+            return zstandard.train_dictionary(size, [text.encode("utf-8") for text in samples]).as_bytes()
+        except zstandard.ZstdError as exc:
+            raise CompressionError(f"Could not train a dictionary: {exc}") from exc
+    counts = Counter()
+    for text in samples:
+        counts.update({line.strip() for line in text.splitlines() if len(line.strip()) >= 8})
+    picked, used = [], 0
+    for line, seen in sorted(counts.items(), key=lambda item: item[1] * len(item[0]), reverse=True):
+        encoded = line.encode("utf-8") + b"\n"
+        if seen < 2 or used + len(encoded) > min(size, ZLIB_DICT_MAX):
+            continue
+        picked.append(encoded)
+        used += len(encoded)
+    return b"".join(reversed(picked))
+
+
+codec = Codec()
@@ -0,0 +1,182 @@
+# coder/context.py
+"""Conversation context for a prompt, within a fixed token budget.
+
+Up to ``CONTEXT_WINDOW`` turns are replayed verbatim as chat messages,
+oldest first, as long as they fit ``CONTEXT_TOKEN_BUDGET``; long answers are
+clipped to ``CONTEXT_TURN_MAX_TOKENS``. Once they don't fit, the oldest are
+folded into ``CodeSession.summary`` (part of the system prompt) until only
+``CONTEXT_FOLD_TO`` remain, and are never re-read. So the prompt stays about
+the same size however long the session gets, and between folds each turn
+only appends to the previous prompt: Ollama reuses its cached prefix and
+prefills just the new turn.
+"""
+import logging
+import re
+
+from .models import CodeInteraction, CodeSession
+from .settings import (
+    CONTEXT_WINDOW,
+    CONTEXT_FOLD_TO,
+    CONTEXT_TOKEN_BUDGET,
+    CONTEXT_TURN_MAX_TOKENS,
+    CONTEXT_SUMMARY_MAX_TOKENS,
+    CONTEXT_SUMMARIZER,
+    OLLAMA_MODEL,
+)
+
+logger = logging.getLogger(__name__)
+
+# Words, numbers and single punctuation marks; long words count as several
+# tokens. Close enough to BPE tokenizers for budgeting without loading one.
+TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+CHARS_PER_TOKEN = 4
+DEFINITION_RE = re.compile(r"^\s*(?:async\s+)?(?:def|class|function|fn|func)\s+(\w+)", re.MULTILINE)
+# Unsummarized turns read per request; bounds the work on sessions older than the summary.
+FOLD_BATCH = 20
+
+
+def count_tokens(text):
+    return sum(-(-len(piece) // CHARS_PER_TOKEN) for piece in TOKEN_RE.findall(text))
+
+
+def truncate_tokens(text, limit):
+    """Cut ``text`` after ``limit`` tokens, marking the cut."""
+    used = 0
+    for match in TOKEN_RE.finditer(text):
+        used += -(-len(match.group()) // CHARS_PER_TOKEN)
+        if used > limit:
+            return text[:match.start()].rstrip() + " [...]"
+    return text
+
+
+class Turn:
+    def __init__(self, interaction):
+        self.id = interaction.id
+        self.prompt = interaction.prompt
+        self.response = truncate_tokens(interaction.response, CONTEXT_TURN_MAX_TOKENS)
+        self.text = f"User: {self.prompt}\nAssistant: {self.response}"
+        self.tokens = count_tokens(self.text)
+
+
+class Context:
+    def __init__(self, summary, turns):
+        self.summary = summary
+        self.turns = turns
+
+    def __bool__(self):
+        return bool(self.summary or self.turns)
+
+    @property
+    def tokens(self):
+        return count_tokens(self.summary) + sum(turn.tokens for turn in self.turns)
+
+    def system(self, system):
+        """``system`` with the summary of the folded turns appended."""
+        if not self.summary:
+            return system
+        return f"{system}\n\nSummary of the earlier conversation:\n{self.summary}"
+
+    def messages(self):
+        """The verbatim turns as chat messages, for ``OllamaService(history=...)``."""
+        messages = []
+        for turn in self.turns:
+            messages.append({"role": "user", "content": turn.prompt})
+            messages.append({"role": "assistant", "content": turn.response})
+        return messages
+
+
+class ExtractiveSummarizer:
+    """One line per folded turn: the question and what the answer defined."""
+
+    def fold(self, summary, turns):
+        lines = summary.splitlines() if summary else []
+        for turn in turns:
+            line = f"- User asked: {truncate_tokens(' '.join(turn.prompt.split()), 40)}"
+            names = DEFINITION_RE.findall(turn.response)
+            if names:
+                line += f" (answer defined {', '.join(dict.fromkeys(names))})"
+            lines.append(line)
+        # Rolling: the oldest lines go first once the summary is over budget.
+        while len(lines) > 1 and count_tokens("\n".join(lines)) > CONTEXT_SUMMARY_MAX_TOKENS:
+            lines.pop(0)
+        return truncate_tokens("\n".join(lines), CONTEXT_SUMMARY_MAX_TOKENS)
+
+
+class OllamaSummarizer:
+    """Let the model rewrite the summary; falls back to the extractive one on failure."""
+
+    system = (
+        "You maintain a running summary of a conversation between a user and a coding assistant. "
+        "Merge the new exchanges into the summary. Keep names, decisions and open questions; drop code. "
+        "Answer with the updated summary only."
+    )
+
+    def __init__(self, model=OLLAMA_MODEL):
+        self.model = model
+        self.fallback = ExtractiveSummarizer()
+
+    def fold(self, summary, turns):
+        from .services import OllamaService
+        exchanges = "\n\n".join(turn.text for turn in turns)
+        try:
+            result = OllamaService().generate(
+                prompt=f"Summary so far:\n{summary or '(empty)'}\n\nNew exchanges:\n{exchanges}",
+                model=self.model,
+                system=self.system,
+                options={"temperature": 0, "num_predict": CONTEXT_SUMMARY_MAX_TOKENS},
+            )
+            return truncate_tokens(result["response"].strip(), CONTEXT_SUMMARY_MAX_TOKENS)
+        except Exception as e:
+            logger.warning("Summarizing session context failed: %s", e)
+            return self.fallback.fold(summary, turns)
+
+
+class ContextBuilder:
+    def __init__(self, window=CONTEXT_WINDOW, budget=CONTEXT_TOKEN_BUDGET, summarizer=None, fold_to=CONTEXT_FOLD_TO):
+        self.window = window
+        self.budget = budget
+        self.fold_to = min(fold_to, window)
+        self.summarizer = summarizer or (
+            OllamaSummarizer() if CONTEXT_SUMMARIZER == "ollama" else ExtractiveSummarizer()
+        )
+
+    def build(self, session):
+        """Context for the next prompt in ``session``, folding turns that no longer fit."""
+        # Background jobs still running, or that never finished, aren't part of the conversation.
+        recent = CodeInteraction.objects.filter(
+            session=session, id__gt=session.summary_through, status=CodeInteraction.DONE
+        ).only('id', 'prompt', 'response').order_by('-id')[:self.window + FOLD_BATCH]
+        turns = [Turn(interaction) for interaction in recent]
+
+        used = count_tokens(session.summary)
+        if len(turns) <= self.window and used + sum(turn.tokens for turn in turns) <= self.budget:
+            kept = turns
+        else:
+            # Fold well below the limits rather than just enough, so the next
+            # few turns don't change the start of the prompt.
+            kept = []
+            budget = self.budget * self.fold_to // max(self.window, 1)
+            for turn in turns[:self.fold_to]:
+                if used + turn.tokens > budget:
+                    break
+                kept.append(turn)
+                used += turn.tokens
+        folded = turns[len(kept):]
+        if folded:
+            self.fold(session, list(reversed(folded)))
+        return Context(session.summary, list(reversed(kept)))
+
+    def fold(self, session, turns):
+        summary = self.summarizer.fold(session.summary, turns)
+        through = turns[-1].id
+        # Only the first of two concurrent requests folds the same turns.
+        updated = CodeSession.objects.filter(id=session.id, summary_through=session.summary_through).update(
+            summary=summary, summary_through=through
+        )
+        if updated:
+            session.summary, session.summary_through = summary, through
+        else:
+            session.refresh_from_db(fields=['summary', 'summary_through'])
+
+
+context_builder = ContextBuilder()
@@ -0,0 +1,13 @@
+# coder/exceptions.py
+
+
+class OllamaError(Exception):
+    pass
+
+
+class OllamaUnavailable(OllamaError):
+    """Raised without contacting Ollama when no backend is accepting traffic."""
+
+    def __init__(self, host, retry_after):
+        super().__init__(f"Ollama at {host} is unavailable, retry in {int(retry_after) + 1}s")
+        self.retry_after = retry_after
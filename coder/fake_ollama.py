@@ -0,0 +1,258 @@
+# coder/fake_ollama.py
+"""A tiny stand-in for the Ollama HTTP API used by the benchmark commands.
+
+It answers ``/api/chat`` (streaming and non-streaming) with a canned coding
+answer and ``/api/embed`` with feature-hashed vectors, sleeping to imitate time-to-first-token and a fixed decode rate, so
+the web stack can be measured without a GPU. With ``error_rate`` a share of
+chats fails with a 503, as an overloaded Ollama would; ``seed`` makes which
+ones repeatable.
+
+With ``prefill_tokens_per_second`` the prompt costs time too, except for the
+part that repeats one of the last ``slots`` conversations (prompt and
+answer), which Ollama would still have in its KV cache.
+
+Of ``models`` only ``loaded`` (all by default) start out in memory, and
+``/api/ps`` lists those. The first chat on any other model, or an empty
+``/api/generate`` for it, waits ``load_time`` to load it first.
+"""
+import json
+import math
+import os
+import random
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .semantic_cache import HashingEmbedder
+
+CANNED_RESPONSE = (
+    "Sure! Here's a clean implementation:\n\n"
+    "```python\n"
+    "def reverse_list(head):\n"
+    "    prev = None\n"
+    "    while head:\n"
+    "        head.next, prev, head = prev, head, head.next\n"
+    "    return prev\n"
+    "```\n\n"
+    "It walks the list once, flipping each `next` pointer, so it runs in O(n) time and O(1) space. "
+)
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # Benchmarks open hundreds of connections at once; the stdlib default of 5
+    # would reset most of them before they are accepted.
+    request_queue_size = 1024
+
+
+class FakeOllamaServer:
+    def __init__(self, host="127.0.0.1", port=0, ttft=0.05, tokens_per_second=200.0, tokens=60,
+                 models=("fake:latest",), error_rate=0.0, seed=None, prefill_tokens_per_second=0.0, slots=4,
+                 loaded=None, load_time=0.0):
+        self.ttft = ttft
+        self.prefill_tokens_per_second = prefill_tokens_per_second
+        self.cached = deque(maxlen=slots)
+        # Prompt tokens each chat had to evaluate, after the cached prefix.
+        self.prefilled = []
+        self.error_rate = error_rate
+        self.errors = 0
+        self._random = random.Random(seed)
+        self.models = list(models)
+        self.loaded = set(self.models if loaded is None else loaded)
+        self.load_time = load_time
+        self.loads = 0
+        self.tokens_per_second = tokens_per_second
+        self.tokens = tokens
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._httpd = _Server((host, port), self._handler_class())
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def should_fail(self):
+        if not self.error_rate:
+            return False
+        with self._lock:
+            failed = self._random.random() < self.error_rate
+            self.errors += failed
+        return failed
+
+    def prefill(self, messages):
+        """Estimated prompt tokens not covered by a cached conversation."""
+        rendered = [f"{m.get('role')}\0{m.get('content', '')}\0" for m in messages]
+        total = sum(map(len, rendered))
+        with self._lock:
+            reused = 0
+            for cached in self.cached:
+                common = 0
+                for ours, theirs in zip(rendered, cached):
+                    if ours != theirs:
+                        common += len(os.path.commonprefix([ours, theirs]))
+                        break
+                    common += len(ours)
+                reused = max(reused, common)
+            tokens = (total - reused) // 4
+            self.prefilled.append(tokens)
+        return tokens
+
+    def remember(self, messages, answer):
+        with self._lock:
+            self.cached.append([
+                f"{m.get('role')}\0{m.get('content', '')}\0" for m in [*messages, {"role": "assistant", "content": answer}]
+            ])
+
+    def ensure_loaded(self, model):
+        with self._lock:
+            if model in self.loaded:
+                return
+            self.loads += 1
+        time.sleep(self.load_time)
+        with self._lock:
+            self.loaded.add(model)
+
+    def response_tokens(self):
+        words = CANNED_RESPONSE.split(" ")
+        while len(words) < self.tokens:
+            words += words
+        return [word + " " for word in words[:self.tokens]]
+
+    def _handler_class(self):
+        server = self
+        embedder = HashingEmbedder()
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                if self.path == "/api/version":
+                    return self._send_json({"version": "0.0.0-fake"})
+                if self.path in ("/api/ps", "/api/tags"):
+                    with server._lock:
+                        names = sorted(server.loaded) if self.path == "/api/ps" else server.models
+                    return self._send_json({"models": [
+                        {"name": name, "model": name, "size": 0, "digest": "fake"} for name in names
+                    ]})
+                self._send_json({"error": "not found"}, status=404)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length) or b"{}")
+                with server._lock:
+                    server.requests += 1
+                if self.path == "/api/chat":
+                    return self._chat(body)
+                if self.path == "/api/embed":
+                    return self._embed(body)
+                if self.path == "/api/generate":
+                    return self._generate(body)
+                self._send_json({"error": "not found"}, status=404)
+
+            def _embed(self, body):
+                texts = body.get("input", "")
+                if isinstance(texts, str):
+                    texts = [texts]
+                self._send_json({
+                    "model": body.get("model", "fake"),
+                    "embeddings": [embedder.embed(text).tolist() for text in texts],
+                })
+
+            def _generate(self, body):
+                # Only the empty prompt Ollama treats as "load the model".
+                model = body.get("model", "fake")
+                started = time.monotonic()
+                server.ensure_loaded(model)
+                self._send_json({
+                    "model": model,
+                    "created_at": datetime.now(timezone.utc).isoformat(),
+                    "response": "",
+                    "done": True,
+                    "done_reason": "load",
+                    "load_duration": int((time.monotonic() - started) * 1e9),
+                })
+
+            def _chat(self, body):
+                model = body.get("model", "fake")
+                if server.should_fail():
+                    return self._send_json({"error": "server busy, please try again"}, status=503)
+                server.ensure_loaded(model)
+                tokens = server.response_tokens()
+                delay = 1.0 / server.tokens_per_second if server.tokens_per_second else 0
+                messages = body.get("messages", [])
+                prompt_tokens = server.prefill(messages)
+                prefill = prompt_tokens / server.prefill_tokens_per_second if server.prefill_tokens_per_second else 0
+                started = time.monotonic()
+                time.sleep(server.ttft + prefill)
+                server.remember(messages, "".join(tokens))
+
+                if body.get("stream", True) is False:
+                    time.sleep(delay * len(tokens))
+                    return self._send_json(self._part(model, "".join(tokens), True, prompt_tokens, len(tokens), started))
+
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for token in tokens:
+                    self._write_chunk(self._part(model, token, False))
+                    time.sleep(delay)
+                self._write_chunk(self._part(model, "", True, prompt_tokens, len(tokens), started))
+                self.wfile.write(b"0\r\n\r\n")
+
+            def _part(self, model, content, done, prompt_tokens=None, eval_count=None, started=None):
+                part = {
+                    "model": model,
+                    "created_at": datetime.now(timezone.utc).isoformat(),
+                    "message": {"role": "assistant", "content": content},
+                    "done": done,
+                }
+                if done:
+                    elapsed = int((time.monotonic() - started) * 1e9)
+                    prefill_ns = int((server.ttft + prompt_tokens / (server.prefill_tokens_per_second or math.inf)) * 1e9)
+                    part.update({
+                        "done_reason": "stop",
+                        "total_duration": elapsed,
+                        "prompt_eval_count": prompt_tokens,
+                        "prompt_eval_duration": prefill_ns,
+                        "eval_count": eval_count,
+                        "eval_duration": max(elapsed - prefill_ns, 0),
+                    })
+                return part
+
+            def _write_chunk(self, part):
+                data = json.dumps(part).encode() + b"\n"
+                self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                self.wfile.flush()
+
+            def _send_json(self, payload, status=200):
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        return Handler
@@ -0,0 +1,26 @@
+# coder/fields.py
+from django.db import models
+
+from .compression import codec
+
+
+class CompressedTextField(models.TextField):
+    """Text kept compressed in a binary column; reads and writes plain ``str``.
+
+    Forms and serializers see an ordinary text field. The column can't be
+    searched with ``LIKE``. Plain text found in it is read back as it is.
+    """
+
+    def get_internal_type(self):
+        return "BinaryField"
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        value = super().get_db_prep_value(value, connection, prepared)
+        if value is None:
+            return None
+        return connection.Database.Binary(codec.compress(value))
+
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return value
+        return codec.decompress(value)
@@ -0,0 +1,174 @@
+# coder/formatting.py
+"""Run black in a pool of warm worker processes.
+
+Each worker imports black once and then formats whatever it is sent over its
+pipe, so requests neither pay the import nor hold the GIL while black runs.
+A job that exceeds ``FORMAT_TIMEOUT`` gets its worker killed and replaced.
+Results, including parse errors, are cached by content hash.
+"""
+import hashlib
+import importlib.util
+import multiprocessing
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from .metrics import FORMAT_TIME
+from .settings import FORMAT_CACHE_SIZE, FORMAT_TIMEOUT, FORMAT_WORKERS
+
+
+class FormattingError(Exception):
+    pass
+
+
+class FormattingTimeout(FormattingError):
+    pass
+
+
+def _serve(conn):
+    import black
+    mode = black.Mode()
+    conn.send((True, black.__version__))
+    while True:
+        try:
+            code = conn.recv()
+        except EOFError:
+            return
+        try:
+            conn.send((True, black.format_str(code, mode=mode)))
+        except Exception as e:
+            conn.send((False, str(e)))
+
+
+class _Worker:
+    def __init__(self, context):
+        self.conn, child = context.Pipe()
+        self.process = context.Process(target=_serve, args=(child,), name="black-worker", daemon=True)
+        self.process.start()
+        child.close()
+        self.ready = False
+
+    def run(self, code, timeout):
+        if not self.ready:
+            # The first message is black's version, sent once the import is done.
+            self._receive(timeout + FORMAT_TIMEOUT * 10)
+            self.ready = True
+        self.conn.send(code)
+        return self._receive(timeout)
+
+    def _receive(self, timeout):
+        if not self.conn.poll(timeout):
+            raise FormattingTimeout(f"Formatting took longer than {timeout}s")
+        ok, result = self.conn.recv()
+        if not ok:
+            raise FormattingError(result)
+        return result
+
+    def kill(self):
+        self.process.kill()
+        self.conn.close()
+
+
+class Formatter:
+    def __init__(self, workers=FORMAT_WORKERS, timeout=FORMAT_TIMEOUT, cache_size=FORMAT_CACHE_SIZE):
+        self.workers = workers
+        self.timeout = timeout
+        self.cache_size = cache_size
+        self.available = importlib.util.find_spec("black") is not None
+        self.cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._idle = None
+        self._dispatch = None
+        self._lock = threading.Lock()
+        # spawn rather than fork: gunicorn and uvicorn workers have threads running.
+        self._context = multiprocessing.get_context("spawn")
+
+    def start(self):
+        """Start the workers now instead of on the first request."""
+        with self._lock:
+            if self._idle is None:
+                self._idle = queue.LifoQueue()
+                for _ in range(self.workers):
+                    self._idle.put(_Worker(self._context))
+                self._dispatch = ThreadPoolExecutor(self.workers, thread_name_prefix="black-dispatch")
+
+    def format(self, code):
+        """Return ``code`` formatted by black; raises ``FormattingError``."""
+        if not self.available:
+            raise FormattingError("black is not installed")
+        key = hashlib.sha256(code.encode()).hexdigest()
+        with self._lock:
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                self.hits += 1
+                ok, result = self.cache[key]
+                if ok:
+                    return result
+                raise FormattingError(result)
+            self.misses += 1
+        started = time.monotonic()
+        try:
+            result = self._run(code)
+        except FormattingTimeout:
+            FORMAT_TIME.observe(time.monotonic() - started, result="timeout")
+            raise
+        except FormattingError as e:
+            FORMAT_TIME.observe(time.monotonic() - started, result="error")
+            # Unparseable input stays unparseable; remember that too.
+            self._remember(key, False, str(e))
+            raise
+        FORMAT_TIME.observe(time.monotonic() - started, result="formatted")
+        self._remember(key, True, result)
+        return result
+
+    def format_many(self, codes):
+        """Format several snippets in parallel.
+
+        Returns one ``(formatted, error)`` pair per input, with ``formatted``
+        ``None`` when that snippet failed.
+        """
+        self.start()
+        return list(self._dispatch.map(self._format_quietly, codes))
+
+    def stats(self):
+        return {
+            "available": self.available,
+            "workers": self.workers,
+            "cached": len(self.cache),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    def _format_quietly(self, code):
+        try:
+            return self.format(code), None
+        except FormattingError as e:
+            return None, str(e)
+
+    def _run(self, code):
+        self.start()
+        worker = self._idle.get()
+        try:
+            return worker.run(code, self.timeout)
+        except (FormattingTimeout, OSError, EOFError) as e:
+            # The worker may still be chewing on the input; replace it.
+            worker.kill()
+            worker = _Worker(self._context)
+            if isinstance(e, FormattingTimeout):
+                raise
+            raise FormattingError(f"Formatter worker failed: {e}")
+        finally:
+            self._idle.put(worker)
+
+    def _remember(self, key, ok, result):
+        with self._lock:
+            self.cache[key] = (ok, result)
+            self.cache.move_to_end(key)
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+
+
+formatter = Formatter()
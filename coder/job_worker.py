@@ -0,0 +1,126 @@
+# coder/job_worker.py
+"""The loop each ``run_generation_workers`` process runs, see ``coder/jobs.py``."""
+import contextvars
+import logging
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+from . import jobs, tracing
+from .exceptions import OllamaUnavailable
+from .metrics import registry
+from .models import GenerationJob
+from .services import is_transient
+from .settings import GENERATION_JOB_LEASE_SECONDS, GENERATION_JOB_POLL_SECONDS
+from .views import CodeInteractionMixin
+
+logger = logging.getLogger(__name__)
+
+
+class JobGeneration(CodeInteractionMixin):
+    """Runs a job through the same prompt, cache and post-processing steps as the interaction views."""
+
+    def __init__(self, job, worker):
+        self.job = job
+        self.worker = worker
+
+    def run(self):
+        # Raises JobLost straight away if the job was cancelled since it was claimed.
+        jobs.heartbeat(self.job, self.worker)
+        interaction = self.job.interaction
+        session = interaction.session
+        generation = self.prepare_generation(
+            session, interaction.prompt, interaction.language, self.job.options.get('think_mode', False),
+            self.job.options, self.build_context(session),
+        )
+        payload = self.cached_payload(generation)
+        if payload is None:
+            payload = self.postprocess(self.stream(generation), generation.language)
+        self.finish_generation(generation, payload)
+        jobs.finish(self.job, GenerationJob.DONE)
+
+    def stream(self, generation):
+        """Generate the response, saving progress and renewing the lease as it goes.
+
+        Tokens are read on a helper thread, so the lease is renewed on time
+        even while Ollama loads the model or prefills before the first token.
+        """
+        chunks = []
+        interval = min(GENERATION_JOB_POLL_SECONDS, GENERATION_JOB_LEASE_SECONDS / 3)
+        beat = time.monotonic()
+        tokens = self.service_class().stream(**generation.kwargs)
+        # The reader's spans belong to this job's trace.
+        context = contextvars.copy_context()
+        reader = ThreadPoolExecutor(max_workers=1, thread_name_prefix="job-stream")
+        pending = None
+        try:
+            while True:
+                pending = reader.submit(context.run, next, tokens, None)
+                while True:
+                    try:
+                        token = pending.result(timeout=max(beat + interval - time.monotonic(), 0))
+                        break
+                    except TimeoutError:
+                        jobs.heartbeat(self.job, self.worker, ''.join(chunks) if chunks else None)
+                        beat = time.monotonic()
+                if token is None:
+                    return ''.join(chunks)
+                chunks.append(token)
+        finally:
+            reader.shutdown(wait=False)
+            # Stops the Ollama request too when the job was cancelled; a read
+            # still in progress closes the stream once it returns.
+            if pending is not None and not pending.done():
+                pending.add_done_callback(lambda _: tokens.close())
+            else:
+                tokens.close()
+
+    def save_interaction(self, session, prompt, ai_response, formatted_code, language):
+        # Fill in the interaction enqueue() created; finish() marks it done.
+        interaction = self.job.interaction
+        interaction.response = ai_response
+        interaction.code_snippet = formatted_code[0]['code'] if formatted_code else ''
+        interaction.save(update_fields=['response', 'code_snippet'])
+        return interaction
+
+
+def run_job(job, worker):
+    trace = tracing.start(job.options.get('request_id'), f"job {job.id}")
+    try:
+        JobGeneration(job, worker).run()
+    except jobs.JobLost:
+        job.refresh_from_db(fields=['status', 'cancel_requested', 'worker'])
+        if job.cancel_requested and job.status == GenerationJob.RUNNING and job.worker == worker:
+            jobs.finish(job, GenerationJob.CANCELLED)
+    except Exception as e:
+        # OllamaError keeps the upstream error as its cause.
+        if isinstance(e, OllamaUnavailable) or is_transient(e.__cause__ or e):
+            jobs.retry(job, str(e))
+        else:
+            logger.exception("Generation job %s failed", job.id)
+            jobs.finish(job, GenerationJob.FAILED, str(e))
+    finally:
+        trace.finish(job=job.id, attempt=job.attempts)
+        registry.maybe_flush()
+
+
+def worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def work(stop=None):
+    """Run jobs until ``stop`` (a ``threading.Event``-like object) is set."""
+    stop = stop or threading.Event()
+    name = worker_name()
+    reaped = 0.0
+    while not stop.is_set():
+        if time.monotonic() - reaped >= GENERATION_JOB_LEASE_SECONDS / 2:
+            jobs.reap()
+            reaped = time.monotonic()
+        job = jobs.claim(name)
+        if job is None:
+            stop.wait(GENERATION_JOB_POLL_SECONDS)
+            continue
+        run_job(job, name)
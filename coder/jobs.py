@@ -0,0 +1,143 @@
+# coder/jobs.py
+"""A database-backed queue for generations that outlive their request.
+
+``enqueue`` stores a pending ``CodeInteraction`` and a ``GenerationJob`` and
+returns at once. Workers (``run_generation_workers``) ``claim`` jobs, highest
+priority first, with a conditional UPDATE, so any number of processes can
+poll the same table without locking it. A claimed job holds a lease the
+worker keeps renewing; if the worker dies, ``reap`` hands the job to another
+one, up to ``GENERATION_JOB_MAX_ATTEMPTS`` tries.
+"""
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import search
+from .models import CodeInteraction, GenerationJob
+from .settings import GENERATION_JOB_LEASE_SECONDS, GENERATION_JOB_MAX_ATTEMPTS, GENERATION_JOB_RETRY_SECONDS
+
+# Interaction status for each way a job can end.
+INTERACTION_STATUS = {
+    GenerationJob.DONE: CodeInteraction.DONE,
+    GenerationJob.FAILED: CodeInteraction.FAILED,
+    GenerationJob.CANCELLED: CodeInteraction.CANCELLED,
+}
+
+
+class JobLost(Exception):
+    """The worker's lease ran out and the job went to another worker, or it was cancelled."""
+
+
+def lease_deadline():
+    return timezone.now() + timedelta(seconds=GENERATION_JOB_LEASE_SECONDS)
+
+
+def enqueue(session, prompt, language, options=None, priority=0, idempotency_key=None):
+    """Queue a generation; returns ``(job, created)``.
+
+    With an ``idempotency_key`` the user already used, the existing job is
+    returned instead, whatever state it is in.
+    """
+    if idempotency_key:
+        existing = GenerationJob.objects.filter(user_id=session.user_id, idempotency_key=idempotency_key).first()
+        if existing:
+            return existing, False
+    try:
+        with transaction.atomic():
+            interaction = CodeInteraction.objects.create(
+                session=session, prompt=prompt, response='', language=language, status=CodeInteraction.PENDING
+            )
+            job = GenerationJob.objects.create(
+                user_id=session.user_id, interaction=interaction, priority=priority,
+                options=options or {}, idempotency_key=idempotency_key or None,
+            )
+    except IntegrityError:
+        # The same key raced us in another request.
+        if not idempotency_key:
+            raise
+        return GenerationJob.objects.get(user_id=session.user_id, idempotency_key=idempotency_key), False
+    return job, True
+
+
+def claim(worker):
+    """Mark the next runnable job as running for ``worker`` and return it, or ``None``."""
+    now = timezone.now()
+    candidates = GenerationJob.objects.filter(
+        status=GenerationJob.QUEUED, available_at__lte=now
+    ).order_by('-priority', 'id').values_list('id', flat=True)[:5]
+    for job_id in candidates:
+        # Another worker may get there first; then try the next one.
+        claimed = GenerationJob.objects.filter(id=job_id, status=GenerationJob.QUEUED).update(
+            status=GenerationJob.RUNNING, worker=worker, attempts=F('attempts') + 1,
+            started_at=now, lease_expires_at=lease_deadline(),
+        )
+        if claimed:
+            return GenerationJob.objects.select_related('interaction__session').get(id=job_id)
+    return None
+
+
+def heartbeat(job, worker, partial=None):
+    """Renew ``job``'s lease and save the text generated so far.
+
+    Raises ``JobLost`` if the job is no longer ``worker``'s to run.
+    """
+    renewed = GenerationJob.objects.filter(
+        id=job.id, worker=worker, status=GenerationJob.RUNNING, cancel_requested=False
+    ).update(lease_expires_at=lease_deadline())
+    if not renewed:
+        raise JobLost(f"Job {job.id} was cancelled or taken over")
+    if partial is not None:
+        CodeInteraction.objects.filter(id=job.interaction_id).update(response=partial)
+
+
+def finish(job, status, error=''):
+    """End ``job`` in ``status``; the interaction follows, keeping what was generated."""
+    with transaction.atomic():
+        GenerationJob.objects.filter(id=job.id).update(
+            status=status, error=error, finished_at=timezone.now(), lease_expires_at=None
+        )
+        CodeInteraction.objects.filter(id=job.interaction_id).update(status=INTERACTION_STATUS[status])
+    job.status, job.error = status, error
+    if status == GenerationJob.DONE:
+        # Skipped while the job ran; only the finished answer is searchable.
+        search.index_interaction(CodeInteraction.objects.select_related('session').get(id=job.interaction_id))
+
+
+def retry(job, error):
+    """Queue ``job`` again after a transient failure, or fail it if it is out of attempts."""
+    if job.attempts >= GENERATION_JOB_MAX_ATTEMPTS:
+        finish(job, GenerationJob.FAILED, error)
+        return
+    GenerationJob.objects.filter(id=job.id, status=GenerationJob.RUNNING).update(
+        status=GenerationJob.QUEUED, worker='', error=error, lease_expires_at=None,
+        available_at=timezone.now() + timedelta(seconds=GENERATION_JOB_RETRY_SECONDS * job.attempts),
+    )
+
+
+def cancel(job):
+    """Cancel a queued job now, or ask the worker running it to stop."""
+    if GenerationJob.objects.filter(id=job.id, status=GenerationJob.QUEUED).update(
+        status=GenerationJob.CANCELLED, finished_at=timezone.now()
+    ):
+        CodeInteraction.objects.filter(id=job.interaction_id).update(status=CodeInteraction.CANCELLED)
+    else:
+        GenerationJob.objects.filter(id=job.id, status=GenerationJob.RUNNING).update(cancel_requested=True)
+    job.refresh_from_db()
+    return job
+
+
+def reap():
+    """Requeue running jobs whose worker stopped renewing the lease; fail those out of attempts."""
+    now = timezone.now()
+    expired = GenerationJob.objects.filter(status=GenerationJob.RUNNING, lease_expires_at__lt=now)
+    requeued = expired.filter(attempts__lt=GENERATION_JOB_MAX_ATTEMPTS, cancel_requested=False).update(
+        status=GenerationJob.QUEUED, worker='', lease_expires_at=None, available_at=now
+    )
+    for job in expired.only('id', 'interaction_id', 'cancel_requested'):
+        if job.cancel_requested:
+            finish(job, GenerationJob.CANCELLED)
+        else:
+            finish(job, GenerationJob.FAILED, "The worker running this job stopped responding")
+    return requeued
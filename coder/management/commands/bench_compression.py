@@ -0,0 +1,75 @@
+# coder/management/commands/bench_compression.py
+import json
+import time
+
+from django.core.management.base import BaseCommand
+
+from coder.compression import Codec, train_dictionary, zstandard
+from coder.management.commands.bench_snippets import synthetic_response
+from coder.models import CodeInteraction
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure how much CompressedTextField shrinks interaction text and what "
+        "it costs per read and write, for each codec with and without a "
+        "shared dictionary."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--samples", type=int, default=1000)
+        parser.add_argument(
+            "--from-db", action="store_true",
+            help="Use the newest stored interactions instead of synthetic responses.",
+        )
+        parser.add_argument("--json", action="store_true", help="Print machine-readable results.")
+
+    def handle(self, *args, **options):
+        if options["from_db"]:
+            texts = []
+            rows = CodeInteraction.objects.only('prompt', 'response').order_by('-id')[:options["samples"]]
+            for interaction in rows.iterator(chunk_size=200):
+                texts += [interaction.prompt, interaction.response]
+        else:
+            texts = []
+            for seed in range(options["samples"]):
+                texts += [f"How do I write step {seed} of the parser?", synthetic_response(500 + seed * 37 % 12000, seed)]
+        # Train on half the interactions and measure on the other half, as a
+        # dictionary never sees the rows it is later used for.
+        half = len(texts) // 4 * 2
+        training, texts = texts[:half], texts[half:]
+        raw = sum(len(text.encode("utf-8")) for text in texts)
+
+        codecs = {"zlib": Codec("zlib", use_dictionary=False)}
+        codecs["zlib+dict"] = Codec("zlib", dictionary=(0, train_dictionary("zlib", training, 32 * 1024)))
+        if zstandard is not None:
+            codecs["zstd"] = Codec("zstd", use_dictionary=False)
+            codecs["zstd+dict"] = Codec("zstd", dictionary=(0, train_dictionary("zstd", training, 64 * 1024)))
+
+        results = {"texts": len(texts), "bytes": raw}
+        for name, codec in codecs.items():
+            started = time.perf_counter()
+            stored = [codec.compress(text) for text in texts]
+            write = time.perf_counter() - started
+            started = time.perf_counter()
+            for value in stored:
+                codec.decompress(value)
+            read = time.perf_counter() - started
+            size = sum(len(value) for value in stored)
+            results[name] = {
+                "bytes": size,
+                "ratio": round(raw / size, 2),
+                "write_us": round(write / len(texts) * 1e6, 1),
+                "read_us": round(read / len(texts) * 1e6, 1),
+            }
+
+        if options["json"]:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        self.stdout.write(f"{results['texts']} texts, {raw} bytes uncompressed:")
+        for name in codecs:
+            row = results[name]
+            self.stdout.write(
+                f"  {name:<10} {row['bytes']:>10} bytes  {row['ratio']:>5}x  "
+                f"write {row['write_us']:>7} us  read {row['read_us']:>7} us"
+            )
@@ -0,0 +1,109 @@
+# coder/management/commands/bench_concurrency.py
+import asyncio
+import json
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from coder.fake_ollama import FakeOllamaServer
+from coder.services import OllamaService, AsyncOllamaService
+
+SYSTEM_PROMPT = "You are a helpful coding assistant."
+PROMPT = "User: reverse a linked list in python"
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare concurrent-request throughput of the sync and async Ollama "
+        "services against a local fake Ollama server."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=200, help="Total generations per mode.")
+        parser.add_argument("--concurrency", type=int, default=100, help="Clients submitting at once.")
+        parser.add_argument(
+            "--sync-workers", type=int, default=3,
+            help="Generations the sync mode can run at once (gunicorn sync workers).",
+        )
+        parser.add_argument("--ttft", type=float, default=0.2, help="Fake time-to-first-token in seconds.")
+        parser.add_argument("--tokens-per-second", type=float, default=200.0)
+        parser.add_argument("--tokens", type=int, default=60, help="Tokens per fake response.")
+        parser.add_argument("--json", action="store_true", help="Print machine-readable results.")
+
+    def handle(self, *args, **options):
+        fake = FakeOllamaServer(
+            ttft=options["ttft"],
+            tokens_per_second=options["tokens_per_second"],
+            tokens=options["tokens"],
+        )
+        with fake:
+            results = {
+                "sync": self.run_sync(fake.url, options),
+                "async": asyncio.run(self.run_async(fake.url, options)),
+            }
+        results["speedup"] = round(results["async"]["throughput"] / results["sync"]["throughput"], 2)
+
+        if options["json"]:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        for mode in ("sync", "async"):
+            r = results[mode]
+            self.stdout.write(
+                f"{mode:>5}: {r['throughput']:8.1f} req/s  "
+                f"p50 {r['p50_ms']:8.1f} ms  p95 {r['p95_ms']:8.1f} ms  errors {r['errors']}"
+            )
+        self.stdout.write(self.style.SUCCESS(f"async/sync throughput: {results['speedup']}x"))
+
+    def run_sync(self, host, options):
+        service = OllamaService(host=host)
+        workers = threading.BoundedSemaphore(options["sync_workers"])
+
+        def one():
+            started = time.perf_counter()
+            with workers:
+                service.generate(PROMPT, "fake", SYSTEM_PROMPT, {})
+            return time.perf_counter() - started
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options["concurrency"]) as pool:
+            futures = [pool.submit(one) for _ in range(options["requests"])]
+            latencies, errors = self._collect(f.result for f in futures)
+        return self._summary(latencies, errors, time.perf_counter() - started)
+
+    async def run_async(self, host, options):
+        service = AsyncOllamaService(host=host)
+        clients = asyncio.Semaphore(options["concurrency"])
+
+        async def one():
+            started = time.perf_counter()
+            async with clients:
+                await service.generate(PROMPT, "fake", SYSTEM_PROMPT, {})
+            return time.perf_counter() - started
+
+        started = time.perf_counter()
+        outcomes = await asyncio.gather(*(one() for _ in range(options["requests"])), return_exceptions=True)
+        latencies = [o for o in outcomes if not isinstance(o, BaseException)]
+        return self._summary(latencies, len(outcomes) - len(latencies), time.perf_counter() - started)
+
+    def _collect(self, results):
+        latencies, errors = [], 0
+        for result in results:
+            try:
+                latencies.append(result())
+            except Exception:
+                errors += 1
+        return latencies, errors
+
+    def _summary(self, latencies, errors, elapsed):
+        latencies = sorted(latencies) or [0.0]
+        return {
+            "requests": len(latencies) + errors,
+            "errors": errors,
+            "elapsed_s": round(elapsed, 3),
+            "throughput": round(len(latencies) / elapsed, 2),
+            "p50_ms": round(statistics.median(latencies) * 1000, 1),
+            "p95_ms": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000, 1),
+        }
@@ -0,0 +1,55 @@
+# coder/management/commands/bench_sandbox.py
+import json
+import subprocess
+import sys
+import time
+
+from django.core.management.base import BaseCommand
+
+from coder.sandbox import Sandbox
+
+SNIPPET = "import json, collections\nprint(json.dumps(collections.Counter('sandbox')))\n"
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare per-run latency of the forked sandbox against starting a "
+        "fresh interpreter with subprocess.run for every snippet."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--runs", type=int, default=50)
+        parser.add_argument("--json", action="store_true", help="Print machine-readable results.")
+
+    def handle(self, *args, **options):
+        runs = options["runs"]
+        sandbox = Sandbox()
+        # Start the template process outside the measurement.
+        sandbox.run({"kind": "python", "code": "pass"})
+
+        def measure(run):
+            latencies = []
+            for _ in range(runs):
+                started = time.perf_counter()
+                run()
+                latencies.append(time.perf_counter() - started)
+            latencies.sort()
+            return {
+                "p50_ms": round(latencies[len(latencies) // 2] * 1000, 2),
+                "p99_ms": round(latencies[int(len(latencies) * 0.99)] * 1000, 2),
+            }
+
+        results = {
+            "runs": runs,
+            "subprocess": measure(lambda: subprocess.run(
+                [sys.executable, "-c", SNIPPET], capture_output=True, text=True, timeout=5
+            )),
+            "sandbox": measure(lambda: sandbox.run({"kind": "python", "code": SNIPPET})),
+        }
+        if options["json"]:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        for name in ("subprocess", "sandbox"):
+            self.stdout.write(
+                f"{name:<11} p50 {results[name]['p50_ms']} ms  p99 {results[name]['p99_ms']} ms"
+            )
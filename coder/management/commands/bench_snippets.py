@@ -0,0 +1,80 @@
+# coder/management/commands/bench_snippets.py
+import json
+import random
+import re
+import time
+
+from django.core.management.base import BaseCommand
+
+from coder.snippets import SnippetStream, extract_snippets
+
+
+def regex_extract(response, language):
+    """The previous two-pass regex extraction, kept here as the baseline."""
+    pattern = r"```(?:{lang})?\s*([\s\S]*?)```".format(lang=re.escape(language))
+    matches = re.findall(pattern, response, re.IGNORECASE)
+    snippets = [{"language": language, "code": match.strip()} for match in matches]
+    inline_matches = re.findall(r"`([^`]+)`", response)
+    snippets.extend([{"language": "text", "code": match.strip()} for match in inline_matches])
+    return snippets
+
+
+def synthetic_response(size, seed=1):
+    """Markdown resembling a long model answer: prose, inline code and fenced blocks."""
+    rng = random.Random(seed)
+    words = "the function returns a list of values when called with an empty input so we".split()
+    languages = ["python", "javascript", "", "sql", "bash"]
+    parts = []
+    total = 0
+    while total < size:
+        if rng.random() < 0.4:
+            body = "\n".join(
+                f"    {'x' * rng.randint(1, 8)} = compute({rng.randint(0, 99)})  # step" for _ in range(rng.randint(3, 30))
+            )
+            part = f"```{rng.choice(languages)}\n{body}\n```\n"
+        else:
+            sentence = " ".join(rng.choice(words) for _ in range(rng.randint(8, 30)))
+            part = f"{sentence} `{rng.choice(words)}()` {sentence}.\n\n"
+        parts.append(part)
+        total += len(part)
+    return "".join(parts)
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the single-pass fence tokenizer with the old regex extraction "
+        "on large synthetic responses."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--size", type=int, default=200_000, help="Response length in characters.")
+        parser.add_argument("--repeat", type=int, default=20)
+        parser.add_argument("--json", action="store_true", help="Print machine-readable results.")
+
+    def handle(self, *args, **options):
+        text = synthetic_response(options["size"])
+
+        def streamed(text, language):
+            # Token-sized fragments, the way responses arrive from Ollama.
+            stream = SnippetStream(language)
+            snippets = []
+            for i in range(0, len(text), 16):
+                snippets += stream.feed(text[i:i + 16])
+            return snippets + stream.finish()
+
+        results = {"chars": len(text)}
+        for name, extract in (("regex", regex_extract), ("tokenizer", extract_snippets), ("tokenizer_streamed", streamed)):
+            timings = []
+            for _ in range(options["repeat"]):
+                started = time.perf_counter()
+                snippets = extract(text, "python")
+                timings.append(time.perf_counter() - started)
+            timings.sort()
+            results[name] = {"ms": round(timings[len(timings) // 2] * 1000, 2), "snippets": len(snippets)}
+
+        if options["json"]:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        self.stdout.write(f"{results['chars']} characters, median of {options['repeat']} runs:")
+        for name in ("regex", "tokenizer", "tokenizer_streamed"):
+            self.stdout.write(f"  {name:<19} {results[name]['ms']:>8} ms  {results[name]['snippets']} snippets")
@@ -0,0 +1,89 @@
+# coder/management/commands/compress_interactions.py
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from coder.compression import codec
+from coder.models import LEGACY_TEXT, CodeInteraction
+
+FIELDS = [CodeInteraction._meta.get_field(name) for name in LEGACY_TEXT]
+LEGACY_FIELDS = [CodeInteraction._meta.get_field(name) for name in LEGACY_TEXT.values()]
+
+
+class Command(BaseCommand):
+    help = (
+        "Move interaction text written before migration 0005 into the compressed "
+        "columns, emptying the plain ones. Walks the table in primary-key order, "
+        "one short transaction per batch, so only the rows of the current batch "
+        "are ever locked. Safe to stop and resume with --start-id."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument("--sleep", type=float, default=0.05, help="Pause between batches, in seconds.")
+        parser.add_argument("--start-id", type=int, default=0, help="Resume after this interaction id.")
+        parser.add_argument(
+            "--recompress", action="store_true",
+            help="Rewrite rows that are already compressed too, e.g. with a newly trained dictionary.",
+        )
+
+    def handle(self, *args, **options):
+        qn = connection.ops.quote_name
+        table = qn(CodeInteraction._meta.db_table)
+        pk = qn(CodeInteraction._meta.pk.column)
+        columns = [qn(field.column) for field in FIELDS]
+        legacy_columns = [qn(field.column) for field in LEGACY_FIELDS]
+        # Raw SQL, so stored bytes are seen as they are rather than decoded by the field.
+        select = (
+            f"SELECT {pk}, {', '.join(columns + legacy_columns)} FROM {table} "
+            f"WHERE {pk} > %s ORDER BY {pk} LIMIT %s"
+        )
+        if connection.features.has_select_for_update:
+            # Jobs write responses while they run; don't overwrite one with a stale copy.
+            select += " FOR UPDATE"
+        assignments = [f"{column} = %s" for column in columns] + [f"{column} = ''" for column in legacy_columns]
+        update = f"UPDATE {table} SET {', '.join(assignments)} WHERE {pk} = %s"
+
+        last = options["start_id"]
+        scanned = converted = before = after = 0
+        while True:
+            with transaction.atomic():
+                with connection.cursor() as cursor:
+                    cursor.execute(select, [last, options["batch_size"]])
+                    rows = cursor.fetchall()
+                    if not rows:
+                        break
+                    changes = []
+                    for row_id, *values in rows:
+                        compressed, legacy = values[:len(FIELDS)], values[len(FIELDS):]
+                        if not options["recompress"] and None not in compressed:
+                            continue
+                        texts = [
+                            codec.decompress(value) if value is not None else plain or ""
+                            for value, plain in zip(compressed, legacy)
+                        ]
+                        packed = [codec.compress(text) for text in texts]
+                        before += sum(len(text.encode("utf-8")) for text in texts)
+                        after += sum(len(value) for value in packed)
+                        changes.append([*(connection.Database.Binary(value) for value in packed), row_id])
+                    if changes:
+                        cursor.executemany(update, changes)
+            scanned += len(rows)
+            converted += len(changes)
+            last = rows[-1][0]
+            self.stdout.write(f"Up to id {last}: {converted} of {scanned} rows rewritten")
+            if options["sleep"]:
+                time.sleep(options["sleep"])
+
+        if converted:
+            self.stdout.write(self.style.SUCCESS(
+                f"Rewrote {converted} rows: {before} bytes of text now take {after} "
+                f"({before / max(after, 1):.1f}x smaller)."
+            ))
+            if connection.vendor == "mysql":
+                self.stdout.write(
+                    f"InnoDB keeps the freed pages; run OPTIMIZE TABLE {table} at a quiet time to shrink the file."
+                )
+        else:
+            self.stdout.write("Nothing to convert.")
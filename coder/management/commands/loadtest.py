@@ -0,0 +1,392 @@
+# coder/management/commands/loadtest.py
+import importlib.util
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+
+import httpx
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from authentication.models import Profile
+
+from coder.fake_ollama import CANNED_RESPONSE, FakeOllamaServer
+from coder.models import CodeInteraction, CodeSession
+
+USERNAME_PREFIX = "loadtest-"
+PASSWORD = "loadtest-password"
+DEFAULT_MIX = "create_interaction=3,list_sessions=4,retrieve_session=3,format_code=2,run_code=1,login=1"
+# Latency changes smaller than this are noise, whatever the percentage.
+MIN_REGRESSION_MS = 5.0
+# Requests an endpoint needs, in both runs, before its percentile is compared.
+MIN_SAMPLES = {"p50_ms": 10, "p95_ms": 40, "p99_ms": 200}
+
+# Repeats are intended: real users ask the same things, which is what the caches are for.
+PROMPTS = [
+    "Reverse a linked list in python",
+    "Write a function that checks whether a string is a palindrome",
+    "Parse a CSV file and sum the second column",
+    "Implement binary search over a sorted list",
+    "Explain the difference between a list and a tuple",
+    "Write a decorator that retries a function three times",
+    "Merge two sorted lists into one sorted list",
+    "Count word frequencies in a text file",
+    "Flatten a nested list of arbitrary depth",
+    "Write an LRU cache without functools",
+]
+UNFORMATTED = "def f(a,b):\n  x=[a,b ,a+b]\n  return {'sum':sum(x),'items':x}\n"
+SNIPPET = "import json\nprint(json.dumps(sorted({'b': 2, 'a': 1}.items())))\n"
+
+
+class VirtualUser:
+    """One simulated user: a logged-in HTTP client and its own session.
+
+    Each scenario method makes one request and returns its status code.
+    """
+
+    def __init__(self, base_url, username, rng, timeout):
+        self.client = httpx.Client(base_url=base_url, timeout=timeout)
+        self.username = username
+        self.rng = rng
+        self.session_id = None
+
+    def csrf(self):
+        return self.client.cookies.get("csrftoken", "")
+
+    def api(self, method, path, payload=None):
+        return self.client.request(method, path, json=payload, headers={"X-CSRFToken": self.csrf()}).status_code
+
+    def login(self):
+        self.client.cookies.clear()
+        self.client.get("/auth/login/")
+        response = self.client.post("/auth/login/", data={
+            "username": self.username, "password": PASSWORD, "csrfmiddlewaretoken": self.csrf(),
+        })
+        # A successful login redirects; a failed one re-renders the form with 200.
+        return 401 if response.status_code == 200 else response.status_code
+
+    def create_interaction(self):
+        return self.api("POST", "/coder/api/interactions/", {
+            "session_id": self.session_id, "prompt": self.rng.choice(PROMPTS), "language": "python",
+        })
+
+    def list_sessions(self):
+        return self.api("GET", "/coder/api/sessions/")
+
+    def retrieve_session(self):
+        return self.api("GET", f"/coder/api/sessions/{self.session_id}/")
+
+    def format_code(self):
+        return self.api("POST", "/coder/api/format_code/", {"code": UNFORMATTED, "language": "python"})
+
+    def run_code(self):
+        return self.api("POST", "/coder/api/run_code/", {"code": SNIPPET, "language": "python"})
+
+    def close(self):
+        self.client.close()
+
+
+class Results:
+    def __init__(self):
+        self.latencies = {}
+        self.errors = Counter()
+        self.statuses = {}
+        self.lock = threading.Lock()
+
+    def record(self, name, seconds, status):
+        with self.lock:
+            self.latencies.setdefault(name, []).append(seconds)
+            self.statuses.setdefault(name, Counter())[str(status)] += 1
+            if not isinstance(status, int) or status >= 400:
+                self.errors[name] += 1
+
+    def summary(self, elapsed):
+        endpoints = {name: summarize(latencies, self.errors[name], elapsed, self.statuses[name])
+                     for name, latencies in sorted(self.latencies.items())}
+        every = [seconds for latencies in self.latencies.values() for seconds in latencies]
+        return endpoints, summarize(every, sum(self.errors.values()), elapsed)
+
+
+def percentile(ordered, fraction):
+    return ordered[max(0, min(len(ordered) - 1, math.ceil(fraction * len(ordered)) - 1))]
+
+
+def summarize(latencies, errors, elapsed, statuses=None):
+    ordered = sorted(latencies) or [0.0]
+    summary = {
+        "requests": len(latencies),
+        "errors": errors,
+        "error_rate": round(errors / len(latencies), 4) if latencies else 0.0,
+        "throughput": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 1),
+        "p50_ms": round(percentile(ordered, 0.50) * 1000, 1),
+        "p95_ms": round(percentile(ordered, 0.95) * 1000, 1),
+        "p99_ms": round(percentile(ordered, 0.99) * 1000, 1),
+    }
+    if statuses is not None:
+        summary["statuses"] = dict(sorted(statuses.items()))
+    return summary
+
+
+def compare(report, baseline, tolerance):
+    """Describe each way ``report`` is worse than ``baseline`` by more than ``tolerance`` (a fraction)."""
+    regressions = []
+    for name, before in baseline["endpoints"].items():
+        after = report["endpoints"].get(name)
+        if after is None:
+            continue
+        samples = min(before["requests"], after["requests"])
+        for key, needed in MIN_SAMPLES.items():
+            if samples >= needed and after[key] > before[key] * (1 + tolerance) \
+                    and after[key] - before[key] > MIN_REGRESSION_MS:
+                regressions.append(f"{name} {key}: {before[key]} -> {after[key]}")
+        if samples >= MIN_SAMPLES["p50_ms"] and after["throughput"] < before["throughput"] * (1 - tolerance):
+            regressions.append(f"{name} throughput: {before['throughput']} -> {after['throughput']} req/s")
+        if after["error_rate"] > before["error_rate"] + 0.01:
+            regressions.append(f"{name} error_rate: {before['error_rate']} -> {after['error_rate']}")
+    return regressions
+
+
+def parse_mix(value):
+    mix = {}
+    for item in value.split(","):
+        name, _, weight = item.partition("=")
+        name = name.strip()
+        if not hasattr(VirtualUser, name) or name in ("api", "csrf", "close"):
+            raise CommandError(f"Unknown scenario {name!r}")
+        try:
+            mix[name] = float(weight or 1)
+        except ValueError:
+            raise CommandError(f"Bad weight for {name!r}: {weight!r}")
+    return {name: weight for name, weight in mix.items() if weight > 0}
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-test the real Django stack against a local fake Ollama server. "
+        "Starts the fake server and the app (gunicorn, or runserver), logs in "
+        "a set of simulated users and drives a weighted mix of requests. "
+        "Reports throughput and p50/p95/p99 latency per endpoint, and "
+        "compares them with a saved baseline."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--concurrency", type=int, default=10, help="Simulated users.")
+        parser.add_argument("--duration", type=float, default=30.0, help="Seconds to measure for.")
+        parser.add_argument("--warmup", type=float, default=5.0, help="Seconds run before measuring.")
+        parser.add_argument(
+            "--iterations", type=int,
+            help="Requests per user instead of --duration, for a fixed amount of work (no warm-up).",
+        )
+        parser.add_argument("--mix", default=DEFAULT_MIX, help="Scenario weights, e.g. 'list_sessions=4,login=1'.")
+        parser.add_argument("--seed", type=int, default=1, help="Seeds each user's scenario choices and prompts.")
+        parser.add_argument("--history", type=int, default=20, help="Interactions each user's session starts with.")
+        parser.add_argument("--ttft", type=float, default=0.2, help="Fake time-to-first-token in seconds.")
+        parser.add_argument("--tokens-per-second", type=float, default=50.0)
+        parser.add_argument("--tokens", type=int, default=60, help="Tokens per fake response.")
+        parser.add_argument("--error-rate", type=float, default=0.0, help="Share of fake Ollama chats that fail.")
+        parser.add_argument(
+            "--url",
+            help="Test an already running server instead of starting one. Start it with "
+                 "OLLAMA_HOST pointing at --ollama-port, and against the same database.",
+        )
+        parser.add_argument("--ollama-port", type=int, default=0)
+        parser.add_argument("--server", choices=["gunicorn", "runserver"], default="gunicorn")
+        parser.add_argument("--workers", type=int, default=4, help="gunicorn worker processes.")
+        parser.add_argument("--threads", type=int, default=4, help="Threads per gunicorn worker.")
+        parser.add_argument("--server-log", help="File for the server's output (discarded by default).")
+        parser.add_argument("--timeout", type=float, default=120.0, help="Per-request timeout in seconds.")
+        parser.add_argument("--output", help="Write the JSON report to this file (usable as a later --baseline).")
+        parser.add_argument("--baseline", help="Fail if this run is worse than the report in this file.")
+        parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed slowdown, as a fraction.")
+        parser.add_argument("--keep-data", action="store_true", help="Leave the load-test users and sessions.")
+        parser.add_argument("--json", action="store_true", help="Print machine-readable results.")
+
+    def handle(self, *args, **options):
+        mix = parse_mix(options["mix"])
+        if not mix:
+            raise CommandError("--mix selects no scenarios")
+        baseline = None
+        if options["baseline"]:
+            with open(options["baseline"]) as f:
+                baseline = json.load(f)
+
+        fake = FakeOllamaServer(
+            port=options["ollama_port"],
+            ttft=options["ttft"],
+            tokens_per_second=options["tokens_per_second"],
+            tokens=options["tokens"],
+            error_rate=options["error_rate"],
+            seed=options["seed"],
+        )
+        users = self.create_users(options)
+        server = None
+        try:
+            with fake:
+                if options["url"]:
+                    base_url = options["url"].rstrip("/")
+                else:
+                    server, base_url = self.start_server(fake.url, options)
+                results, elapsed = self.run(base_url, users, mix, options)
+                fake_requests, fake_errors = fake.requests, fake.errors
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait(timeout=30)
+            if not options["keep_data"]:
+                User.objects.filter(username__startswith=USERNAME_PREFIX).delete()
+
+        endpoints, total = results.summary(elapsed)
+        report = {
+            "config": {key: options[key] for key in (
+                "concurrency", "duration", "warmup", "iterations", "seed", "history", "ttft",
+                "tokens_per_second", "tokens", "error_rate", "server", "workers", "threads",
+            )},
+            "mix": mix,
+            "elapsed_s": round(elapsed, 3),
+            "total": total,
+            "endpoints": endpoints,
+            "ollama": {"requests": fake_requests, "injected_errors": fake_errors},
+        }
+        if options["url"]:
+            report["config"]["server"] = options["url"]
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(report, f, indent=2)
+        regressions = None
+        if baseline is not None:
+            if baseline.get("config") != report["config"]:
+                self.stderr.write("Warning: the baseline was recorded with different settings")
+            regressions = report["regressions"] = compare(report, baseline, options["tolerance"])
+
+        if options["json"]:
+            self.stdout.write(json.dumps(report, indent=2))
+        else:
+            self.print_report(report)
+        if regressions:
+            raise CommandError(f"{len(regressions)} regression(s) against {options['baseline']}")
+
+    def create_users(self, options):
+        """Fresh users, each with an active session and some history."""
+        User.objects.filter(username__startswith=USERNAME_PREFIX).delete()
+        # Hashing once keeps setup fast; logins still pay the full hasher cost.
+        password = make_password(PASSWORD)
+        User.objects.bulk_create([
+            User(username=f"{USERNAME_PREFIX}{i}", password=password) for i in range(options["concurrency"])
+        ])
+        users = list(User.objects.filter(username__startswith=USERNAME_PREFIX).order_by("id"))
+        # bulk_create skips the signal that gives every user a profile.
+        Profile.objects.bulk_create([Profile(user=user) for user in users])
+        CodeSession.objects.bulk_create([
+            CodeSession(user=user, title="Load test", is_active=True) for user in users
+        ])
+        sessions = {s.user_id: s for s in CodeSession.objects.filter(user__in=users)}
+        rng = random.Random(options["seed"])
+        CodeInteraction.objects.bulk_create([
+            CodeInteraction(session=session, prompt=rng.choice(PROMPTS), response=CANNED_RESPONSE, language="python")
+            for session in sessions.values() for _ in range(options["history"])
+        ], batch_size=500)
+        return [(user.username, sessions[user.id].id) for user in users]
+
+    def start_server(self, ollama_url, options):
+        port = free_port()
+        address = f"127.0.0.1:{port}"
+        env = {**os.environ, "OLLAMA_HOST": ollama_url, "OLLAMA_BACKENDS": ollama_url}
+        if options["server"] == "gunicorn":
+            if importlib.util.find_spec("gunicorn") is None:
+                raise CommandError("gunicorn is not installed; use --server runserver")
+            command = [
+                sys.executable, "-m", "gunicorn", "roro_ai.wsgi:application", "--bind", address,
+                "--workers", str(options["workers"]), "--threads", str(options["threads"]),
+                "--timeout", str(int(options["timeout"])),
+            ]
+        else:
+            command = [sys.executable, "manage.py", "runserver", address, "--noreload"]
+        log = open(options["server_log"], "ab") if options["server_log"] else subprocess.DEVNULL
+        process = subprocess.Popen(
+            command, cwd=settings.BASE_DIR, env=env, stdin=subprocess.DEVNULL, stdout=log, stderr=log,
+        )
+        base_url = f"http://{address}"
+        deadline = time.monotonic() + 60
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise CommandError(f"{options['server']} exited with {process.returncode}; see --server-log")
+            try:
+                if httpx.get(f"{base_url}/auth/login/", timeout=2).status_code == 200:
+                    return process, base_url
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.2)
+        process.terminate()
+        raise CommandError(f"{options['server']} did not come up within 60s")
+
+    def run(self, base_url, users, mix, options):
+        """Run every user in its own thread; returns the results and the measured seconds."""
+        results = Results()
+        names, weights = list(mix), list(mix.values())
+        iterations = options["iterations"]
+        started = time.monotonic()
+        measure_from = started if iterations else started + options["warmup"]
+        deadline = measure_from + options["duration"]
+        failures = []
+
+        def drive(index, username, session_id):
+            user = VirtualUser(base_url, username, random.Random(options["seed"] * 1000 + index), options["timeout"])
+            user.session_id = session_id
+            try:
+                if user.login() >= 400:
+                    failures.append(username)
+                    return
+                done = 0
+                while (done < iterations) if iterations else (time.monotonic() < deadline):
+                    name = user.rng.choices(names, weights)[0]
+                    began = time.monotonic()
+                    try:
+                        status = getattr(user, name)()
+                    except httpx.HTTPError as e:
+                        status = type(e).__name__
+                    if began >= measure_from:
+                        results.record(name, time.monotonic() - began, status)
+                    done += 1
+            finally:
+                user.close()
+
+        threads = [
+            threading.Thread(target=drive, args=(i, username, session_id), daemon=True)
+            for i, (username, session_id) in enumerate(users)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if failures:
+            raise CommandError(f"{len(failures)} simulated user(s) could not log in")
+        return results, time.monotonic() - measure_from
+
+    def print_report(self, report):
+        self.stdout.write(f"{'endpoint':<20} {'reqs':>6} {'err':>5} {'req/s':>8} {'p50':>9} {'p95':>9} {'p99':>9}")
+        rows = [*report["endpoints"].items(), ("total", report["total"])]
+        for name, r in rows:
+            self.stdout.write(
+                f"{name:<20} {r['requests']:>6} {r['errors']:>5} {r['throughput']:>8.1f} "
+                f"{r['p50_ms']:>7.1f}ms {r['p95_ms']:>7.1f}ms {r['p99_ms']:>7.1f}ms"
+            )
+        for regression in report.get("regressions") or []:
+            self.stdout.write(self.style.ERROR(f"Regression: {regression}"))
+        if report.get("regressions") == []:
+            self.stdout.write(self.style.SUCCESS("No regressions against the baseline"))
@@ -0,0 +1,41 @@
+# coder/management/commands/rebuild_search_index.py
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from coder.models import CodeInteraction, InteractionSearchDocument
+from coder.search import backend, document_for
+
+
+class Command(BaseCommand):
+    help = (
+        "Write search documents for existing interactions, in primary-key "
+        "batches of short transactions. New interactions are indexed as they "
+        "are saved; this is for history from before search existed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument("--sleep", type=float, default=0.05, help="Pause between batches, in seconds.")
+        parser.add_argument("--start-id", type=int, default=0, help="Resume after this interaction id.")
+
+    def handle(self, *args, **options):
+        last = options["start_id"]
+        indexed = 0
+        interactions = CodeInteraction.objects.select_related('session').only(
+            'id', 'session__user_id', 'language', 'created_at', 'prompt', 'response', 'code_snippet'
+        ).filter(status=CodeInteraction.DONE).order_by('id')
+        while True:
+            batch = list(interactions.filter(id__gt=last)[:options["batch_size"]])
+            if not batch:
+                break
+            with transaction.atomic():
+                InteractionSearchDocument.objects.filter(interaction_id__in=[i.id for i in batch]).delete()
+                InteractionSearchDocument.objects.bulk_create(document_for(i, i.session.user_id) for i in batch)
+            indexed += len(batch)
+            last = batch[-1].id
+            self.stdout.write(f"Indexed up to id {last} ({indexed} interactions)")
+            if options["sleep"]:
+                time.sleep(options["sleep"])
+        self.stdout.write(self.style.SUCCESS(f"Indexed {indexed} interactions with the {backend().name} backend."))
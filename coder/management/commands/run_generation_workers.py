@@ -0,0 +1,52 @@
+# coder/management/commands/run_generation_workers.py
+import multiprocessing
+import signal
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+
+def _work(stop):
+    # Each process opens its own database connections.
+    from coder.job_worker import work
+
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    work(stop)
+
+
+class Command(BaseCommand):
+    help = (
+        "Run background generation jobs in a pool of worker processes. A "
+        "worker that dies is replaced, and the job it held is retried once its "
+        "lease runs out. Stops on SIGINT/SIGTERM after the running jobs finish."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--processes", type=int, default=2)
+
+    def handle(self, *args, **options):
+        context = multiprocessing.get_context("fork")
+        stop = context.Event()
+        # Don't share the parent's connections with forked children.
+        connections.close_all()
+
+        def start():
+            process = context.Process(target=_work, args=(stop,))
+            process.start()
+            return process
+
+        def shutdown(signum, frame):
+            stop.set()
+
+        signal.signal(signal.SIGTERM, shutdown)
+        signal.signal(signal.SIGINT, shutdown)
+        workers = [start() for _ in range(options["processes"])]
+        self.stdout.write(f"Started {len(workers)} generation workers")
+        while not stop.is_set():
+            stop.wait(1)
+            for i, process in enumerate(workers):
+                if not process.is_alive() and not stop.is_set():
+                    self.stderr.write(f"Worker {process.pid} exited with {process.exitcode}, restarting")
+                    workers[i] = start()
+        for process in workers:
+            process.join()
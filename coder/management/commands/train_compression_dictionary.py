@@ -0,0 +1,39 @@
+# coder/management/commands/train_compression_dictionary.py
+from django.core.management.base import BaseCommand, CommandError
+
+from coder.compression import CompressionError, codec, train_dictionary
+from coder.models import CodeInteraction, CompressionDictionary
+
+
+class Command(BaseCommand):
+    help = (
+        "Train a shared compression dictionary on recent interactions. New "
+        "values are compressed against it once the web workers restart; "
+        "existing rows keep the dictionary they were written with."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--samples", type=int, default=2000, help="Recent interactions to learn from.")
+        parser.add_argument("--size", type=int, default=32 * 1024, help="Dictionary size in bytes.")
+        parser.add_argument("--algorithm", default=codec.algorithm, choices=["zstd", "zlib"])
+
+    def handle(self, *args, **options):
+        samples = []
+        rows = CodeInteraction.objects.only('prompt', 'response', 'code_snippet').order_by('-id')[:options["samples"]]
+        for interaction in rows.iterator(chunk_size=200):
+            samples.extend(text for text in (interaction.prompt, interaction.response, interaction.code_snippet) if text)
+        if not samples:
+            raise CommandError("No interactions to train on yet.")
+        try:
+            data = train_dictionary(options["algorithm"], samples, options["size"])
+        except CompressionError as exc:
+            raise CommandError(str(exc))
+        if not data:
+            raise CommandError("The samples have nothing in common worth a dictionary.")
+        dictionary = CompressionDictionary.objects.create(
+            algorithm=options["algorithm"], data=data, samples=len(samples)
+        )
+        self.stdout.write(
+            f"Saved {dictionary}, trained on {len(samples)} texts. Restart the web workers to use it, "
+            "then run compress_interactions --recompress to apply it to existing rows."
+        )
@@ -0,0 +1,55 @@
+# coder/management/commands/warm_models.py
+import time
+
+from django.core.management.base import BaseCommand
+
+from coder.routing import get_router
+from coder.warmup import ModelWarmer
+
+
+class Command(BaseCommand):
+    help = (
+        "Load models on every Ollama backend and report how long each load "
+        "took, e.g. after a deploy and before taking traffic. With "
+        "--keep-alive it keeps going, renewing the models every --interval "
+        "seconds. Only one warmer per host runs at a time (MODEL_WARMUP_LOCK_FILE); "
+        "if another holds the lock this one stands by until it exits."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--model", action="append", dest="models",
+            help="Model to load; repeat for several. Defaults to MODEL_WARMUP_MODELS, or every tier's model.",
+        )
+        parser.add_argument("--keep-alive", action="store_true")
+        parser.add_argument("--interval", type=float, default=None, help="Seconds between renewals.")
+
+    def handle(self, *args, **options):
+        router = get_router()
+        warmer = ModelWarmer(models=options["models"], router=router, idle=0)
+        if options["interval"] is not None:
+            warmer.interval = options["interval"]
+        router.check_health()
+        for backend in router.backends:
+            if not backend.healthy:
+                self.stderr.write(f"{backend.host}: unreachable")
+                continue
+            resident = warmer.resident(backend)
+            if resident is None:
+                continue
+            for model in warmer.models:
+                if model in resident:
+                    self.stdout.write(f"{backend.host} {model}: already loaded")
+                    continue
+                started = time.monotonic()
+                loaded = warmer.load(backend, model, cold=True)
+                outcome = f"loaded in {time.monotonic() - started:.1f}s" if loaded else "failed"
+                self.stdout.write(f"{backend.host} {model}: {outcome}")
+        if options["keep_alive"]:
+            if not warmer.hold_lock():
+                self.stdout.write(f"Another process holds {warmer.lock_file}; standing by")
+            self.stdout.write(f"Keeping {', '.join(warmer.models)} loaded every {warmer.interval:g}s")
+            try:
+                warmer.run()
+            except KeyboardInterrupt:
+                warmer.stop()
@@ -0,0 +1,234 @@
+# coder/metrics.py
+"""Prometheus metrics for the request → Ollama → database pipeline, served at ``/metrics``.
+
+A small in-process registry rather than a client library. Each process
+keeps its own numbers; with ``METRICS_DIR`` set, every process also writes a
+snapshot there (at most every ``METRICS_FLUSH_SECONDS``) and ``/metrics``
+adds all the snapshots up, so a scrape that lands on any gunicorn worker
+reports the web workers and the generation workers together. Snapshots of
+exited processes stay until the directory is cleared, so counters never go
+backwards while the service runs.
+"""
+import json
+import math
+import os
+import tempfile
+import threading
+import time
+
+from .settings import METRICS_DIR, METRICS_FLUSH_SECONDS
+
+# Seconds, from a cache hit to a long generation.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+TOKEN_BUCKETS = (16, 64, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768)
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, registry, name, help, labels=()):
+        self.registry = registry
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.values = {}
+
+    def key(self, labels):
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def describe(self):
+        return {"kind": self.kind, "help": self.help, "labels": list(self.labels)}
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.registry.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        with self.registry.lock:
+            self.values[self.key(labels)] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, registry, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(registry, name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        with self.registry.lock:
+            counts = self.values.get(key)
+            if counts is None:
+                # One count per bucket (not cumulative), then +Inf, sum and count.
+                counts = self.values[key] = [0] * (len(self.buckets) + 3)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[len(self.buckets)] += 1
+            counts[-2] += value
+            counts[-1] += 1
+
+    def describe(self):
+        return {**super().describe(), "buckets": list(self.buckets)}
+
+
+class Registry:
+    def __init__(self, directory=METRICS_DIR, flush_interval=METRICS_FLUSH_SECONDS):
+        self.metrics = {}
+        self.lock = threading.Lock()
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._flushed = 0.0
+
+    def _add(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self._add(Counter(self, name, help, labels))
+
+    def gauge(self, name, help, labels=()):
+        return self._add(Gauge(self, name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        return self._add(Histogram(self, name, help, labels, buckets))
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                name: {**metric.describe(), "values": [[list(k), v] for k, v in metric.values.items()]}
+                for name, metric in self.metrics.items()
+            }
+
+    def maybe_flush(self):
+        """Write this process's snapshot to ``METRICS_DIR`` if the last one is old enough."""
+        if not self.directory or time.monotonic() - self._flushed < self.flush_interval:
+            return
+        self._flushed = time.monotonic()
+        os.makedirs(self.directory, exist_ok=True)
+        fd, path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(self.snapshot(), f)
+        os.replace(path, os.path.join(self.directory, f"{os.getpid()}.json"))
+
+    def collect(self):
+        """Every process's snapshot added up, or just this process's without ``METRICS_DIR``."""
+        if not self.directory:
+            return self.snapshot()
+        self._flushed = 0.0
+        self.maybe_flush()
+        merged = {}
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith(".json"):
+                continue
+            try:
+                with open(entry.path) as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError):
+                continue
+            for name, metric in snapshot.items():
+                target = merged.setdefault(name, {**metric, "values": {}})
+                for labels, value in metric["values"]:
+                    key = tuple(labels)
+                    if key not in target["values"]:
+                        target["values"][key] = value
+                    elif isinstance(value, list):
+                        target["values"][key] = [a + b for a, b in zip(target["values"][key], value)]
+                    else:
+                        target["values"][key] += value
+        for metric in merged.values():
+            metric["values"] = list(map(list, metric["values"].items()))
+        return merged
+
+    def render(self):
+        """The Prometheus text exposition format."""
+        lines = []
+        for name, metric in sorted(self.collect().items()):
+            lines.append(f"# HELP {name} {metric['help']}")
+            lines.append(f"# TYPE {name} {metric['kind']}")
+            for labels, value in sorted(metric["values"], key=lambda item: item[0]):
+                pairs = list(zip(metric["labels"], labels))
+                if metric["kind"] != "histogram":
+                    lines.append(f"{name}{_labels(pairs)} {_number(value)}")
+                    continue
+                cumulative = 0
+                for bound, count in zip([*metric["buckets"], math.inf], value):
+                    cumulative += count
+                    le = "+Inf" if bound == math.inf else _number(bound)
+                    lines.append(f"{name}_bucket{_labels(pairs + [('le', le)])} {cumulative}")
+                lines.append(f"{name}_sum{_labels(pairs)} {_number(value[-2])}")
+                lines.append(f"{name}_count{_labels(pairs)} {value[-1]}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(pairs):
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+registry = Registry()
+
+HTTP_LATENCY = registry.histogram(
+    "http_request_duration_seconds", "Time to the response (first byte when streaming), by view.",
+    ["view", "method", "status"],
+)
+HTTP_STREAM_DURATION = registry.histogram(
+    "http_stream_duration_seconds", "Time until a streamed response was fully sent, by view.", ["view"],
+)
+DB_QUERIES = registry.histogram(
+    "http_request_db_queries", "Database queries per request.", ["view"],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 50, 100),
+)
+DB_TIME = registry.histogram("http_request_db_seconds", "Time spent in database queries per request.", ["view"])
+OLLAMA_TTFT = registry.histogram(
+    "ollama_time_to_first_token_seconds", "Request start to first token (prefill, plus model load if cold).",
+    ["model"],
+)
+OLLAMA_GENERATION = registry.histogram(
+    "ollama_generation_seconds", "Request start to last token of an Ollama generation.", ["model"],
+)
+OLLAMA_TOKENS_PER_SECOND = registry.histogram(
+    "ollama_tokens_per_second", "Decode speed reported by Ollama.", ["model"],
+    buckets=(1, 2, 5, 10, 20, 30, 50, 80, 120, 200),
+)
+OLLAMA_TOKENS = registry.counter("ollama_tokens_total", "Tokens processed by Ollama.", ["model", "kind"])
+PROMPT_TOKENS = registry.histogram(
+    "generation_prompt_tokens", "Estimated size of each prompt sent to Ollama, and of its conversation context.",
+    ["part"], buckets=TOKEN_BUCKETS,
+)
+GENERATIONS = registry.counter(
+    "generations_total", "Generations by how they were answered: HIT, SEMANTIC, COALESCED, MISS or BYPASS.",
+    ["cache"],
+)
+OLLAMA_MODEL_LOAD = registry.histogram("ollama_model_load_seconds", "Time to load a model cold.", ["model"])
+OLLAMA_MODEL_RESIDENT = registry.gauge(
+    "ollama_model_resident", "1 if the model was loaded on the backend at the last warm-up check.", ["backend", "model"],
+)
+MODEL_TIER = registry.counter(
+    "generation_model_tier_total", "Generations by model tier and why it was chosen.", ["tier", "reason"],
+)
+FORMAT_TIME = registry.histogram("black_format_seconds", "Time to format one snippet with black.", ["result"])
+ADMISSION_WAIT = registry.histogram("admission_wait_seconds", "Time queued before admission.", ["subject"])
+ADMISSION_REJECTED = registry.counter("admission_rejected_total", "Requests turned away with a 429.", ["subject", "reason"])
+SANDBOX_WALL = registry.histogram("sandbox_wall_seconds", "Wall time of sandboxed code runs.", ["language"])
@@ -0,0 +1,124 @@
+# coder/middleware.py
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+from . import tracing
+from .metrics import DB_QUERIES, DB_TIME, HTTP_LATENCY, HTTP_STREAM_DURATION, registry
+
+_queries = ContextVar("coder_queries", default=None)
+
+
+class QueryTimer:
+    """Counts a request's queries and their time, and traces each one."""
+
+    def __init__(self, trace):
+        self.trace = trace
+        self.count = 0
+        self.seconds = 0.0
+        self.done = False
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.monotonic()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            ended = time.monotonic()
+            self.count += 1
+            self.seconds += ended - started
+            self.trace.add("db", started, ended, sql=sql[:120])
+
+
+def record_query(execute, sql, params, many, context):
+    """``execute_wrapper`` on every connection, timing queries for the request in context.
+
+    Connections belong to threads, and an async view's queries run on the
+    ``sync_to_async`` executor threads rather than the one the middleware
+    runs on. The context, and with it the request's timer, follows them there.
+    """
+    timer = _queries.get()
+    if timer is None or timer.done:
+        return execute(sql, params, many, context)
+    return timer(execute, sql, params, many, context)
+
+
+def install_query_timer(connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def install_query_timers():
+    """Wrap the connections open now and every one opened later, in any thread."""
+    connection_created.connect(install_query_timer, dispatch_uid="coder.install_query_timer")
+    for connection in connections.all(initialized_only=True):
+        install_query_timer(connection)
+
+
+class ObservabilityMiddleware:
+    """Request metrics, per-request database time and the request's trace.
+
+    Streamed responses are measured twice: up to the response object (what
+    the client waits for before the first byte) and, once closed, until the
+    last byte, together with any queries made while streaming. Runs natively
+    under both WSGI and ASGI, so async views stay on the event loop.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        trace, queries = self.start(request)
+        try:
+            response = self.get_response(request)
+        except BaseException:
+            queries.done = True
+            raise
+        return self.finish(request, response, trace, queries)
+
+    async def __acall__(self, request):
+        trace, queries = self.start(request)
+        try:
+            response = await self.get_response(request)
+        except BaseException:
+            queries.done = True
+            raise
+        return self.finish(request, response, trace, queries)
+
+    def start(self, request):
+        trace = tracing.start(request.headers.get('X-Request-ID'), f"{request.method} {request.path}")
+        queries = QueryTimer(trace)
+        _queries.set(queries)
+        return trace, queries
+
+    def finish(self, request, response, trace, queries):
+        match = request.resolver_match
+        view = match.view_name if match else "unmatched"
+        HTTP_LATENCY.observe(
+            time.monotonic() - trace.started, view=view, method=request.method, status=response.status_code
+        )
+        response['X-Request-ID'] = trace.request_id
+
+        def done():
+            queries.done = True
+            if response.streaming:
+                HTTP_STREAM_DURATION.observe(time.monotonic() - trace.started, view=view)
+            DB_QUERIES.observe(queries.count, view=view)
+            DB_TIME.observe(queries.seconds, view=view)
+            trace.finish(view=view, status=response.status_code, db_queries=queries.count,
+                         db_ms=round(queries.seconds * 1000, 2))
+            registry.maybe_flush()
+
+        if response.streaming:
+            response._resource_closers.append(done)
+        else:
+            done()
+        return response
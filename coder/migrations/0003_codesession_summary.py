@@ -0,0 +1,23 @@
+# Generated by Django 5.2 on 2026-10-18 08:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("coder", "0002_alter_codeinteraction_options_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="codesession",
+            name="summary",
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name="codesession",
+            name="summary_through",
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 5.2 on 2026-10-18 09:10
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def deactivate_extra_sessions(apps, schema_editor):
+    """Leave each user with only their most recently updated session active."""
+    CodeSession = apps.get_model("coder", "CodeSession")
+    seen = set()
+    extra = []
+    sessions = CodeSession.objects.filter(is_active=True).order_by("user_id", "-updated_at", "-id")
+    for session_id, user_id in sessions.values_list("id", "user_id").iterator():
+        if user_id in seen:
+            extra.append(session_id)
+        seen.add(user_id)
+    for start in range(0, len(extra), 1000):
+        CodeSession.objects.filter(id__in=extra[start:start + 1000]).update(is_active=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("coder", "0003_codesession_summary"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(deactivate_extra_sessions, migrations.RunPython.noop),
+        migrations.AddField(
+            model_name="codesession",
+            name="active_user",
+            field=models.GeneratedField(
+                db_persist=True,
+                expression=models.Case(
+                    models.When(is_active=True, then=models.F("user_id")), default=None
+                ),
+                null=True,
+                output_field=models.BigIntegerField(),
+                unique=True,
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="codeinteraction",
+            index=models.Index(
+                fields=["session", "created_at"], name="coder_inter_sess_created_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="codesession",
+            index=models.Index(
+                fields=["user", "is_active"], name="coder_sess_user_active_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="codesession",
+            index=models.Index(
+                fields=["user", "created_at"], name="coder_sess_user_created_idx"
+            ),
+        ),
+    ]
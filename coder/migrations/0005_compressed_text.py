@@ -0,0 +1,67 @@
+# Generated by Django 5.2 on 2026-10-18 09:14
+
+import coder.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("coder", "0004_session_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CompressionDictionary",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("algorithm", models.CharField(max_length=10)),
+                ("data", models.BinaryField()),
+                ("samples", models.PositiveIntegerField(default=0)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        # The plain columns stay as they are, under new field names: no table rebuild.
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.RenameField(
+                    model_name="codeinteraction",
+                    old_name=name,
+                    new_name=f"legacy_{name}",
+                )
+                for name in ("prompt", "response", "code_snippet")
+            ] + [
+                migrations.AlterField(
+                    model_name="codeinteraction",
+                    name=f"legacy_{name}",
+                    field=models.TextField(blank=True, db_column=name, editable=False),
+                )
+                for name in ("prompt", "response", "code_snippet")
+            ],
+        ),
+        # Nullable, so adding them needs no rewrite of the existing rows either;
+        # compress_interactions fills them in batches.
+        migrations.AddField(
+            model_name="codeinteraction",
+            name="prompt",
+            field=coder.fields.CompressedTextField(db_column="prompt_compressed", null=True),
+        ),
+        migrations.AddField(
+            model_name="codeinteraction",
+            name="response",
+            field=coder.fields.CompressedTextField(db_column="response_compressed", null=True),
+        ),
+        migrations.AddField(
+            model_name="codeinteraction",
+            name="code_snippet",
+            field=coder.fields.CompressedTextField(blank=True, db_column="code_snippet_compressed", null=True),
+        ),
+    ]
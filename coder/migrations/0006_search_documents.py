@@ -0,0 +1,109 @@
+# Generated by Django 5.2 on 2026-10-18 09:19
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+TABLE = "coder_interactionsearchdocument"
+FTS_TABLE = "coder_search_fts"
+FULLTEXT_INDEX = "coder_search_text_ft"
+
+
+def sqlite_has_fts5(cursor):
+    cursor.execute("PRAGMA compile_options")
+    return any(option == "ENABLE_FTS5" for (option,) in cursor.fetchall())
+
+
+def create_text_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == "mysql":
+        schema_editor.execute(f"ALTER TABLE {TABLE} ADD FULLTEXT INDEX {FULLTEXT_INDEX} (prompt, response)")
+    elif connection.vendor == "sqlite":
+        with connection.cursor() as cursor:
+            if not sqlite_has_fts5(cursor):
+                return
+        # An external-content FTS5 table over the documents, updated by triggers.
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5("
+            f"prompt, response, content='{TABLE}', content_rowid='interaction_id')"
+        )
+        schema_editor.execute(
+            f"CREATE TRIGGER {FTS_TABLE}_ai AFTER INSERT ON {TABLE} BEGIN "
+            f"INSERT INTO {FTS_TABLE}(rowid, prompt, response) "
+            f"VALUES (new.interaction_id, new.prompt, new.response); END"
+        )
+        schema_editor.execute(
+            f"CREATE TRIGGER {FTS_TABLE}_ad AFTER DELETE ON {TABLE} BEGIN "
+            f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, prompt, response) "
+            f"VALUES ('delete', old.interaction_id, old.prompt, old.response); END"
+        )
+        schema_editor.execute(
+            f"CREATE TRIGGER {FTS_TABLE}_au AFTER UPDATE ON {TABLE} BEGIN "
+            f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, prompt, response) "
+            f"VALUES ('delete', old.interaction_id, old.prompt, old.response); "
+            f"INSERT INTO {FTS_TABLE}(rowid, prompt, response) "
+            f"VALUES (new.interaction_id, new.prompt, new.response); END"
+        )
+
+
+def drop_text_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == "mysql":
+        schema_editor.execute(f"ALTER TABLE {TABLE} DROP INDEX {FULLTEXT_INDEX}")
+    elif connection.vendor == "sqlite":
+        for trigger in ("ai", "ad", "au"):
+            schema_editor.execute(f"DROP TRIGGER IF EXISTS {FTS_TABLE}_{trigger}")
+        schema_editor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("coder", "0005_compressed_text"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="InteractionSearchDocument",
+            fields=[
+                (
+                    "interaction",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="search_document",
+                        serialize=False,
+                        to="coder.codeinteraction",
+                    ),
+                ),
+                ("language", models.CharField(max_length=50)),
+                ("created_at", models.DateTimeField()),
+                ("prompt", models.TextField()),
+                ("response", models.TextField()),
+                (
+                    "session",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="coder.codesession",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["user", "created_at"],
+                        name="coder_search_user_created_idx",
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(create_text_index, drop_text_index),
+    ]
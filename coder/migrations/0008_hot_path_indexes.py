@@ -0,0 +1,41 @@
+# Generated by Django 5.2 on 2026-10-18 10:35
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("coder", "0007_generation_jobs"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="codeinteraction",
+            index=models.Index(
+                fields=["session", "id"], name="coder_inter_sess_id_idx"
+            ),
+        ),
+        migrations.AlterField(
+            model_name="codeinteraction",
+            name="session",
+            field=models.ForeignKey(
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="interactions",
+                to="coder.codesession",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="codesession",
+            name="user",
+            field=models.ForeignKey(
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                to=settings.AUTH_USER_MODEL,
+            ),
+        ),
+    ]
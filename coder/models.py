@@ -1,25 +1,170 @@
 # coder/models.py
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
+
+from .fields import CompressedTextField
 
 class CodeSession(models.Model):
-    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    # The composite indexes below start with user, so it needs none of its own.
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_index=False)
     title = models.CharField(max_length=255)
     description = models.TextField(blank=True)
     is_active = models.BooleanField(default=True)
+    # Rolling summary of the turns that no longer fit the prompt context.
+    summary = models.TextField(blank=True)
+    summary_through = models.PositiveBigIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # The owner while the session is active, NULL otherwise. Unique, so each user has
+    # at most one active session; MariaDB has no partial unique indexes to say that directly.
+    active_user = models.GeneratedField(
+        expression=models.Case(models.When(is_active=True, then=models.F('user_id')), default=None),
+        output_field=models.BigIntegerField(),
+        db_persist=True,
+        null=True,
+        unique=True,
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'is_active'], name='coder_sess_user_active_idx'),
+            models.Index(fields=['user', 'created_at'], name='coder_sess_user_created_idx'),
+        ]
 
     def __str__(self):
         return self.title
 
+# Text fields stored compressed since migration 0005, and the plain columns they replace.
+LEGACY_TEXT = {'prompt': 'legacy_prompt', 'response': 'legacy_response', 'code_snippet': 'legacy_code_snippet'}
+
+
+class CodeInteractionQuerySet(models.QuerySet):
+    def only(self, *fields):
+        # Rows not compressed yet still have their text in the legacy column.
+        return super().only(*fields, *(LEGACY_TEXT[name] for name in fields if name in LEGACY_TEXT))
+
+
 class CodeInteraction(models.Model):
-    session = models.ForeignKey(CodeSession, on_delete=models.CASCADE, related_name="interactions")
+    PENDING, DONE, FAILED, CANCELLED = 'pending', 'done', 'failed', 'cancelled'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+        (CANCELLED, 'Cancelled'),
+    ]
+
+    # Covered by the composite indexes below.
+    session = models.ForeignKey(CodeSession, on_delete=models.CASCADE, related_name="interactions", db_index=False)
+    # NULL until ``compress_interactions`` has moved the row's text over from the legacy column.
+    prompt = CompressedTextField(db_column='prompt_compressed', null=True)
+    response = CompressedTextField(db_column='response_compressed', null=True)
+    code_snippet = CompressedTextField(db_column='code_snippet_compressed', blank=True, null=True)
+    # The plain-text columns from before 0005. New rows leave them empty; they are
+    # dropped in a later release, once every row has been compressed.
+    legacy_prompt = models.TextField(db_column='prompt', blank=True, editable=False)
+    legacy_response = models.TextField(db_column='response', blank=True, editable=False)
+    legacy_code_snippet = models.TextField(db_column='code_snippet', blank=True, editable=False)
+    language = models.CharField(max_length=50, default="python")
+    # Anything but DONE is a background job's interaction (see GenerationJob);
+    # while pending, response holds the text generated so far.
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=DONE)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = CodeInteractionQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['session', 'created_at'], name='coder_inter_sess_created_idx'),
+            # The context builder reads the turns after the summary, newest first.
+            models.Index(fields=['session', 'id'], name='coder_inter_sess_id_idx'),
+        ]
+
+    def __str__(self):
+        return f"Interaction in {self.session.title}"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        for name, legacy in LEGACY_TEXT.items():
+            if instance.__dict__.get(name, '') is None and legacy in instance.__dict__:
+                instance.__dict__[name] = instance.__dict__[legacy]
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        if fields is not None:
+            fields = [*fields, *(LEGACY_TEXT[name] for name in fields if name in LEGACY_TEXT)]
+        super().refresh_from_db(using, fields, from_queryset)
+
+class CompressionDictionary(models.Model):
+    """Shared dictionary for ``CompressedTextField`` values; rows are never changed or deleted."""
+    algorithm = models.CharField(max_length=10)
+    data = models.BinaryField()
+    samples = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.algorithm} dictionary {self.pk} ({len(self.data)} bytes)"
+
+class InteractionSearchDocument(models.Model):
+    """Plain-text copy of an interaction for the full-text index, see ``coder/search.py``."""
+    interaction = models.OneToOneField(
+        CodeInteraction, on_delete=models.CASCADE, primary_key=True, related_name="search_document"
+    )
+    # Copied from the interaction and its session so searches need no joins.
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    session = models.ForeignKey(CodeSession, on_delete=models.CASCADE)
+    language = models.CharField(max_length=50)
+    created_at = models.DateTimeField()
     prompt = models.TextField()
     response = models.TextField()
-    code_snippet = models.TextField(blank=True)
-    language = models.CharField(max_length=50, default="python")
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'created_at'], name='coder_search_user_created_idx'),
+        ]
+
+
+class GenerationJob(models.Model):
+    """A generation run by ``run_generation_workers`` instead of inside the request, see ``coder/jobs.py``."""
+    QUEUED, RUNNING, DONE, FAILED, CANCELLED = 'queued', 'running', 'done', 'failed', 'cancelled'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+        (CANCELLED, 'Cancelled'),
+    ]
+    FINISHED = (DONE, FAILED, CANCELLED)
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    interaction = models.OneToOneField(CodeInteraction, on_delete=models.CASCADE, related_name="job")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    # Higher runs first.
+    priority = models.SmallIntegerField(default=0)
+    # Request options the generation needs, e.g. think_mode.
+    options = models.JSONField(default=dict, blank=True)
+    # Sent by the client so a retried POST returns the same job.
+    idempotency_key = models.CharField(max_length=255, null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    cancel_requested = models.BooleanField(default=False)
+    worker = models.CharField(max_length=100, blank=True)
+    error = models.TextField(blank=True)
+    # Not claimed before this, so retries back off.
+    available_at = models.DateTimeField(default=timezone.now)
+    # A running job whose worker stops renewing this is given to another worker.
+    lease_expires_at = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'idempotency_key'], name='coder_job_idempotency_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['status', '-priority', 'id'], name='coder_job_claim_idx'),
+        ]
 
     def __str__(self):
-        return f"Interaction in {self.session.title}"
\ No newline at end of file
+        return f"Job {self.pk} ({self.status})"
@@ -0,0 +1,38 @@
+# coder/pagination.py
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+
+class SessionCursorPagination(CursorPagination):
+    ordering = '-created_at'
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+
+
+class JobCursorPagination(CursorPagination):
+    ordering = '-created_at'
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+
+
+class InteractionCursorPagination(CursorPagination):
+    """Oldest first; ``?ordering=-created_at`` pages back from the newest instead."""
+
+    ordering = 'created_at'
+    orderings = ('created_at', '-created_at')
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+
+    def get_ordering(self, request, queryset, view):
+        ordering = request.query_params.get('ordering')
+        return (ordering,) if ordering in self.orderings else (self.ordering,)
+
+
+class SearchPagination(PageNumberPagination):
+    """Numbered pages, since results are ordered by relevance rather than a column a cursor could follow."""
+
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
@@ -0,0 +1,338 @@
+# coder/routing.py
+"""Spread generations over several Ollama backends.
+
+Each backend tracks its in-flight requests, a moving average of recent
+latency and the models it currently has loaded (from ``/api/ps``). A prompt
+goes to the least-loaded healthy backend that already holds the requested
+model, so we avoid paying for a cold model load whenever another box could
+answer straight away. Backends that keep failing are ejected by their circuit
+breaker and re-admitted once a background health probe succeeds. A session's
+turns stick to the backend that served it last, which still has the
+session's prompt prefix cached. A backend that is loading a model (see
+``coder/warmup.py``) is the last choice for that model until it is done.
+
+Which models are loading on which backend, and when each model was last
+used, are shared between processes through the ``MODEL_STATE_ALIAS`` cache:
+the warmer runs in one process per host, and every router reads that state
+at most every ``MODEL_STATE_SYNC_SECONDS``.
+"""
+import logging
+import threading
+import time
+from collections import Counter, OrderedDict
+
+import httpx
+from django.core.cache import caches
+
+from .exceptions import OllamaUnavailable
+from .settings import (
+    MODEL_STATE_ALIAS,
+    MODEL_STATE_SYNC_SECONDS,
+    MODEL_WARMUP_IDLE,
+    OLLAMA_AFFINITY_SLACK,
+    OLLAMA_BACKENDS,
+    OLLAMA_BREAKER_THRESHOLD,
+    OLLAMA_BREAKER_COOLDOWN,
+    OLLAMA_HEALTH_INTERVAL,
+    OLLAMA_HEALTH_TIMEOUT,
+    OLLAMA_LATENCY_DECAY,
+    OLLAMA_READ_TIMEOUT,
+)
+
+logger = logging.getLogger(__name__)
+
+# Sessions each router remembers a backend for; the least recently used are forgotten.
+AFFINITY_SIZE = 10000
+# Shared state keys: models loading on a host, when a model was last used, and
+# every model that has a last-used key.
+LOADING_KEY = "coder:models:loading:"
+USED_KEY = "coder:models:used:"
+USED_MODELS_KEY = "coder:models:used"
+
+
+class CircuitBreaker:
+    """Stops sending traffic to a host after repeated failures.
+
+    After ``threshold`` consecutive failures the breaker opens for ``cooldown``
+    seconds; then a single probe request is let through and its outcome
+    decides whether the breaker closes again or re-opens.
+    """
+
+    def __init__(self, threshold=OLLAMA_BREAKER_THRESHOLD, cooldown=OLLAMA_BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+    def retry_after(self):
+        if self.opened_at is None:
+            return 0
+        return max(self.opened_at + self.cooldown - time.monotonic(), 0)
+
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if self._probing or self.retry_after() > 0:
+                return False
+            self._probing = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._probing or self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+            self._probing = False
+
+
+def model_key(model):
+    return model if ":" in model else f"{model}:latest"
+
+
+class Backend:
+    def __init__(self, host):
+        self.host = host
+        self.breaker = CircuitBreaker()
+        self.in_flight = 0
+        self.latency = None
+        self.models = set()
+        self.loading = set()
+        # Models another process is loading here, as of the last sync.
+        self.shared_loading = set()
+        self.healthy = True
+        self.checked_at = None
+
+    def has_model(self, model):
+        return model_key(model) in self.models
+
+    def is_loading(self, model):
+        return model_key(model) in self.loading or model_key(model) in self.shared_loading
+
+    def snapshot(self):
+        return {
+            "host": self.host,
+            "healthy": self.healthy,
+            "breaker_open": self.breaker.is_open,
+            "in_flight": self.in_flight,
+            "latency_ms": round(self.latency * 1000, 1) if self.latency is not None else None,
+            "models": sorted(self.models),
+            "loading": sorted(self.loading | self.shared_loading),
+        }
+
+
+class OllamaRouter:
+    def __init__(self, hosts, health_interval=OLLAMA_HEALTH_INTERVAL):
+        self.backends = [Backend(host) for host in hosts]
+        self.health_interval = health_interval
+        self._affinity = OrderedDict()
+        self.in_flight_by_model = Counter()
+        # Model -> time.time() of its latest request, for the warmer.
+        self.last_used = {}
+        # Models used since their last-used time was last published.
+        self._unpublished = set()
+        self._synced_at = None
+        self._lock = threading.Lock()
+        self._health_thread = None
+
+    def acquire(self, model, affinity=None):
+        """Reserve the best backend for ``model``; pair every call with ``release``.
+
+        Calls with the same ``affinity`` key go back to the backend of the
+        previous one while it is up and not much busier than the others.
+        """
+        self.sync_state()
+        with self._lock:
+            ranked = self._ranked(model)
+            preferred = self._affinity.get(affinity) if affinity is not None else None
+            if (preferred in ranked and not preferred.breaker.is_open
+                    and preferred.in_flight <= ranked[0].in_flight + OLLAMA_AFFINITY_SLACK):
+                ranked.remove(preferred)
+                ranked.insert(0, preferred)
+            for backend in ranked:
+                if backend.breaker.allow():
+                    backend.in_flight += 1
+                    self.in_flight_by_model[model_key(model)] += 1
+                    self.last_used[model_key(model)] = time.time()
+                    self._unpublished.add(model_key(model))
+                    if affinity is not None:
+                        self._affinity[affinity] = backend
+                        self._affinity.move_to_end(affinity)
+                        if len(self._affinity) > AFFINITY_SIZE:
+                            self._affinity.popitem(last=False)
+                    return backend
+        retry_after = min((b.breaker.retry_after() for b in self.backends), default=0)
+        raise OllamaUnavailable(", ".join(b.host for b in self.backends), retry_after or self.health_interval)
+
+    def observe_latency(self, backend, seconds):
+        with self._lock:
+            if backend.latency is None:
+                backend.latency = seconds
+            else:
+                backend.latency += OLLAMA_LATENCY_DECAY * (seconds - backend.latency)
+
+    def release(self, backend, model, failed=False, succeeded=False):
+        """Give back ``backend``; ``failed`` counts against its breaker.
+
+        Only ``succeeded`` calls mark the model resident: a request Ollama
+        refused, e.g. for a model it doesn't have, isn't held against the
+        backend but loaded nothing either.
+        """
+        with self._lock:
+            backend.in_flight -= 1
+            self.in_flight_by_model[model_key(model)] -= 1
+            if succeeded:
+                # Ollama has the model resident now even if it was cold before.
+                backend.models.add(model_key(model))
+        if failed:
+            backend.breaker.record_failure()
+        else:
+            backend.breaker.record_success()
+
+    def set_models(self, backend, models):
+        with self._lock:
+            backend.models = set(models)
+
+    def start_loading(self, backend, model):
+        with self._lock:
+            backend.loading.add(model_key(model))
+            loading = set(backend.loading)
+        self._share_loading(backend, loading)
+
+    def finish_loading(self, backend, model, loaded):
+        with self._lock:
+            backend.loading.discard(model_key(model))
+            backend.shared_loading.discard(model_key(model))
+            if loaded:
+                backend.models.add(model_key(model))
+            loading = set(backend.loading)
+        self._share_loading(backend, loading)
+
+    def _share_loading(self, backend, loading):
+        # Expires on its own should the loading process die before it is done.
+        try:
+            if loading:
+                caches[MODEL_STATE_ALIAS].set(LOADING_KEY + backend.host, loading, timeout=OLLAMA_READ_TIMEOUT)
+            else:
+                caches[MODEL_STATE_ALIAS].delete(LOADING_KEY + backend.host)
+        except Exception as e:
+            logger.warning("Sharing the models loading on %s failed: %s", backend.host, e)
+
+    def sync_state(self, force=False):
+        """Publish the models used here and read which models other processes are loading.
+
+        Runs at most every ``MODEL_STATE_SYNC_SECONDS`` unless ``force``d. If the
+        cache is unreachable the router carries on with what it knows itself.
+        """
+        now = time.monotonic()
+        if not force and self._synced_at is not None and now - self._synced_at < MODEL_STATE_SYNC_SECONDS:
+            return
+        self._synced_at = now
+        with self._lock:
+            used = {model: self.last_used[model] for model in self._unpublished}
+            self._unpublished = set()
+        try:
+            cache = caches[MODEL_STATE_ALIAS]
+            if used:
+                cache.set_many({USED_KEY + model: at for model, at in used.items()}, timeout=MODEL_WARMUP_IDLE or None)
+                # Read-modify-write: a model lost to a race is added back the next time it is used.
+                models = cache.get(USED_MODELS_KEY) or set()
+                if not models >= used.keys():
+                    cache.set(USED_MODELS_KEY, models | used.keys(), timeout=None)
+            loading = cache.get_many([LOADING_KEY + backend.host for backend in self.backends])
+        except Exception as e:
+            logger.warning("Syncing model state failed: %s", e)
+            return
+        for backend in self.backends:
+            backend.shared_loading = set(loading.get(LOADING_KEY + backend.host) or ())
+
+    def shared_last_used(self):
+        """Model -> time.time() it was last used by any process, as far as the shared cache knows."""
+        try:
+            cache = caches[MODEL_STATE_ALIAS]
+            models = cache.get(USED_MODELS_KEY) or ()
+            used = cache.get_many([USED_KEY + model for model in models])
+        except Exception as e:
+            logger.warning("Reading when models were last used failed: %s", e)
+            return {}
+        return {key[len(USED_KEY):]: at for key, at in used.items()}
+
+    def loading_everywhere(self, model):
+        """Whether every healthy backend is busy loading ``model``."""
+        self.sync_state()
+        healthy = [b for b in self.backends if b.healthy and not b.breaker.is_open]
+        return bool(healthy) and all(b.is_loading(model) for b in healthy)
+
+    def load(self, model):
+        """Requests in flight on ``model`` per healthy backend."""
+        healthy = sum(1 for b in self.backends if b.healthy and not b.breaker.is_open)
+        return self.in_flight_by_model[model_key(model)] / max(healthy, 1)
+
+    def _ranked(self, model):
+        # Warm backends first, then by load. Open breakers sort last: they only
+        # accept their single half-open probe once the cooldown has passed.
+        return sorted((b for b in self.backends if b.healthy), key=lambda b: (
+            b.breaker.is_open,
+            b.is_loading(model),
+            not b.has_model(model),
+            b.in_flight,
+            b.latency or 0,
+        ))
+
+    def check_health(self):
+        for backend in self.backends:
+            try:
+                response = httpx.get(f"{backend.host}/api/ps", timeout=OLLAMA_HEALTH_TIMEOUT)
+                response.raise_for_status()
+                models = {m["name"] for m in response.json().get("models", [])}
+            except (httpx.HTTPError, ValueError):
+                backend.healthy = False
+            else:
+                self.set_models(backend, models)
+                backend.healthy = True
+                if backend.breaker.is_open:
+                    backend.breaker.record_success()
+            backend.checked_at = time.monotonic()
+
+    def start_health_checks(self):
+        if self._health_thread is None and self.health_interval > 0:
+            self._health_thread = threading.Thread(target=self._health_loop, name="ollama-health", daemon=True)
+            self._health_thread.start()
+
+    def _health_loop(self):
+        while True:
+            self.check_health()
+            time.sleep(self.health_interval)
+
+    def snapshot(self):
+        return [backend.snapshot() for backend in self.backends]
+
+
+_routers = {}
+_routers_lock = threading.Lock()
+
+
+def get_router(hosts=None):
+    """Process-wide router for ``hosts`` (``OLLAMA_BACKENDS`` by default)."""
+    hosts = tuple(hosts or OLLAMA_BACKENDS)
+    router = _routers.get(hosts)
+    if router is None:
+        with _routers_lock:
+            router = _routers.get(hosts)
+            if router is None:
+                router = _routers[hosts] = OllamaRouter(hosts)
+                if len(hosts) > 1:
+                    router.start_health_checks()
+    return router
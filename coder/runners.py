@@ -0,0 +1,317 @@
+# coder/runners.py
+"""How each language in ``CODE_LANGUAGES`` is run in the sandbox.
+
+Python and SQL run inside the sandbox's template process (SQL against a
+fresh in-memory SQLite database). Everything else uses a locally installed
+toolchain, found on ``PATH`` once at startup (``resolve_toolchains``). A
+language whose toolchain is missing, or out of the sandbox user's reach, is
+reported as unavailable instead of failing at run time.
+
+Compiled languages build in the sandbox too, with roomier limits, under the
+same admission slot as the run that follows. The binary is kept in
+``SANDBOX_ARTIFACT_DIR`` under a hash of the source and the toolchain
+version, so running unchanged code again skips the compiler. Builds never
+write to a cache another build reads: a toolchain's shared build cache is
+filled by the server itself and read-only to the sandbox user, and without
+one each build caches under its own temp dir.
+"""
+import hashlib
+import logging
+import os
+import shutil
+import stat
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .sandbox import JobTooLarge, SandboxError, default_limits, sandbox
+from .settings import (
+    SANDBOX_ARTIFACT_DIR,
+    SANDBOX_ARTIFACT_MAX,
+    SANDBOX_COMPILE_MEMORY_MB,
+    SANDBOX_CODE_BYTES,
+    SANDBOX_COMPILE_SECONDS,
+    SANDBOX_SEED_SECONDS,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class RunnerUnavailable(SandboxError):
+    pass
+
+
+class Runner:
+    """One language: where its toolchain is, how to build and run a snippet, and its limits.
+
+    ``compile`` and ``run`` are argv templates; ``{tool}`` is replaced by the
+    toolchain's path. The snippet is written to ``source`` in the job's
+    working directory, and a compile step must leave its binary at ``main``.
+    ``cache`` names the environment variable of the compiler's build cache
+    and ``seed`` the command that fills it (see ``seed_cache``).
+    """
+
+    binary = "main"
+
+    def __init__(self, language, kind="exec", tool=None, source=None, run=None, compile=None,
+                 version=("--version",), locate=None, limits=None, env=None, cache=None, seed=None):
+        self.language = language
+        self.kind = kind
+        self.tool = tool
+        self.source = source
+        self.run = run
+        self.compile = compile
+        self.version_args = list(version)
+        # A command printing the tool's real path, for version-manager shims
+        # that don't work in the sandbox's bare environment.
+        self.locate = locate
+        self.limits = {**default_limits(), **(limits or {})}
+        self.env = env or {}
+        self.cache = cache
+        self.seed = seed
+        # Set once the shared build cache is filled; until then builds cache privately.
+        self.shared_cache = None
+        self._path = None
+        self._version = None
+        self._resolved = False
+        self._lock = threading.Lock()
+
+    @property
+    def available(self):
+        return self.kind != "exec" or self.path is not None
+
+    @property
+    def path(self):
+        self.resolve()
+        return self._path or None
+
+    @property
+    def version(self):
+        self.resolve()
+        return self._version
+
+    def resolve(self):
+        """Find the toolchain and its version; probed once, normally by ``resolve_toolchains`` at startup."""
+        if self._resolved:
+            return
+        with self._lock:
+            if self._resolved or not self.tool:
+                self._resolved = True
+                return
+            path = shutil.which(self.tool)
+            if path and self.locate:
+                found = self._probe([path if arg == "{tool}" else arg for arg in self.locate])
+                path = found if found and os.path.isfile(found) else path
+            if path and not reachable_by_sandbox(path):
+                logger.warning("%s is at %s, which the sandbox user %s can't reach; %s is unavailable",
+                               self.tool, path, sandbox.user, self.language)
+                path = None
+            self._path = path or ""
+            self._version = self._probe([path, *self.version_args]) if path else ""
+            self._resolved = True
+
+    def seed_cache(self):
+        """Fill the shared build cache from the toolchain alone, as the server's own user.
+
+        Only when the sandbox runs jobs as another user, who can read the cache but
+        not write to it, so no snippet can plant entries another build would use.
+        """
+        if not (self.cache and self.seed and self.path and sandbox.drops_privileges):
+            return
+        directory = os.path.join(artifact_dir(), f"{self.language}-cache")
+        env = {**os.environ, **self.env, self.cache: directory}
+        try:
+            subprocess.run([self.path if arg == "{tool}" else arg for arg in self.seed], env=env,
+                           capture_output=True, check=True, timeout=SANDBOX_SEED_SECONDS)
+        except (OSError, subprocess.SubprocessError) as e:
+            logger.warning("Seeding the %s build cache failed: %s", self.language, e)
+            return
+        self.shared_cache = directory
+
+    def prepare(self, code):
+        """Return ``(job, build)`` for running ``code``; call with an admission slot held, as ``open`` does.
+
+        ``build`` is the compile step's result (``{"cached": True}`` when the
+        binary was already built, ``None`` for interpreted languages); ``job``
+        is ``None`` when compilation failed.
+        """
+        if not self.available:
+            raise RunnerUnavailable(f"{self.tool} is not installed on this server, or not where the sandbox can run it")
+        if self.kind != "exec":
+            return {"kind": self.kind, "code": code, "limits": self.limits, "language": self.language}, None
+        if not self.compile:
+            return self.job(self.run, {self.source: code}), None
+
+        artifact = self.artifact_path(code)
+        if os.path.exists(artifact):
+            os.utime(artifact)
+            return self.job([artifact]), {"cached": True}
+        artifact_dir()
+        build = sandbox.collect(sandbox.submit({
+            **self.job(self.compile, {self.source: code}, compile_limits(), self.build_env()),
+            "artifact": {"name": self.binary, "path": artifact},
+        }))
+        build["cached"] = False
+        if not build.get("artifact"):
+            return None, build
+        prune_artifacts()
+        return self.job([artifact]), build
+
+    def open(self, code, user=None):
+        """Build ``code`` if needed and start it; returns ``(execution, build)``.
+
+        The build and the run share one sandbox admission slot, so compiles
+        queue fairly with every other job and hold no second slot. Raises
+        ``AdmissionRejected`` like ``Sandbox.open``, and ``JobTooLarge`` for code
+        over ``SANDBOX_CODE_BYTES``; ``execution`` is ``None`` when the build failed.
+        """
+        if len(code.encode()) > SANDBOX_CODE_BYTES:
+            raise JobTooLarge(f"Code is limited to {SANDBOX_CODE_BYTES // 1024} KiB")
+        ticket = sandbox.admission.acquire(user)
+        try:
+            job, build = self.prepare(code)
+            if job is None:
+                sandbox.admission.release(ticket)
+                return None, build
+            return sandbox.submit(job, on_close=lambda: sandbox.admission.release(ticket)), build
+        except BaseException:
+            sandbox.admission.release(ticket)
+            raise
+
+    def build_env(self):
+        # Without a shared cache the compiler's default lives under $HOME, the build's own temp dir.
+        if self.cache and self.shared_cache:
+            return {**self.env, self.cache: self.shared_cache}
+        return self.env
+
+    def job(self, argv, files=None, limits=None, env=None):
+        argv = [self.path if arg == "{tool}" else arg for arg in argv]
+        return {
+            "kind": "exec", "argv": argv, "files": files or {}, "env": self.env if env is None else env,
+            "limits": limits or self.limits, "language": self.language,
+        }
+
+    def artifact_path(self, code):
+        key = hashlib.sha256(f"{self.language}\0{self.version}\0{code}".encode()).hexdigest()
+        return os.path.join(SANDBOX_ARTIFACT_DIR, f"{self.language}-{key}")
+
+    def _probe(self, argv):
+        try:
+            result = subprocess.run(argv, capture_output=True, text=True, timeout=10)
+        except (OSError, subprocess.TimeoutExpired):
+            return ""
+        output = (result.stdout or result.stderr).strip()
+        return output.splitlines()[0] if output else ""
+
+
+def artifact_dir():
+    os.makedirs(SANDBOX_ARTIFACT_DIR, exist_ok=True)
+    return SANDBOX_ARTIFACT_DIR
+
+
+def reachable_by_sandbox(path):
+    """Whether the sandbox user may execute ``path``: every directory above it searchable by others.
+
+    Only matters when the sandbox drops root; a toolchain under root's home, say, is out of reach.
+    """
+    if not sandbox.drops_privileges:
+        return True
+    path = os.path.realpath(path)
+    while True:
+        try:
+            if not os.stat(path).st_mode & stat.S_IXOTH:
+                return False
+        except OSError:
+            return False
+        parent = os.path.dirname(path)
+        if parent == path:
+            return True
+        path = parent
+
+
+def compile_limits():
+    return {
+        **default_limits(),
+        "cpu_seconds": int(SANDBOX_COMPILE_SECONDS),
+        "wall_seconds": SANDBOX_COMPILE_SECONDS,
+        "memory_mb": SANDBOX_COMPILE_MEMORY_MB,
+        "open_files": 256,
+        "file_bytes": 256 * 1024 * 1024,
+        # Compiler drivers fork the compiler proper, assembler and linker.
+        "processes": 256,
+    }
+
+
+def prune_artifacts():
+    try:
+        entries = [entry for entry in os.scandir(SANDBOX_ARTIFACT_DIR) if entry.is_file()]
+    except OSError:
+        return
+    if len(entries) <= SANDBOX_ARTIFACT_MAX:
+        return
+    entries.sort(key=lambda entry: entry.stat().st_mtime)
+    for entry in entries[:len(entries) - SANDBOX_ARTIFACT_MAX]:
+        try:
+            os.remove(entry.path)
+        except OSError:
+            pass
+
+
+# Runtimes that start helper threads; RLIMIT_NPROC counts threads too.
+THREADED = {"processes": 64}
+
+RUNNERS = {}
+
+
+def register(runner, *aliases):
+    for name in (runner.language, *aliases):
+        RUNNERS[name] = runner
+    return runner
+
+
+def get_runner(language):
+    return RUNNERS.get(language)
+
+
+def resolve_toolchains():
+    """Probe every toolchain in parallel, then fill the shared build caches; run once at startup."""
+    runners = list(dict.fromkeys(RUNNERS.values()))
+    with ThreadPoolExecutor(max_workers=len(runners)) as pool:
+        list(pool.map(Runner.resolve, runners))
+    for runner in runners:
+        runner.seed_cache()
+
+register(Runner("python", kind="python"))
+register(Runner("sql", kind="sql"))
+register(Runner("shell", tool="bash", source="main.sh", run=["{tool}", "main.sh"], limits={"processes": 64}), "bash")
+register(Runner(
+    "javascript", tool="node", source="main.js",
+    # V8 reserves a large address range up front, so cap its heap instead.
+    run=["{tool}", "--max-old-space-size=256", "main.js"],
+    limits={"memory_mb": 16384, **THREADED},
+))
+register(Runner(
+    "ruby", tool="ruby", source="main.rb", run=["{tool}", "main.rb"],
+    # Ruby 3.3 maps a large object-shape table at startup.
+    locate=["{tool}", "-e", "print RbConfig.ruby"], limits={"memory_mb": 1024, **THREADED},
+))
+register(Runner("php", tool="php", source="main.php", run=["{tool}", "main.php"]))
+register(Runner(
+    "java", tool="java", source="Main.java", run=["{tool}", "-Xmx256m", "Main.java"], version=["-version"],
+    limits={"memory_mb": 16384, "cpu_seconds": 10, "wall_seconds": 10, **THREADED},
+))
+register(Runner("c", tool="gcc", source="main.c", compile=["{tool}", "-O2", "-o", "main", "main.c", "-lm"]))
+register(Runner(
+    "cpp", tool="g++", source="main.cpp", compile=["{tool}", "-O2", "-std=c++17", "-o", "main", "main.cpp"]
+), "clike")
+register(Runner(
+    "go", tool="go", source="main.go", compile=["{tool}", "build", "-o", "main", "main.go"], version=["version"],
+    # The standard library compiles once, into the shared cache. Never fetch toolchains.
+    # The Go runtime reserves address space up front; GOMEMLIMIT bounds its heap instead.
+    cache="GOCACHE", seed=["{tool}", "build", "std"], env={"GOTOOLCHAIN": "local", "GOMEMLIMIT": "256MiB"},
+    limits={"memory_mb": 16384, **THREADED},
+))
+register(Runner(
+    "rust", tool="rustc", source="main.rs", compile=["{tool}", "-O", "-o", "main", "main.rs"],
+    locate=["rustup", "which", "rustc"],
+))
@@ -0,0 +1,285 @@
+# coder/sandbox.py
+"""Run user snippets in forked, resource-limited sandbox processes.
+
+A single template process (``sandbox_worker.py``) is started per web worker
+with common modules already imported; each job is a fresh fork of it with
+rlimits on CPU, memory, open files, file size and process count, a private
+temp dir and a wall-clock timeout. Started as root, the template runs each
+job as ``SANDBOX_USER``, since root is exempt from the process limit. Jobs pass through an admission controller
+so bursts queue (bounded, fair across users) instead of forking without
+limit.
+"""
+import codecs
+import errno
+import json
+import os
+import selectors
+import socket
+import subprocess
+import sys
+import threading
+
+from .admission import AdmissionController
+from .metrics import SANDBOX_WALL
+from .settings import (
+    SANDBOX_CPU_SECONDS,
+    SANDBOX_FILE_BYTES,
+    SANDBOX_MAX_CONCURRENCY,
+    SANDBOX_MAX_PER_USER,
+    SANDBOX_MEMORY_MB,
+    SANDBOX_OPEN_FILES,
+    SANDBOX_OUTPUT_BYTES,
+    SANDBOX_PRELOAD,
+    SANDBOX_QUEUE_SIZE,
+    SANDBOX_QUEUE_TIMEOUT,
+    SANDBOX_USER,
+    SANDBOX_WALL_SECONDS,
+)
+
+WORKER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sandbox_worker.py")
+# A line longer than this is sent in pieces rather than held back.
+MAX_LINE = 4096
+
+
+class SandboxError(Exception):
+    pass
+
+
+class JobTooLarge(SandboxError):
+    pass
+
+
+def default_limits():
+    return {
+        "cpu_seconds": SANDBOX_CPU_SECONDS,
+        "wall_seconds": SANDBOX_WALL_SECONDS,
+        "memory_mb": SANDBOX_MEMORY_MB,
+        "open_files": SANDBOX_OPEN_FILES,
+        "file_bytes": SANDBOX_FILE_BYTES,
+        "processes": 0,
+    }
+
+
+class Execution:
+    """Handle on one running job: its output pipes and, at the end, its exit status."""
+
+    def __init__(self, stdout, stderr, status, output_limit, on_close=None, language="unknown"):
+        self.pipes = {stdout: "stdout", stderr: "stderr"}
+        self.status = status
+        self.open_fds = {stdout, stderr, status}
+        self.output_limit = output_limit
+        self.output_bytes = 0
+        self.truncated = False
+        self.on_close = on_close
+        self.language = language
+
+    def chunks(self):
+        """Yield ``(stream, bytes)`` as the job writes, then ``("exit", result)``.
+
+        Both pipes are watched together, so a job filling stderr while we wait
+        on stdout can't wedge either side.
+        """
+        selector = selectors.DefaultSelector()
+        for fd in self.pipes:
+            os.set_blocking(fd, False)
+            selector.register(fd, selectors.EVENT_READ)
+        try:
+            while selector.get_map():
+                for key, _ in selector.select():
+                    data = os.read(key.fd, 65536)
+                    if not data:
+                        selector.unregister(key.fd)
+                        self._close(key.fd)
+                        continue
+                    room = self.output_limit - self.output_bytes
+                    self.output_bytes += len(data)
+                    if len(data) > room:
+                        # Closing our ends makes the job's next write fail with EPIPE.
+                        self.truncated = True
+                        if room > 0:
+                            yield self.pipes[key.fd], data[:room]
+                        for fd in list(selector.get_map()):
+                            selector.unregister(fd)
+                            self._close(fd)
+                        break
+                    yield self.pipes[key.fd], data
+        finally:
+            selector.close()
+        yield "exit", self.result()
+
+    def lines(self):
+        """Like ``chunks`` but decoded and split into lines per stream.
+
+        A partial line is held until its newline arrives, the stream ends or
+        it reaches ``MAX_LINE`` characters.
+        """
+        decoders = {stream: codecs.getincrementaldecoder("utf-8")(errors="replace") for stream in self.pipes.values()}
+        pending = dict.fromkeys(decoders, "")
+        for stream, data in self.chunks():
+            if stream == "exit":
+                for name, decoder in decoders.items():
+                    rest = pending[name] + decoder.decode(b"", final=True)
+                    if rest:
+                        yield name, rest
+                yield stream, data
+                return
+            text = pending[stream] + decoders[stream].decode(data)
+            *complete, pending[stream] = text.split("\n")
+            for line in complete:
+                yield stream, line + "\n"
+            while len(pending[stream]) >= MAX_LINE:
+                yield stream, pending[stream][:MAX_LINE]
+                pending[stream] = pending[stream][MAX_LINE:]
+
+    def result(self):
+        parts = []
+        while True:
+            data = os.read(self.status, 4096)
+            if not data:
+                break
+            parts.append(data)
+        self._close(self.status)
+        raw = b"".join(parts)
+        if not raw:
+            raise SandboxError("The sandbox exited without reporting a result")
+        result = json.loads(raw)
+        result["truncated"] = self.truncated
+        if "wall_time" in result:
+            SANDBOX_WALL.observe(result["wall_time"], language=self.language)
+        return result
+
+    def close(self):
+        """Release the pipes; closing them early stops the job at its next write."""
+        for fd in list(self.open_fds):
+            self._close(fd)
+        if self.on_close is not None:
+            self.on_close()
+            self.on_close = None
+
+    def _close(self, fd):
+        if fd in self.open_fds:
+            self.open_fds.discard(fd)
+            os.close(fd)
+
+
+class Sandbox:
+    def __init__(self, limits=None, output_limit=SANDBOX_OUTPUT_BYTES, preload=SANDBOX_PRELOAD, user=SANDBOX_USER):
+        self.limits = limits or default_limits()
+        self.output_limit = output_limit
+        self.preload = preload
+        self.user = user
+        # The template drops root before running jobs (see sandbox_worker.py).
+        self.drops_privileges = hasattr(os, "geteuid") and os.geteuid() == 0
+        self.available = hasattr(os, "fork") and hasattr(socket, "send_fds")
+        self.admission = AdmissionController(
+            max_concurrency=SANDBOX_MAX_CONCURRENCY,
+            max_per_user=SANDBOX_MAX_PER_USER,
+            queue_size=SANDBOX_QUEUE_SIZE,
+            queue_per_user=SANDBOX_MAX_PER_USER * 4,
+            queue_timeout=SANDBOX_QUEUE_TIMEOUT,
+            subject="code runs",
+        )
+        self._process = None
+        self._socket = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._process is None or self._process.poll() is not None:
+                self._spawn()
+
+    def _spawn(self):
+        if self._process is not None:
+            # Closing its socket makes the old template exit; reap it rather than leave a zombie.
+            self._socket.close()
+            self._socket = None
+            try:
+                self._process.wait(1)
+            except subprocess.TimeoutExpired:
+                self._process.kill()
+                self._process.wait()
+        kind = getattr(socket, "SOCK_SEQPACKET", socket.SOCK_DGRAM)
+        ours, theirs = socket.socketpair(socket.AF_UNIX, kind)
+        self._process = subprocess.Popen(
+            [sys.executable, "-I", WORKER_PATH, str(theirs.fileno()), ",".join(self.preload), self.user],
+            pass_fds=[theirs.fileno()],
+            stdin=subprocess.DEVNULL,
+        )
+        theirs.close()
+        self._socket = ours
+
+    def submit(self, job, on_close=None):
+        """Start ``job`` in a fresh sandbox process and return its ``Execution``."""
+        if not self.available:
+            raise SandboxError("Code execution needs a POSIX host")
+        job = {"limits": self.limits, **job}
+        message = json.dumps(job).encode()
+        stdout_r, stdout_w = os.pipe()
+        stderr_r, stderr_w = os.pipe()
+        status_r, status_w = os.pipe()
+        try:
+            self.start()
+            for attempt in range(2):
+                try:
+                    with self._lock:
+                        socket.send_fds(self._socket, [message], [stdout_w, stderr_w, status_w])
+                    break
+                except OSError as e:
+                    if e.errno == errno.EMSGSIZE:
+                        raise JobTooLarge(f"The job is too large for the sandbox ({len(message)} bytes)")
+                    # The template died (OOM killer, manual kill); start a new one once.
+                    if attempt:
+                        raise SandboxError("The sandbox is not accepting jobs")
+                    with self._lock:
+                        self._spawn()
+        except BaseException:
+            for fd in (stdout_r, stderr_r, status_r):
+                os.close(fd)
+            raise
+        finally:
+            for fd in (stdout_w, stderr_w, status_w):
+                os.close(fd)
+        return Execution(stdout_r, stderr_r, status_r, self.output_limit, on_close, job.get("language", "unknown"))
+
+    def open(self, job, user=None):
+        """Admit and start ``job``; the slot is given back when the ``Execution`` is closed.
+
+        Waits for a slot first and raises ``AdmissionRejected`` if none frees up.
+        """
+        ticket = self.admission.acquire(user)
+        try:
+            return self.submit(job, on_close=lambda: self.admission.release(ticket))
+        except BaseException:
+            self.admission.release(ticket)
+            raise
+
+    def run(self, job, user=None):
+        """Run ``job`` to completion; returns the exit result plus ``stdout`` and ``stderr`` text."""
+        return self.collect(self.open(job, user))
+
+    @staticmethod
+    def collect(execution):
+        """Wait for ``execution`` to finish and close it; returns what ``run`` does."""
+        output = {"stdout": [], "stderr": []}
+        try:
+            for stream, data in execution.chunks():
+                if stream == "exit":
+                    result = data
+                else:
+                    output[stream].append(data)
+        finally:
+            execution.close()
+        for stream, parts in output.items():
+            result[stream] = b"".join(parts).decode(errors="replace")
+        return result
+
+    def stats(self):
+        return {
+            "available": self.available,
+            "template_pid": self._process.pid if self._process else None,
+            **self.admission.stats(),
+        }
+
+
+sandbox = Sandbox()
+
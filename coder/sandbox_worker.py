@@ -0,0 +1,252 @@
+# coder/sandbox_worker.py
+"""Template ("zygote") process for the code execution sandbox.
+
+Started once by ``coder.sandbox`` as
+``python -I sandbox_worker.py <fd> <preload> <user>``.
+It imports nothing from Django, preloads common modules, then waits for jobs
+on a Unix socket. Each job arrives with the write ends of its
+stdout, stderr and status pipes (passed as file descriptors) and is served
+by forking:
+
+    zygote -> supervisor (enforces wall time, reports exit status and rusage)
+               -> runner (drops root, rlimits, private temp dir, runs the snippet)
+
+so every run gets a fresh process without paying interpreter startup. The
+kernel doesn't apply RLIMIT_NPROC to root, so when started as root the
+runner switches to ``<user>`` first; if that user doesn't exist the zygote
+refuses to start rather than run snippets as root.
+"""
+import json
+import os
+import pwd
+import resource
+import shutil
+import signal
+import socket
+import sqlite3
+import sys
+import tempfile
+import time
+import traceback
+
+MAX_MESSAGE = 4 * 1024 * 1024
+
+
+def apply_limits(limits):
+    memory = limits["memory_mb"] * 1024 * 1024
+    for name, value in (
+        ("RLIMIT_CPU", limits["cpu_seconds"]),
+        ("RLIMIT_AS", memory),
+        ("RLIMIT_NOFILE", limits["open_files"]),
+        ("RLIMIT_FSIZE", limits["file_bytes"]),
+        # Counted per user, so 0 stops the snippet from forking at all.
+        ("RLIMIT_NPROC", limits["processes"]),
+        ("RLIMIT_CORE", 0),
+    ):
+        if hasattr(resource, name):
+            try:
+                resource.setrlimit(getattr(resource, name), (value, value))
+            except (ValueError, OSError):
+                pass
+
+
+def sandbox_user(name):
+    """``(uid, gid)`` to run jobs as: ``name``'s when we are root, else our own."""
+    if os.geteuid() != 0:
+        return os.getuid(), os.getgid()
+    try:
+        user = pwd.getpwnam(name)
+    except KeyError:
+        sys.exit(f"sandbox: refusing to run snippets as root and there is no user {name!r} (SANDBOX_USER)")
+    if user.pw_uid == 0:
+        sys.exit("sandbox: refusing to run snippets as root (SANDBOX_USER)")
+    return user.pw_uid, user.pw_gid
+
+
+def drop_privileges(uid, gid):
+    if os.geteuid() == 0:
+        os.setgroups([])
+        os.setgid(gid)
+        os.setuid(uid)
+
+
+def run_python(job):
+    sys.argv = ["<snippet>"]
+    namespace = {"__name__": "__main__", "__builtins__": __builtins__}
+    try:
+        exec(compile(job["code"], "<snippet>", "exec"), namespace)
+    except SystemExit as e:
+        if e.code is None or isinstance(e.code, int):
+            return e.code or 0
+        print(e.code, file=sys.stderr)
+        return 1
+    except BaseException:
+        traceback.print_exc()
+        return 1
+    return 0
+
+
+def run_sql(job):
+    """Run the script against a fresh in-memory SQLite database, printing each result set."""
+    db = sqlite3.connect(":memory:", isolation_level=None)
+    statement = ""
+    # Split after every ";" and keep going until the text so far is a whole
+    # statement. The last piece gets its ";" on a new line in case it ends in a comment.
+    pieces = job["code"].split(";")
+    for i, piece in enumerate(pieces):
+        statement += piece + ("\n;" if i == len(pieces) - 1 else ";")
+        if not sqlite3.complete_statement(statement):
+            continue
+        try:
+            cursor = db.execute(statement)
+            if cursor.description:
+                print("\t".join(column[0] for column in cursor.description))
+                for row in cursor:
+                    print("\t".join("NULL" if value is None else str(value) for value in row))
+        except sqlite3.Error as e:
+            print(f"Error: {e}", file=sys.stderr)
+            return 1
+        statement = ""
+    if statement.strip(" \t\r\n;"):
+        print("Error: incomplete statement at end of input", file=sys.stderr)
+        return 1
+    return 0
+
+
+def run_exec(job):
+    """Write the job's files into the working directory and exec its command."""
+    for name, content in job.get("files", {}).items():
+        with open(name, "w") as f:
+            f.write(content)
+    os.environ.update(job.get("env", {}))
+    os.execve(job["argv"][0], job["argv"], os.environ)
+
+
+RUNNERS = {"python": run_python, "sql": run_sql, "exec": run_exec}
+
+
+def runner(job, stdout_fd, stderr_fd, workdir, user):
+    os.setsid()
+    signal.signal(signal.SIGPIPE, signal.SIG_DFL)
+    devnull = os.open(os.devnull, os.O_RDONLY)
+    os.dup2(devnull, 0)
+    os.dup2(stdout_fd, 1)
+    os.dup2(stderr_fd, 2)
+    os.closerange(3, 65536)
+    os.chdir(workdir)
+    os.environ.clear()
+    os.environ.update({"HOME": workdir, "TMPDIR": workdir, "PATH": "/usr/local/bin:/usr/bin:/bin", "LANG": "C.UTF-8"})
+    tempfile.tempdir = workdir
+    sys.stdin = open(0, "r", closefd=False)
+    sys.stdout = open(1, "w", buffering=1, closefd=False)
+    sys.stderr = open(2, "w", buffering=1, closefd=False)
+    # Before the rlimits: setuid checks the new user against RLIMIT_NPROC.
+    drop_privileges(*user)
+    apply_limits(job["limits"])
+    code = RUNNERS[job["kind"]](job)
+    sys.stdout.flush()
+    sys.stderr.flush()
+    os._exit(code)
+
+
+def supervise(job, user, stdout_fd, stderr_fd, status_fd):
+    signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+    workdir = tempfile.mkdtemp(prefix="sandbox-")
+    os.chown(workdir, *user)
+    started = time.monotonic()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            os.close(status_fd)
+            runner(job, stdout_fd, stderr_fd, workdir, user)
+        except BaseException:
+            traceback.print_exc()
+        finally:
+            os._exit(127)
+    os.close(stdout_fd)
+    os.close(stderr_fd)
+
+    timed_out = []
+
+    def on_timeout(signum, frame):
+        timed_out.append(True)
+        try:
+            os.killpg(pid, signal.SIGKILL)
+        except OSError:
+            pass
+
+    signal.signal(signal.SIGALRM, on_timeout)
+    signal.setitimer(signal.ITIMER_REAL, job["limits"]["wall_seconds"])
+    _, status, usage = os.wait4(pid, 0)
+    signal.setitimer(signal.ITIMER_REAL, 0)
+    try:
+        # Anything the snippet left running in its session goes too.
+        os.killpg(pid, signal.SIGKILL)
+    except OSError:
+        pass
+    artifact = job.get("artifact")
+    kept = False
+    if artifact and os.WIFEXITED(status) and os.WEXITSTATUS(status) == 0 and not timed_out:
+        # Keep the build output: copy beside the target, then rename into place.
+        try:
+            partial = f"{artifact['path']}.{os.getpid()}"
+            shutil.copy2(os.path.join(workdir, artifact["name"]), partial)
+            os.replace(partial, artifact["path"])
+            kept = True
+        except OSError:
+            pass
+    shutil.rmtree(workdir, ignore_errors=True)
+    result = {
+        "exit_code": os.waitstatus_to_exitcode(status),
+        "timed_out": bool(timed_out),
+        "wall_time": round(time.monotonic() - started, 4),
+        "cpu_time": round(usage.ru_utime + usage.ru_stime, 4),
+        "max_rss_kb": usage.ru_maxrss,
+    }
+    if artifact:
+        result["artifact"] = kept
+    os.write(status_fd, json.dumps(result).encode())
+    os.close(status_fd)
+
+
+def serve(sock, user):
+    # Supervisors are reaped automatically; the zygote never waits on them.
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+    while True:
+        try:
+            message, fds, flags, _ = socket.recv_fds(sock, MAX_MESSAGE, 3)
+        except InterruptedError:
+            continue
+        if not message:
+            return
+        try:
+            if flags & socket.MSG_TRUNC:
+                raise ValueError("truncated")
+            job = json.loads(message)
+        except ValueError:
+            # Closing the pipes unreported tells the caller the job failed.
+            for fd in fds:
+                os.close(fd)
+            continue
+        if os.fork() == 0:
+            sock.close()
+            try:
+                supervise(job, user, *fds)
+            finally:
+                os._exit(0)
+        for fd in fds:
+            os.close(fd)
+
+
+def preload(modules):
+    for name in modules:
+        try:
+            __import__(name)
+        except ImportError:
+            pass
+
+
+if __name__ == "__main__":
+    user = sandbox_user(sys.argv[3] if len(sys.argv) > 3 else "nobody")
+    preload(sys.argv[2].split(",") if len(sys.argv) > 2 and sys.argv[2] else [])
+    serve(socket.socket(fileno=int(sys.argv[1])), user)
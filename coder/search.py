@@ -0,0 +1,162 @@
+# coder/search.py
+"""Full-text search over interaction history.
+
+Interaction text is stored compressed, so every completed interaction also
+has an ``InteractionSearchDocument`` holding its prompt, response and code
+snippet as plain text, rewritten when any of them changes. Background jobs' interactions are indexed once they finish. On MariaDB/MySQL the documents
+carry a FULLTEXT index; on SQLite an FTS5 table, kept in step by triggers,
+indexes them. Both are created by migration 0006. Any other database, or a
+SQLite build without FTS5, falls back to scanning one user's documents with
+``LIKE``, newest first.
+
+Every word of the query must match, as a prefix of a word in the text.
+"""
+import html
+import re
+
+from django.db import connection
+from django.db.models import FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+from .models import CodeInteraction, CodeSession, InteractionSearchDocument
+
+FTS_TABLE = "coder_search_fts"
+
+WORD_RE = re.compile(r"\w+")
+# Longer queries are cut to this many words.
+MAX_WORDS = 8
+# InnoDB's default innodb_ft_min_token_size; shorter words are not in the index.
+FULLTEXT_MIN_WORD = 3
+
+
+def query_words(query):
+    """Distinct lower-cased words of ``query``, in order."""
+    return list(dict.fromkeys(WORD_RE.findall(query.lower())))[:MAX_WORDS]
+
+
+class FulltextBackend:
+    name = "fulltext"
+
+    def match(self, documents, words):
+        words = [word for word in words if len(word) >= FULLTEXT_MIN_WORD]
+        if not words:
+            return documents.none()
+        # Column names stay unqualified: the table is aliased when this ends up
+        # in a subquery, and no table joined in has columns of the same name.
+        score = RawSQL(
+            "MATCH (prompt, response) AGAINST (%s IN BOOLEAN MODE)",
+            [" ".join(f"+{word}*" for word in words)],
+            output_field=FloatField(),
+        )
+        return documents.annotate(score=score).filter(score__gt=0)
+
+
+class FTS5Backend:
+    name = "fts5"
+
+    def match(self, documents, words):
+        if not words:
+            return documents.none()
+        expression = " ".join(f'"{word}"*' for word in words)
+        matching = RawSQL(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [expression])
+        # FTS5's rank is bm25, where lower is better. interaction_id is the
+        # outer document's; the FTS table has no such column.
+        score = RawSQL(
+            f"SELECT -rank FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s AND rowid = interaction_id",
+            [expression],
+            output_field=FloatField(),
+        )
+        return documents.filter(interaction_id__in=matching).annotate(score=score)
+
+
+class ScanBackend:
+    name = "scan"
+
+    def match(self, documents, words):
+        if not words:
+            return documents.none()
+        for word in words:
+            documents = documents.filter(Q(prompt__icontains=word) | Q(response__icontains=word))
+        return documents.annotate(score=Value(0.0, output_field=FloatField()))
+
+
+_backend = None
+
+
+def backend():
+    global _backend
+    if _backend is None:
+        if connection.vendor == "mysql":
+            _backend = FulltextBackend()
+        elif connection.vendor == "sqlite" and FTS_TABLE in connection.introspection.table_names():
+            _backend = FTS5Backend()
+        else:
+            _backend = ScanBackend()
+    return _backend
+
+
+def matching(query, documents=None):
+    """Documents matching ``query``, annotated with ``score`` (higher is better)."""
+    if documents is None:
+        documents = InteractionSearchDocument.objects.all()
+    return backend().match(documents, query_words(query))
+
+
+def search(user, query):
+    """``user``'s interactions matching ``query``, best first, as search documents."""
+    documents = InteractionSearchDocument.objects.filter(user=user).select_related('session').only(
+        'interaction_id', 'session__title', 'language', 'created_at', 'prompt', 'response'
+    )
+    return matching(query, documents).order_by('-score', '-created_at')
+
+
+def document_for(interaction, user_id):
+    return InteractionSearchDocument(
+        interaction_id=interaction.pk,
+        user_id=user_id,
+        session_id=interaction.session_id,
+        language=interaction.language,
+        created_at=interaction.created_at,
+        prompt=interaction.prompt,
+        response=document_response(interaction),
+    )
+
+
+def document_response(interaction):
+    # The snippet is the response's code after formatting, so its text can differ.
+    response, snippet = interaction.response, interaction.code_snippet
+    if snippet and snippet not in response:
+        return f"{response}\n\n{snippet}"
+    return response
+
+
+def index_interaction(interaction, created=False):
+    """Write the search document for a completed ``interaction``; ``created`` saves the update attempt."""
+    if interaction.status != CodeInteraction.DONE:
+        return
+    if CodeInteraction.session.is_cached(interaction):
+        user_id = interaction.session.user_id
+    else:
+        user_id = CodeSession.objects.values_list('user_id', flat=True).get(id=interaction.session_id)
+    document_for(interaction, user_id).save(force_insert=created)
+
+
+def highlight(text, words, fragments=3, context=60):
+    """Up to ``fragments`` HTML-escaped excerpts of ``text`` with each match in ``<mark>``."""
+    if not words:
+        return []
+    pattern = re.compile(r"\b(?:%s)\w*" % "|".join(re.escape(word) for word in words), re.IGNORECASE)
+    excerpts = []
+    end = 0
+    for match in pattern.finditer(text):
+        if match.start() < end:
+            continue
+        start = max(match.start() - context, end)
+        end = min(match.end() + context, len(text))
+        window = text[start:end]
+        marked = pattern.sub(lambda m: f"\0{m.group()}\1", window)
+        escaped = html.escape(marked).replace("\0", "<mark>").replace("\1", "</mark>")
+        excerpts.append(("…" if start else "") + " ".join(escaped.split()) + ("…" if end < len(text) else ""))
+        if len(excerpts) == fragments:
+            break
+    return excerpts
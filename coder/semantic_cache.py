@@ -0,0 +1,427 @@
+# coder/semantic_cache.py
+"""Serve near-duplicate questions from earlier answers.
+
+Prompts are embedded (through Ollama's embed endpoint, or a feature-hashing
+stand-in for tests and offline use) and kept in a NumPy index per language and
+model. When a new prompt's cosine similarity to a stored one passes
+``SEMANTIC_CACHE_THRESHOLD`` the stored ``CodeInteraction.response`` is
+returned instead of generating again.
+
+To keep lookups sub-millisecond at 100k entries the index clusters its rows
+(a small IVF: k-means centroids over a sample), stores each cluster
+contiguously and only scans the clusters nearest to the query. Rows added
+since the last rebuild are filed under their nearest centroid until the next
+one, which runs in the background. Vectors can optionally live in read-only
+memory-mapped ``.npy`` files, shared by every process on the host, so the
+index survives restarts.
+"""
+import fcntl
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager, suppress
+from dataclasses import dataclass
+
+import numpy as np
+
+from .settings import (
+    SEMANTIC_CACHE_CAPACITY,
+    SEMANTIC_CACHE_DIM,
+    SEMANTIC_CACHE_DIR,
+    SEMANTIC_CACHE_EMBED_MODEL,
+    SEMANTIC_CACHE_EMBEDDER,
+    SEMANTIC_CACHE_ENABLED,
+    SEMANTIC_CACHE_NPROBE,
+    SEMANTIC_CACHE_SYNC_SECONDS,
+    SEMANTIC_CACHE_THRESHOLD,
+)
+
+logger = logging.getLogger(__name__)
+
+TOKEN_RE = re.compile(r"[a-z0-9_]+")
+# Files of a persisted snapshot; the large ones are memory-mapped.
+SNAPSHOT_ARRAYS = ("vectors", "keys", "used", "centroids", "offsets")
+MAPPED = ("vectors", "keys", "used")
+
+
+class HashingEmbedder:
+    """Deterministic bag of unigrams and bigrams hashed into ``dim`` buckets."""
+
+    def __init__(self, dim=SEMANTIC_CACHE_DIM):
+        self.dim = dim
+
+    def embed(self, text):
+        tokens = TOKEN_RE.findall(text.lower())
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for feature in tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]:
+            digest = hashlib.blake2b(feature.encode(), digest_size=8).digest()
+            bucket = int.from_bytes(digest[:4], "little") % self.dim
+            vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+        return vector
+
+
+class OllamaEmbedder:
+    def __init__(self, model=SEMANTIC_CACHE_EMBED_MODEL):
+        self.model = model
+
+    def embed(self, text):
+        # Imported lazily: services imports the router, which we don't need for hashing.
+        from .services import OllamaService
+        return np.asarray(OllamaService().embed(self.model, text), dtype=np.float32)
+
+
+def normalize(vector):
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+@dataclass
+class Snapshot:
+    """Rows stored contiguously by cluster; ``offsets[c]:offsets[c + 1]`` is cluster ``c``."""
+    vectors: np.ndarray
+    keys: np.ndarray
+    used: np.ndarray
+    centroids: np.ndarray = None
+    offsets: np.ndarray = None
+    # Rows when the centroids were computed.
+    clustered: int = 0
+
+    @classmethod
+    def empty(cls, dim):
+        return cls(np.zeros((0, dim), dtype=np.float32), np.zeros(0, dtype=np.int64), np.zeros(0))
+
+    def __len__(self):
+        return len(self.keys)
+
+
+class VectorIndex:
+    """Cosine index of ``key -> vector`` with LRU eviction.
+
+    Lookups read an immutable clustered snapshot plus the rows this process
+    added since (``pending``). Folding those into a new snapshot, and the
+    k-means behind it, runs on a background thread, so no request waits for
+    it. With a ``path`` the snapshot lives in read-only memory-mapped files
+    that every process maps. A process publishing its rows takes a file lock,
+    merges them into the latest snapshot and writes a new generation, which
+    the other processes pick up within ``sync_interval``.
+    """
+
+    min_clustered = 2048
+    evict_fraction = 0.1
+
+    def __init__(self, dim, capacity=SEMANTIC_CACHE_CAPACITY, nprobe=SEMANTIC_CACHE_NPROBE, path=None,
+                 sync_interval=SEMANTIC_CACHE_SYNC_SECONDS):
+        self.dim = dim
+        self.capacity = capacity
+        self.nprobe = nprobe
+        self.path = path
+        self.sync_interval = sync_interval
+        self.snapshot = Snapshot.empty(dim)
+        self.generation = 0
+        self.pending_vectors = np.zeros((64, dim), dtype=np.float32)
+        self.pending_keys = np.full(64, -1, dtype=np.int64)
+        self.pending_used = np.zeros(64)
+        self.pending = 0
+        # Pending rows per nearest centroid of the snapshot.
+        self.overflow = None
+        # Key -> time.time() of snapshot rows matched since they were last published.
+        self.touched = {}
+        self.compacting = False
+        self._checked_at = time.monotonic()
+        self._lock = threading.Lock()
+        self._compaction = threading.Lock()
+        if path is not None:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with self._file_lock():
+                self._install(*self._latest(), merged=0)
+
+    def __len__(self):
+        return len(self.snapshot) + self.pending
+
+    def add(self, key, vector):
+        vector = normalize(np.asarray(vector, dtype=np.float32))
+        with self._lock:
+            if self.pending == len(self.pending_keys):
+                self._grow()
+            row = self.pending
+            self.pending_vectors[row] = vector
+            self.pending_keys[row] = key
+            self.pending_used[row] = time.time()
+            self.pending += 1
+            if self.overflow is not None:
+                self.overflow[int(np.argmax(self.snapshot.centroids @ vector))].append(row)
+            self._maybe_compact()
+
+    def search(self, vector):
+        """Return ``(key, similarity)`` of the closest stored vector, or ``(None, 0.0)``."""
+        query = normalize(np.asarray(vector, dtype=np.float32))
+        with self._lock:
+            self._maybe_compact()
+            if not len(self):
+                return None, 0.0
+            best_score, best_row, in_snapshot = -np.inf, -1, True
+            for vectors, start, rows in self._candidates(query):
+                scores = vectors[start] if rows is None else vectors[start:rows]
+                scores = scores @ query
+                if not len(scores):
+                    continue
+                i = int(np.argmax(scores))
+                if scores[i] > best_score:
+                    best_score = scores[i]
+                    best_row = int(start[i]) if rows is None else start + i
+                    in_snapshot = vectors is self.snapshot.vectors
+            if in_snapshot:
+                key = int(self.snapshot.keys[best_row])
+                self.touched[key] = time.time()
+            else:
+                key = int(self.pending_keys[best_row])
+                self.pending_used[best_row] = time.time()
+            return key, float(best_score)
+
+    def _candidates(self, query):
+        """Blocks of rows to score: ``(vectors, start, stop)`` slices or ``(vectors, row_ids, None)``."""
+        snapshot = self.snapshot
+        if snapshot.centroids is None:
+            yield snapshot.vectors, 0, len(snapshot)
+            yield self.pending_vectors, 0, self.pending
+            return
+        nprobe = min(self.nprobe, len(snapshot.centroids))
+        for c in np.argpartition(-(snapshot.centroids @ query), nprobe - 1)[:nprobe]:
+            # Clustered rows are stored contiguously, so scoring them needs no copy.
+            yield snapshot.vectors, int(snapshot.offsets[c]), int(snapshot.offsets[c + 1])
+            if self.overflow[c]:
+                yield self.pending_vectors, np.asarray(self.overflow[c]), None
+
+    def _grow(self):
+        size = 2 * len(self.pending_keys)
+        self.pending_vectors = np.resize(self.pending_vectors, (size, self.dim))
+        self.pending_keys = np.resize(self.pending_keys, size)
+        self.pending_used = np.resize(self.pending_used, size)
+
+    def _maybe_compact(self):
+        """Start a background compaction when one is due; called with the lock held."""
+        if self.compacting:
+            return
+        due = len(self) > self.capacity or (
+            len(self) >= self.min_clustered and self.pending > max(1024, len(self.snapshot) // 4)
+        )
+        if self.path is not None and not due and time.monotonic() - self._checked_at >= self.sync_interval:
+            # Publish our rows, and pick up other processes' ones.
+            self._checked_at = time.monotonic()
+            due = bool(self.pending) or self._published()[0] != self.generation
+        if due:
+            self.compacting = True
+            threading.Thread(target=self._compact_in_background, name="semantic-cache-compact", daemon=True).start()
+
+    def _compact_in_background(self):
+        try:
+            self.compact()
+        except Exception:
+            logger.exception("Compacting the semantic cache index %s failed", self.path or "")
+        finally:
+            self.compacting = False
+
+    def compact(self):
+        """Fold the pending rows into a new snapshot, publishing it with a ``path``."""
+        with self._compaction, self._file_lock():
+            snapshot, generation = self._latest() if self.path is not None else (self.snapshot, self.generation)
+            with self._lock:
+                merged = self.pending
+                vectors = self.pending_vectors[:merged].copy()
+                keys = self.pending_keys[:merged].copy()
+                used = self.pending_used[:merged].copy()
+                touched = self.touched
+                if merged:
+                    self.touched = {}
+            if merged:
+                snapshot = self._merge(snapshot, vectors, keys, used, touched)
+                generation += 1
+                if self.path is not None:
+                    snapshot = self._publish(snapshot, generation)
+            self._install(snapshot, generation, merged)
+
+    def _install(self, snapshot, generation, merged):
+        with self._lock:
+            rest = self.pending - merged
+            self.pending_vectors[:rest] = self.pending_vectors[merged:self.pending]
+            self.pending_keys[:rest] = self.pending_keys[merged:self.pending]
+            self.pending_used[:rest] = self.pending_used[merged:self.pending]
+            self.pending = rest
+            self.snapshot, self.generation = snapshot, generation
+            self.overflow = None
+            if snapshot.centroids is not None:
+                self.overflow = [[] for _ in range(len(snapshot.centroids))]
+                if rest:
+                    assignment = np.argmax(self.pending_vectors[:rest] @ snapshot.centroids.T, axis=1)
+                    for row, c in enumerate(assignment):
+                        self.overflow[c].append(row)
+
+    def _merge(self, snapshot, vectors, keys, used, touched):
+        """A new snapshot of ``snapshot`` plus the given rows, evicting and re-clustering as needed."""
+        vectors = np.concatenate([snapshot.vectors, vectors])
+        keys = np.concatenate([snapshot.keys, keys])
+        used = np.concatenate([snapshot.used, used])
+        if touched:
+            touched_keys = np.fromiter(touched.keys(), dtype=np.int64, count=len(touched))
+            touched_at = np.fromiter(touched.values(), dtype=np.float64, count=len(touched))
+            order = np.argsort(keys)
+            rows = order[np.minimum(np.searchsorted(keys, touched_keys, sorter=order), len(keys) - 1)]
+            found = keys[rows] == touched_keys
+            used[rows[found]] = np.maximum(used[rows[found]], touched_at[found])
+        clustered = snapshot.clustered
+        if len(keys) > self.capacity:
+            # Drop the least recently used slice of rows.
+            keep = self.capacity - max(1, int(self.capacity * self.evict_fraction))
+            kept = np.sort(np.argsort(used, kind="stable")[len(keys) - keep:])
+            vectors, keys, used = vectors[kept], keys[kept], used[kept]
+            clustered = 0
+        size = len(keys)
+        if size < self.min_clustered:
+            return Snapshot(vectors, keys, used)
+        if snapshot.centroids is None or not clustered or size - clustered > max(1024, clustered // 4):
+            centroids = self._cluster(vectors)
+            assignment = np.argmax(vectors @ centroids.T, axis=1)
+            clustered = size
+        else:
+            # Existing rows keep their clusters; only the new ones are assigned.
+            centroids = snapshot.centroids
+            assignment = np.concatenate([
+                np.repeat(np.arange(len(centroids)), np.diff(snapshot.offsets)),
+                np.argmax(vectors[len(snapshot):] @ centroids.T, axis=1),
+            ])
+        order = np.argsort(assignment, kind="stable")
+        offsets = np.searchsorted(assignment[order], np.arange(len(centroids) + 1))
+        return Snapshot(vectors[order], keys[order], used[order], centroids, offsets, clustered)
+
+    @staticmethod
+    def _cluster(vectors):
+        """k-means centroids (a few iterations over a sample) for ``2 * sqrt(rows)`` clusters."""
+        size = len(vectors)
+        nlist = int(2 * np.sqrt(size))
+        rng = np.random.default_rng(0)
+        sample = vectors[rng.choice(size, size=min(size, nlist * 32), replace=False)]
+        centroids = sample[rng.choice(len(sample), size=nlist, replace=False)]
+        for _ in range(5):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            for c in range(nlist):
+                members = sample[assignment == c]
+                if len(members):
+                    centroids[c] = normalize(members.mean(axis=0))
+        return centroids
+
+    @contextmanager
+    def _file_lock(self):
+        if self.path is None:
+            yield
+            return
+        with open(f"{self.path}.lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            yield
+
+    def _published(self):
+        """``(generation, clustered)`` of the latest snapshot on disk, ``(0, 0)`` for none."""
+        try:
+            with open(f"{self.path}.generation") as f:
+                generation, clustered = map(int, f.read().split())
+        except (OSError, ValueError):
+            return 0, 0
+        return generation, clustered
+
+    def _latest(self):
+        """The latest published snapshot, memory-mapped read-only, and its generation."""
+        generation, clustered = self._published()
+        if not generation:
+            return Snapshot.empty(self.dim), 0
+        arrays = {
+            name: np.load(f"{self.path}.{generation}.{name}.npy", mmap_mode="r" if name in MAPPED else None)
+            for name in SNAPSHOT_ARRAYS
+        }
+        if not len(arrays["centroids"]):
+            arrays["centroids"] = arrays["offsets"] = None
+        return Snapshot(**arrays, clustered=clustered), generation
+
+    def _publish(self, snapshot, generation):
+        for name in SNAPSHOT_ARRAYS:
+            array = getattr(snapshot, name)
+            if array is None:
+                array = np.zeros((0, self.dim) if name == "centroids" else 0)
+            np.save(f"{self.path}.{generation}.{name}.npy", array)
+        with open(f"{self.path}.generation.tmp", "w") as f:
+            f.write(f"{generation} {snapshot.clustered}")
+        os.replace(f"{self.path}.generation.tmp", f"{self.path}.generation")
+        # Keep the previous generation for processes that are just loading it.
+        for name in SNAPSHOT_ARRAYS:
+            with suppress(FileNotFoundError):
+                os.remove(f"{self.path}.{generation - 2}.{name}.npy")
+        return self._latest()[0]
+
+
+@dataclass
+class SemanticLookup:
+    partition: str
+    vector: np.ndarray
+    key: int = None
+    similarity: float = 0.0
+
+
+class SemanticCache:
+    def __init__(self, embedder=None, threshold=SEMANTIC_CACHE_THRESHOLD, capacity=SEMANTIC_CACHE_CAPACITY,
+                 directory=SEMANTIC_CACHE_DIR):
+        self.embedder = embedder or (HashingEmbedder() if SEMANTIC_CACHE_EMBEDDER == "hashing" else OllamaEmbedder())
+        self.threshold = threshold
+        self.capacity = capacity
+        self.directory = directory
+        self.partitions = {}
+        self.lookups = 0
+        self.hits = 0
+        self._lock = threading.Lock()
+
+    def lookup(self, prompt, language, model):
+        """Embed ``prompt`` and find its nearest neighbour in the language/model partition.
+
+        ``lookup.key`` is the matching interaction id, or ``None`` below the threshold.
+        Pass the returned lookup to ``add`` to store the prompt without re-embedding it.
+        """
+        partition = f"{language}:{model}"
+        lookup = SemanticLookup(partition, normalize(self.embedder.embed(prompt)))
+        index = self.partitions.get(partition)
+        if index is None and self.directory:
+            # Pick up an index persisted by an earlier process.
+            index = self._index(partition, len(lookup.vector))
+        if index is not None:
+            key, similarity = index.search(lookup.vector)
+            if key is not None and similarity >= self.threshold:
+                lookup.key, lookup.similarity = key, similarity
+        # Per process, unlike ResponseCache's shared counters: so is the index.
+        self.lookups += 1
+        self.hits += lookup.key is not None
+        return lookup
+
+    def add(self, lookup, interaction_id):
+        self._index(lookup.partition, len(lookup.vector)).add(interaction_id, lookup.vector)
+
+    def _index(self, partition, dim):
+        index = self.partitions.get(partition)
+        if index is None:
+            with self._lock:
+                index = self.partitions.get(partition)
+                if index is None:
+                    path = None
+                    if self.directory:
+                        path = os.path.join(self.directory, re.sub(r"[^\w.-]", "_", partition))
+                    index = self.partitions[partition] = VectorIndex(dim, self.capacity, path=path)
+        return index
+
+    def stats(self):
+        return {
+            "lookups": self.lookups,
+            "hits": self.hits,
+            "hit_ratio": round(self.hits / self.lookups, 4) if self.lookups else 0.0,
+            "entries": {partition: len(index) for partition, index in self.partitions.items()},
+        }
+
+
+semantic_cache = SemanticCache() if SEMANTIC_CACHE_ENABLED else None
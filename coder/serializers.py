@@ -1,20 +1,93 @@
 # coder/serializers.py
 from rest_framework import serializers
-from .models import CodeSession, CodeInteraction
+from .models import CodeSession, CodeInteraction, GenerationJob, InteractionSearchDocument
+from .search import highlight
+
+
+class SparseFieldsMixin:
+    """Let the request pick fields: ``?fields=id,prompt`` keeps only those, ``?omit=response`` drops some."""
+
+    # Always loaded from the database, e.g. because pagination orders by them.
+    required_columns = ('id',)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if request is not None:
+            for name in set(self.fields) - set(self.selected_fields(request)):
+                self.fields.pop(name)
+
+    @classmethod
+    def selected_fields(cls, request):
+        fields = list(cls.Meta.fields)
+        wanted = request.query_params.get('fields')
+        if wanted:
+            wanted = {name.strip() for name in wanted.split(',')}
+            fields = [name for name in fields if name in wanted]
+        omit = request.query_params.get('omit')
+        if omit:
+            omit = {name.strip() for name in omit.split(',')}
+            fields = [name for name in fields if name not in omit]
+        return fields
+
+    @classmethod
+    def columns(cls, request):
+        """Model fields to pass to ``only()`` so unrequested text columns stay in the database."""
+        return list(dict.fromkeys([*cls.required_columns, *cls.selected_fields(request)]))
+
+
+class CodeInteractionSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    required_columns = ('id', 'created_at')
 
-class CodeInteractionSerializer(serializers.ModelSerializer):
     class Meta:
         model = CodeInteraction
-        fields = ['id', 'prompt', 'response', 'code_snippet', 'language', 'created_at']
+        fields = ['id', 'prompt', 'response', 'code_snippet', 'language', 'status', 'created_at']
 
+# Interactions are paged separately, from /sessions/{id}/interactions/.
 class CodeSessionSerializer(serializers.ModelSerializer):
-    interactions = CodeInteractionSerializer(many=True, read_only=True)
-
     class Meta:
         model = CodeSession
-        fields = ['id', 'title', 'description', 'is_active', 'created_at', 'updated_at', 'interactions']
+        fields = ['id', 'title', 'description', 'is_active', 'created_at', 'updated_at']
+
+class CodeSessionListSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    required_columns = ('id', 'created_at')
 
-class CodeSessionListSerializer(serializers.ModelSerializer):
     class Meta:
         model = CodeSession
-        fields = ['id', 'title', 'description', 'is_active', 'created_at', 'updated_at']
\ No newline at end of file
+        fields = ['id', 'title', 'description', 'is_active', 'created_at', 'updated_at']
+
+class SearchResultSerializer(serializers.ModelSerializer):
+    """A search hit; pass the query's words as ``words`` in the context for highlighting."""
+    id = serializers.IntegerField(source='interaction_id')
+    session_title = serializers.CharField(source='session.title')
+    score = serializers.FloatField()
+    highlights = serializers.SerializerMethodField()
+
+    class Meta:
+        model = InteractionSearchDocument
+        fields = ['id', 'session', 'session_title', 'language', 'created_at', 'score', 'highlights']
+
+    def get_highlights(self, document):
+        words = self.context.get('words', [])
+        return {
+            'prompt': highlight(document.prompt, words, fragments=1),
+            'response': highlight(document.response, words),
+        }
+
+
+class JobInteractionSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = CodeInteraction
+        fields = ['id', 'session', 'prompt', 'response', 'code_snippet', 'language', 'status', 'created_at']
+
+
+class GenerationJobSerializer(serializers.ModelSerializer):
+    # While the job runs, the interaction's response is the text generated so far.
+    interaction = JobInteractionSerializer(read_only=True)
+
+    class Meta:
+        model = GenerationJob
+        fields = [
+            'id', 'status', 'priority', 'attempts', 'cancel_requested', 'error',
+            'created_at', 'started_at', 'finished_at', 'interaction',
+        ]
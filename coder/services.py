@@ -1,17 +1,304 @@
 # coder/services.py
+import asyncio
+import random
+import threading
+import time
+import weakref
+
+import httpx
 import ollama
 
+from . import tracing
+from .exceptions import OllamaError
+from .metrics import OLLAMA_GENERATION, OLLAMA_TOKENS, OLLAMA_TOKENS_PER_SECOND, OLLAMA_TTFT
+from .routing import get_router
+from .settings import (
+    OLLAMA_HOST,
+    OLLAMA_KEEP_ALIVE,
+    OLLAMA_CONNECT_TIMEOUT,
+    OLLAMA_READ_TIMEOUT,
+    OLLAMA_POOL_SIZE,
+    OLLAMA_KEEPALIVE_EXPIRY,
+    OLLAMA_MAX_RETRIES,
+    OLLAMA_BACKOFF_BASE,
+    OLLAMA_BACKOFF_MAX,
+)
+
+# Upstream statuses worth another attempt: Ollama busy/restarting or a proxy in between.
+RETRYABLE_STATUS_CODES = {429, 502, 503, 504}
+
+
+_clients = {}
+_registry_lock = threading.Lock()
+# httpx async clients are bound to the event loop that first used them, so keep
+# one per (loop, host) instead of a single process-wide client.
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def client_options():
+    return {
+        "timeout": httpx.Timeout(OLLAMA_READ_TIMEOUT, connect=OLLAMA_CONNECT_TIMEOUT),
+        "limits": httpx.Limits(
+            max_connections=OLLAMA_POOL_SIZE,
+            max_keepalive_connections=OLLAMA_POOL_SIZE,
+            keepalive_expiry=OLLAMA_KEEPALIVE_EXPIRY,
+        ),
+    }
+
+
+def get_client(host=OLLAMA_HOST):
+    """Process-wide ``ollama.Client`` for ``host`` with a keep-alive connection pool."""
+    client = _clients.get(host)
+    if client is None:
+        with _registry_lock:
+            client = _clients.get(host)
+            if client is None:
+                client = _clients[host] = ollama.Client(host=host, **client_options())
+    return client
+
+
+def get_async_client(host=OLLAMA_HOST):
+    clients = _async_clients.setdefault(asyncio.get_running_loop(), {})
+    if host not in clients:
+        clients[host] = ollama.AsyncClient(host=host, **client_options())
+    return clients[host]
+
+
+def is_transient(error):
+    if isinstance(error, ollama.ResponseError):
+        return error.status_code in RETRYABLE_STATUS_CODES
+    # A read timeout means Ollama accepted the work; retrying would only double the wait.
+    if isinstance(error, httpx.ReadTimeout):
+        return False
+    # ollama re-raises httpx.ConnectError as the builtin ConnectionError.
+    return isinstance(error, (httpx.TransportError, ConnectionError))
+
+
+def counts_against_backend(error):
+    # Client errors such as an unknown model prove the host is up.
+    return is_transient(error) or isinstance(error, httpx.TimeoutException)
+
+
+def backoff_delay(attempt):
+    """Full-jitter exponential backoff."""
+    return random.uniform(0, min(OLLAMA_BACKOFF_MAX, OLLAMA_BACKOFF_BASE * 2 ** attempt))
+
+
+def observe_generation(model, started, final, first_token=None):
+    """Metrics and trace spans for one chat call.
+
+    ``final`` is Ollama's last message, which carries its token counts and
+    timings. Without a client-side ``first_token`` time (non-streamed calls)
+    the first token is placed after Ollama's reported load and prefill time.
+    """
+    ended = time.monotonic()
+    final = final or {}
+    load = (final.get("load_duration") or 0) / 1e9
+    prefill = (final.get("prompt_eval_duration") or 0) / 1e9
+    decode = (final.get("eval_duration") or 0) / 1e9
+    if first_token is None and (load or prefill):
+        first_token = min(started + load + prefill, ended)
+    OLLAMA_GENERATION.observe(ended - started, model=model)
+    if first_token is not None:
+        OLLAMA_TTFT.observe(first_token - started, model=model)
+        tracing.add("ollama.prefill", started, first_token, model=model)
+        tracing.add("ollama.decode", first_token, ended, model=model)
+    else:
+        tracing.add("ollama.generate", started, ended, model=model)
+    prompt_tokens = final.get("prompt_eval_count")
+    completion_tokens = final.get("eval_count")
+    if prompt_tokens:
+        OLLAMA_TOKENS.inc(prompt_tokens, model=model, kind="prompt")
+    if completion_tokens:
+        OLLAMA_TOKENS.inc(completion_tokens, model=model, kind="completion")
+        if decode:
+            OLLAMA_TOKENS_PER_SECOND.observe(completion_tokens / decode, model=model)
+
+
 class OllamaService:
-    def generate(self, prompt, model, system, options):
+    """Chat with Ollama through the backend router.
+
+    Pass ``host`` to pin the service to a single server; otherwise requests
+    are spread over ``OLLAMA_BACKENDS``. Every attempt, including retries,
+    asks the router for a backend, so a retry can land on a healthier box.
+
+    Earlier turns go in ``history`` as chat messages between the system
+    prompt and the new prompt. As long as they are byte-identical from one
+    turn to the next, Ollama reuses the cached prefix and only prefills the
+    new turn; ``affinity`` (the session) keeps the turns on the backend that
+    holds that cache.
+    """
+
+    def __init__(self, host=None):
+        self.router = get_router([host] if host else None)
+
+    def client_for(self, backend):
+        return get_client(backend.host)
+
+    def generate(self, prompt, model, system, options, history=(), affinity=None):
+        started = time.monotonic()
+        response = self._call(
+            model=model,
+            messages=self._messages(prompt, system, history),
+            options=options,
+            affinity=affinity,
+        )
+        observe_generation(model, started, response)
+        return {"response": response["message"]["content"]}
+
+    def stream(self, prompt, model, system, options, history=(), affinity=None):
+        """Yield response fragments as soon as Ollama produces them.
+
+        Only opening the stream is retried; once tokens have been handed to the
+        caller a failure is raised as-is.
+        """
+        started = time.monotonic()
+        first_token = final = None
+        parts = self._call(
+            model=model,
+            messages=self._messages(prompt, system, history),
+            options=options,
+            affinity=affinity,
+            stream=True
+        )
+        for part in parts:
+            content = part["message"]["content"]
+            if part.get("done"):
+                final = part
+            if content:
+                if first_token is None:
+                    first_token = time.monotonic()
+                yield content
+        observe_generation(model, started, final, first_token)
+
+    def embed(self, model, text):
+        """Embedding vector for ``text``, routed like any other request."""
+        response = self._call(method="embed", model=model, input=text)
+        return response["embeddings"][0]
+
+    def _call(self, stream=False, method="chat", affinity=None, **kwargs):
+        model = kwargs["model"]
+        if OLLAMA_KEEP_ALIVE:
+            kwargs["keep_alive"] = OLLAMA_KEEP_ALIVE
+        for attempt in range(OLLAMA_MAX_RETRIES + 1):
+            backend = self.router.acquire(model, affinity)
+            started = time.monotonic()
+            try:
+                if not stream:
+                    response = getattr(self.client_for(backend), method)(**kwargs)
+                    self.router.observe_latency(backend, time.monotonic() - started)
+                    self.router.release(backend, model, succeeded=True)
+                    return response
+                parts = self.client_for(backend).chat(stream=True, **kwargs)
+                # The HTTP request is only sent once the generator is advanced.
+                first = next(parts, None)
+                self.router.observe_latency(backend, time.monotonic() - started)
+                return self._chain(backend, model, first, parts)
+            except Exception as e:
+                self.router.release(backend, model, failed=counts_against_backend(e))
+                if not is_transient(e) or attempt == OLLAMA_MAX_RETRIES:
+                    raise OllamaError(f"Ollama error: {str(e)}") from e
+                time.sleep(backoff_delay(attempt))
+
+    def _chain(self, backend, model, first, parts):
+        failed = False
+        try:
+            if first is not None:
+                yield first
+                yield from parts
+        except Exception as e:
+            failed = counts_against_backend(e)
+            raise OllamaError(f"Ollama error: {str(e)}") from e
+        finally:
+            # A first part means Ollama had the model loaded.
+            self.router.release(backend, model, failed=failed, succeeded=first is not None)
+
+    def _messages(self, prompt, system, history=()):
+        return [
+            {"role": "system", "content": system},
+            *history,
+            {"role": "user", "content": prompt},
+        ]
+
+
+class AsyncOllamaService(OllamaService):
+    """Non-blocking counterpart of ``OllamaService`` for async views.
+
+    While a generation is waiting on Ollama the event loop is free to serve
+    other requests, so one ASGI worker can hold many generations in flight.
+    """
+
+    def client_for(self, backend):
+        return get_async_client(backend.host)
+
+    async def generate(self, prompt, model, system, options, history=(), affinity=None):
+        started = time.monotonic()
+        response = await self._call(
+            model=model,
+            messages=self._messages(prompt, system, history),
+            options=options,
+            affinity=affinity,
+        )
+        observe_generation(model, started, response)
+        return {"response": response["message"]["content"]}
+
+    async def stream(self, prompt, model, system, options, history=(), affinity=None):
+        started = time.monotonic()
+        first_token = final = None
+        parts = await self._call(
+            model=model,
+            messages=self._messages(prompt, system, history),
+            options=options,
+            affinity=affinity,
+            stream=True
+        )
+        async for part in parts:
+            content = part["message"]["content"]
+            if part.get("done"):
+                final = part
+            if content:
+                if first_token is None:
+                    first_token = time.monotonic()
+                yield content
+        observe_generation(model, started, final, first_token)
+
+    async def embed(self, model, text):
+        response = await self._call(method="embed", model=model, input=text)
+        return response["embeddings"][0]
+
+    async def _call(self, stream=False, method="chat", affinity=None, **kwargs):
+        model = kwargs["model"]
+        if OLLAMA_KEEP_ALIVE:
+            kwargs["keep_alive"] = OLLAMA_KEEP_ALIVE
+        for attempt in range(OLLAMA_MAX_RETRIES + 1):
+            backend = self.router.acquire(model, affinity)
+            started = time.monotonic()
+            try:
+                if not stream:
+                    response = await getattr(self.client_for(backend), method)(**kwargs)
+                    self.router.observe_latency(backend, time.monotonic() - started)
+                    self.router.release(backend, model, succeeded=True)
+                    return response
+                parts = await self.client_for(backend).chat(stream=True, **kwargs)
+                first = await anext(parts, None)
+                self.router.observe_latency(backend, time.monotonic() - started)
+                return self._achain(backend, model, first, parts)
+            except Exception as e:
+                self.router.release(backend, model, failed=counts_against_backend(e))
+                if not is_transient(e) or attempt == OLLAMA_MAX_RETRIES:
+                    raise OllamaError(f"Ollama error: {str(e)}") from e
+                await asyncio.sleep(backoff_delay(attempt))
+
+    async def _achain(self, backend, model, first, parts):
+        failed = False
         try:
-            response = ollama.chat(
-                model=model,
-                messages=[
-                    {"role": "system", "content": system},
-                    {"role": "user", "content": prompt},
-                ],
-                options=options
-            )
-            return {"response": response["message"]["content"]}
+            if first is not None:
+                yield first
+                async for part in parts:
+                    yield part
         except Exception as e:
-            raise Exception(f"Ollama error: {str(e)}")
\ No newline at end of file
+            failed = counts_against_backend(e)
+            raise OllamaError(f"Ollama error: {str(e)}") from e
+        finally:
+            # A first part means Ollama had the model loaded.
+            self.router.release(backend, model, failed=failed, succeeded=first is not None)
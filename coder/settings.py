@@ -1,11 +1,193 @@
 import os
+import tempfile
 from dotenv import load_dotenv
 
 load_dotenv()
 
 OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "deepseek-coder")
-OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://localhost:11434")
+# docker-compose sets OLLAMA_BASE_URL, the ollama CLI convention is OLLAMA_HOST.
+OLLAMA_HOST = os.getenv("OLLAMA_HOST") or os.getenv("OLLAMA_BASE_URL") or "http://localhost:11434"
 CONTEXT_WINDOW = int(os.getenv("CONTEXT_WINDOW", 3))
+# Prompt history: token budget for summary plus verbatim turns, and per-answer clip
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", 2048))
+CONTEXT_TURN_MAX_TOKENS = int(os.getenv("CONTEXT_TURN_MAX_TOKENS", 512))
+CONTEXT_SUMMARY_MAX_TOKENS = int(os.getenv("CONTEXT_SUMMARY_MAX_TOKENS", 256))
+# Turns kept verbatim after history is folded into the summary. Folding well below
+# CONTEXT_WINDOW leaves the next turns to extend the prompt Ollama has already cached.
+CONTEXT_FOLD_TO = int(os.getenv("CONTEXT_FOLD_TO", CONTEXT_WINDOW // 2))
+# "extractive" (no model call) or "ollama" to have the model rewrite the summary
+CONTEXT_SUMMARIZER = os.getenv("CONTEXT_SUMMARIZER", "extractive")
+
+# Connection pooling, timeouts and failure handling for the Ollama client
+OLLAMA_CONNECT_TIMEOUT = float(os.getenv("OLLAMA_CONNECT_TIMEOUT", 5))
+OLLAMA_READ_TIMEOUT = float(os.getenv("OLLAMA_READ_TIMEOUT", 120))
+# How long Ollama keeps the model, and a session's cached prompt, loaded after a request ("" for its default)
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+OLLAMA_POOL_SIZE = int(os.getenv("OLLAMA_POOL_SIZE", 100))
+OLLAMA_KEEPALIVE_EXPIRY = float(os.getenv("OLLAMA_KEEPALIVE_EXPIRY", 60))
+OLLAMA_MAX_RETRIES = int(os.getenv("OLLAMA_MAX_RETRIES", 2))
+OLLAMA_BACKOFF_BASE = float(os.getenv("OLLAMA_BACKOFF_BASE", 0.25))
+OLLAMA_BACKOFF_MAX = float(os.getenv("OLLAMA_BACKOFF_MAX", 4))
+OLLAMA_BREAKER_THRESHOLD = int(os.getenv("OLLAMA_BREAKER_THRESHOLD", 5))
+OLLAMA_BREAKER_COOLDOWN = float(os.getenv("OLLAMA_BREAKER_COOLDOWN", 30))
+
+# Comma-separated Ollama hosts to spread generations over; defaults to OLLAMA_HOST alone
+OLLAMA_BACKENDS = [h.strip() for h in os.getenv("OLLAMA_BACKENDS", OLLAMA_HOST).split(",") if h.strip()]
+OLLAMA_HEALTH_INTERVAL = float(os.getenv("OLLAMA_HEALTH_INTERVAL", 10))
+OLLAMA_HEALTH_TIMEOUT = float(os.getenv("OLLAMA_HEALTH_TIMEOUT", 2))
+# Weight of the newest sample in each backend's moving latency average
+OLLAMA_LATENCY_DECAY = float(os.getenv("OLLAMA_LATENCY_DECAY", 0.3))
+# Load the configured models when the app starts and keep the ones used within
+# MODEL_WARMUP_IDLE seconds resident, pinging them every MODEL_WARMUP_INTERVAL
+MODEL_WARMUP = os.getenv("MODEL_WARMUP", "false").lower() in ("1", "true", "yes")
+# Comma-separated; defaults to every model in MODEL_TIERS (or OLLAMA_MODEL)
+MODEL_WARMUP_MODELS = [m.strip() for m in os.getenv("MODEL_WARMUP_MODELS", "").split(",") if m.strip()]
+MODEL_WARMUP_INTERVAL = float(os.getenv("MODEL_WARMUP_INTERVAL", 300))
+MODEL_WARMUP_IDLE = float(os.getenv("MODEL_WARMUP_IDLE", 3600))
+# Only one process per host runs the warmer: whichever holds this file lock
+MODEL_WARMUP_LOCK_FILE = os.getenv(
+    "MODEL_WARMUP_LOCK_FILE", os.path.join(tempfile.gettempdir(), "coder-model-warmer.lock")
+)
+# Which models are loading where, and when each was last used, are shared between
+# processes through this cache alias; with several processes it must be shared too (e.g. Redis)
+MODEL_STATE_ALIAS = os.getenv("MODEL_STATE_ALIAS", os.getenv("RESPONSE_CACHE_ALIAS", "responses"))
+# How often each process reads that state and publishes the models it used
+MODEL_STATE_SYNC_SECONDS = float(os.getenv("MODEL_STATE_SYNC_SECONDS", 1))
+# Retry-After for generations turned away while their model loads on every backend
+MODEL_LOADING_RETRY_AFTER = float(os.getenv("MODEL_LOADING_RETRY_AFTER", 10))
+# Model tiers, fastest first, as "name=model" pairs, e.g.
+# "fast=qwen2.5-coder:1.5b,default=deepseek-coder:6.7b,deep=deepseek-coder:33b".
+# Unset, every request uses OLLAMA_MODEL.
+MODEL_TIERS = [
+    tuple(part.strip() for part in item.split("=", 1))
+    for item in os.getenv("MODEL_TIERS", "").split(",") if "=" in item
+]
+# Prompts up to this many tokens without code or complexity cues go to the fastest tier
+MODEL_TIER_SIMPLE_MAX_TOKENS = int(os.getenv("MODEL_TIER_SIMPLE_MAX_TOKENS", 40))
+# Prompt plus conversation context from this many tokens goes to the largest tier
+MODEL_TIER_COMPLEX_MIN_TOKENS = int(os.getenv("MODEL_TIER_COMPLEX_MIN_TOKENS", 1500))
+# Languages small models handle poorly never count as simple
+MODEL_TIER_HARD_LANGUAGES = {
+    lang.strip() for lang in os.getenv("MODEL_TIER_HARD_LANGUAGES", "rust,clike").split(",") if lang.strip()
+}
+# Requests in flight per backend on a tier's model before new ones fall back to a faster tier (0 never)
+MODEL_TIER_FALLBACK_IN_FLIGHT = int(os.getenv("MODEL_TIER_FALLBACK_IN_FLIGHT", 4))
+# A session's turns stay on the backend that has its prompt cached unless that
+# backend has this many more requests in flight than the least busy one
+OLLAMA_AFFINITY_SLACK = int(os.getenv("OLLAMA_AFFINITY_SLACK", 2))
+
+# Exact-match response cache (the cache alias itself is configured in CACHES)
+RESPONSE_CACHE_ALIAS = os.getenv("RESPONSE_CACHE_ALIAS", "responses")
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+# Requests sampled hotter than this are meant to vary and always reach Ollama
+RESPONSE_CACHE_MAX_TEMPERATURE = float(os.getenv("RESPONSE_CACHE_MAX_TEMPERATURE", 0.7))
+
+# Semantic cache: answer paraphrased prompts from earlier interactions
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "false").lower() in ("1", "true", "yes")
+# Minimum cosine similarity for two prompts to count as the same question
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", 0.92))
+# "ollama" embeds through SEMANTIC_CACHE_EMBED_MODEL; "hashing" needs no model
+SEMANTIC_CACHE_EMBEDDER = os.getenv("SEMANTIC_CACHE_EMBEDDER", "ollama")
+SEMANTIC_CACHE_EMBED_MODEL = os.getenv("SEMANTIC_CACHE_EMBED_MODEL", "nomic-embed-text")
+SEMANTIC_CACHE_DIM = int(os.getenv("SEMANTIC_CACHE_DIM", 384))
+# Entries per language/model partition before least recently used ones are dropped
+SEMANTIC_CACHE_CAPACITY = int(os.getenv("SEMANTIC_CACHE_CAPACITY", 100000))
+# Directory for memory-mapped index files; empty keeps the index in memory only
+SEMANTIC_CACHE_DIR = os.getenv("SEMANTIC_CACHE_DIR", "")
+# With a directory, how often each process publishes its new entries and loads everyone else's
+SEMANTIC_CACHE_SYNC_SECONDS = float(os.getenv("SEMANTIC_CACHE_SYNC_SECONDS", 10))
+# Clusters scanned per lookup; higher is more accurate and slower
+SEMANTIC_CACHE_NPROBE = int(os.getenv("SEMANTIC_CACHE_NPROBE", 8))
+
+# Single-flight: identical concurrent generations share one Ollama call
+COALESCE_ENABLED = os.getenv("COALESCE_ENABLED", "true").lower() in ("1", "true", "yes")
+# Also coalesce across gunicorn workers; needs a shared cache (e.g. Redis) under COALESCE_ALIAS
+COALESCE_ACROSS_WORKERS = os.getenv("COALESCE_ACROSS_WORKERS", "false").lower() in ("1", "true", "yes")
+COALESCE_ALIAS = os.getenv("COALESCE_ALIAS", RESPONSE_CACHE_ALIAS)
+COALESCE_POLL_INTERVAL = float(os.getenv("COALESCE_POLL_INTERVAL", 0.05))
+# Longest a follower waits for the leader before giving up
+COALESCE_WAIT_TIMEOUT = float(os.getenv("COALESCE_WAIT_TIMEOUT", OLLAMA_READ_TIMEOUT))
+
+# Admission control, per worker process: concurrent generations overall and per user
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "true").lower() in ("1", "true", "yes")
+ADMISSION_MAX_CONCURRENCY = int(os.getenv("ADMISSION_MAX_CONCURRENCY", 8))
+ADMISSION_MAX_PER_USER = int(os.getenv("ADMISSION_MAX_PER_USER", 2))
+# Requests over the caps wait here (round-robin across users) before a 429
+ADMISSION_QUEUE_SIZE = int(os.getenv("ADMISSION_QUEUE_SIZE", 100))
+ADMISSION_QUEUE_PER_USER = int(os.getenv("ADMISSION_QUEUE_PER_USER", 10))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", 30))
+
+# black runs in a pool of warm worker processes
+FORMAT_WORKERS = int(os.getenv("FORMAT_WORKERS", min(4, os.cpu_count() or 1)))
+FORMAT_TIMEOUT = float(os.getenv("FORMAT_TIMEOUT", 5))
+# Formatted outputs remembered per process, keyed by content hash
+FORMAT_CACHE_SIZE = int(os.getenv("FORMAT_CACHE_SIZE", 1024))
+FORMAT_BATCH_MAX = int(os.getenv("FORMAT_BATCH_MAX", 50))
+# Start the workers with the app rather than on the first formatting request
+FORMAT_PREWARM = os.getenv("FORMAT_PREWARM", "false").lower() in ("1", "true", "yes")
+
+# Code execution sandbox: per-run limits for each forked runner
+SANDBOX_CPU_SECONDS = int(os.getenv("SANDBOX_CPU_SECONDS", 5))
+SANDBOX_WALL_SECONDS = float(os.getenv("SANDBOX_WALL_SECONDS", 5))
+SANDBOX_MEMORY_MB = int(os.getenv("SANDBOX_MEMORY_MB", 256))
+SANDBOX_OPEN_FILES = int(os.getenv("SANDBOX_OPEN_FILES", 64))
+SANDBOX_FILE_BYTES = int(os.getenv("SANDBOX_FILE_BYTES", 10 * 1024 * 1024))
+SANDBOX_OUTPUT_BYTES = int(os.getenv("SANDBOX_OUTPUT_BYTES", 64 * 1024))
+# Largest snippet accepted for a run, in bytes; bigger ones get a 413
+SANDBOX_CODE_BYTES = int(os.getenv("SANDBOX_CODE_BYTES", 64 * 1024))
+# Run as root, the sandbox runs snippets as this user instead: root ignores RLIMIT_NPROC
+SANDBOX_USER = os.getenv("SANDBOX_USER", "nobody")
+# Runs at once per web worker and per user; the rest queue, then get a 429
+SANDBOX_MAX_CONCURRENCY = int(os.getenv("SANDBOX_MAX_CONCURRENCY", os.cpu_count() or 1))
+SANDBOX_MAX_PER_USER = int(os.getenv("SANDBOX_MAX_PER_USER", 1))
+SANDBOX_QUEUE_SIZE = int(os.getenv("SANDBOX_QUEUE_SIZE", 32))
+SANDBOX_QUEUE_TIMEOUT = float(os.getenv("SANDBOX_QUEUE_TIMEOUT", 10))
+# Modules imported once by the template process so snippets don't pay for them
+SANDBOX_PRELOAD = [m for m in os.getenv(
+    "SANDBOX_PRELOAD",
+    "json,re,math,random,string,collections,itertools,functools,datetime,typing,dataclasses,heapq,bisect,statistics"
+).split(",") if m]
+# Compile steps of compiled languages get their own, roomier limits
+SANDBOX_COMPILE_SECONDS = float(os.getenv("SANDBOX_COMPILE_SECONDS", 30))
+SANDBOX_COMPILE_MEMORY_MB = int(os.getenv("SANDBOX_COMPILE_MEMORY_MB", 2048))
+# Compiled binaries, keyed on source and toolchain version; oldest pruned past the max
+SANDBOX_ARTIFACT_DIR = os.getenv("SANDBOX_ARTIFACT_DIR", os.path.join(tempfile.gettempdir(), "roro-sandbox-artifacts"))
+SANDBOX_ARTIFACT_MAX = int(os.getenv("SANDBOX_ARTIFACT_MAX", 500))
+# Filling a toolchain's shared build cache at startup (e.g. Go's standard library)
+SANDBOX_SEED_SECONDS = float(os.getenv("SANDBOX_SEED_SECONDS", 600))
+
+# Compression of interaction prompts, responses and snippets: "zstd" (needs the
+# zstandard package, else zlib is used), "zlib" or "none"
+COMPRESSION_ALGORITHM = os.getenv("COMPRESSION_ALGORITHM", "zstd")
+COMPRESSION_LEVEL = int(os.getenv("COMPRESSION_LEVEL", 3))
+# Values shorter than this (in bytes) are stored as is
+COMPRESSION_MIN_BYTES = int(os.getenv("COMPRESSION_MIN_BYTES", 64))
+# Compress against the newest dictionary from train_compression_dictionary, if any
+COMPRESSION_DICTIONARY = os.getenv("COMPRESSION_DICTIONARY", "true").lower() in ("1", "true", "yes")
+
+# Background generation jobs, run by the run_generation_workers command.
+# A running job whose worker stops renewing its lease is retried elsewhere.
+GENERATION_JOB_LEASE_SECONDS = float(os.getenv("GENERATION_JOB_LEASE_SECONDS", 60))
+GENERATION_JOB_MAX_ATTEMPTS = int(os.getenv("GENERATION_JOB_MAX_ATTEMPTS", 3))
+# Wait before retrying a job Ollama couldn't take, multiplied by the attempt number
+GENERATION_JOB_RETRY_SECONDS = float(os.getenv("GENERATION_JOB_RETRY_SECONDS", 5))
+# How often idle workers look for jobs and running ones save progress
+GENERATION_JOB_POLL_SECONDS = float(os.getenv("GENERATION_JOB_POLL_SECONDS", 1))
+# Longest an async (ASGI) events subscription stays open; clients reconnect with Last-Event-ID
+GENERATION_JOB_SUBSCRIBE_SECONDS = float(os.getenv("GENERATION_JOB_SUBSCRIBE_SECONDS", 120))
+
+# Metrics at /metrics. With several processes (gunicorn workers, generation
+# workers) point METRICS_DIR at a directory they share so a scrape sees them all.
+METRICS_DIR = os.getenv("METRICS_DIR", "")
+METRICS_FLUSH_SECONDS = float(os.getenv("METRICS_FLUSH_SECONDS", 5))
+# If set, /metrics requires "Authorization: Bearer <token>"; otherwise a staff login
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+# Log every request's spans (context, cache, Ollama prefill/decode, formatting, queries) as JSON
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "false").lower() in ("1", "true", "yes")
+
+# Point the chat UI at the async interaction views; only worthwhile when the
+# project is served through ASGI (see docker-compose.asgi.yml).
+ASYNC_API = os.getenv("CODER_ASYNC_API", "false").lower() in ("1", "true", "yes")
 
 # List of supported programming languages for the code assistant
 CODE_LANGUAGES = [
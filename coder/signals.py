@@ -0,0 +1,18 @@
+# coder/signals.py
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from .models import CodeInteraction
+from .search import index_interaction
+
+
+# Saves that leave these alone don't change the search document.
+INDEXED_FIELDS = {'prompt', 'response', 'code_snippet', 'status'}
+
+
+@receiver(post_save, sender=CodeInteraction)
+def update_search_document(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    # Fixtures load documents of their own.
+    if raw or (update_fields is not None and not INDEXED_FIELDS & set(update_fields)):
+        return
+    index_interaction(instance, created=created)
@@ -0,0 +1,226 @@
+# coder/snippets.py
+"""Pull fenced code blocks out of model responses.
+
+A single left-to-right pass over the text, so the cost is linear in the
+response length and the same code serves whole responses and token streams.
+Fences follow CommonMark: three or more backticks or tildes, closed by a run
+of the same character at least as long with nothing after it, which is what
+lets a ```` fence wrap a ``` one. Models also open fences at the end of a
+prose line ("Like this: ```python"); such a fence is taken as opening a
+block, so its closing line doesn't open a bogus one. Models often nest
+same-length fences inside a ``markdown`` block; those are matched up by
+depth. A fence that is never closed ends with the response.
+
+Inline `code` spans in the prose are not snippets; ``SnippetStream`` keeps
+them apart in ``inline``.
+
+Every snippet carries ``start`` and ``end``, the character offsets of the
+whole block (fence lines included) in the response.
+"""
+
+import re
+
+MARKDOWN = {"markdown", "md"}
+LANGUAGE_TAG = re.compile(r"[\w+#-]*")
+
+
+def _fence_lines(text):
+    """``(start, end, marker)`` of every line in ``text`` holding ``` or ~~~, with the first one's offset.
+
+    Found with ``str.find`` on the markers, so text without fences is
+    skipped at memchr speed instead of being walked line by line.
+    """
+    n = len(text)
+    tick = text.find("```")
+    tilde = text.find("~~~")
+    while tick >= 0 or tilde >= 0:
+        i = tick if tilde < 0 or 0 <= tick < tilde else tilde
+        start = text.rfind("\n", 0, i) + 1
+        end = text.find("\n", i)
+        if end < 0:
+            end = n
+        yield start, end, i
+        if 0 <= tick < end:
+            tick = text.find("```", end)
+        if 0 <= tilde < end:
+            tilde = text.find("~~~", end)
+
+
+def _fence(line):
+    """``(char, length, info)`` if ``line`` is a fence line, else ``None``."""
+    stripped = line.strip()
+    char = stripped[:1]
+    if char not in ("`", "~"):
+        return None
+    length = len(stripped) - len(stripped.lstrip(char))
+    if length < 3:
+        return None
+    info = stripped[length:].strip()
+    if char == "`" and "`" in info:
+        return None
+    return char, length, info
+
+
+def _midline_fence(text):
+    """``(char, length, info)`` if ``text``, the end of a prose line, opens a fence."""
+    fence = _fence(text)
+    # "Wrap it in ``` fences." is prose; only a bare marker or a language tag opens a block.
+    if fence is None or not LANGUAGE_TAG.fullmatch(fence[2]):
+        return None
+    return fence
+
+
+def _language(info, default):
+    word = info.split(maxsplit=1)[0] if info else ""
+    return word.strip("{}.").lower() or default
+
+
+def inline_code(text, offset=0):
+    """Inline code spans in prose, as ``{"code", "start", "end"}``; spans don't cross lines."""
+    spans = []
+    i, n = 0, len(text)
+    while True:
+        i = text.find("`", i)
+        if i < 0:
+            return spans
+        run = i
+        while run < n and text[run] == "`":
+            run += 1
+        ticks = text[i:run]
+        line_end = text.find("\n", run)
+        if line_end < 0:
+            line_end = n
+        # The span ends at the next backtick run of exactly the same length.
+        j = run
+        while True:
+            j = text.find(ticks, j, line_end)
+            if j < 0:
+                break
+            after = j + len(ticks)
+            if after < n and text[after] == "`":
+                while after < n and text[after] == "`":
+                    after += 1
+                j = after
+                continue
+            code = text[run:j]
+            if code.strip():
+                spans.append({"code": code.strip(), "start": offset + i, "end": offset + after})
+            break
+        i = run if j < 0 else after
+
+
+class SnippetStream:
+    """Incrementally pull fenced code blocks out of a response as it streams in.
+
+    Text is fed in arbitrary fragments; a snippet is returned as soon as its
+    closing fence line has been seen, so callers can format it before the rest
+    of the response arrives. Inline code spans in the prose between blocks
+    are collected separately in ``inline``.
+    """
+
+    def __init__(self, language):
+        self.language = language
+        self.inline = []
+        # Text after the last newline, joined once its line is complete.
+        self._parts = []
+        # Offset of the first character not yet scanned.
+        self._offset = 0
+        self._block = None
+
+    def feed(self, text):
+        last = text.rfind("\n")
+        if last < 0:
+            self._parts.append(text)
+            return []
+        self._parts.append(text[:last + 1])
+        chunk = "".join(self._parts)
+        self._parts = [text[last + 1:]] if last + 1 < len(text) else []
+        return self._scan(chunk)
+
+    def finish(self):
+        """Flush the trailing line and any fence the model never closed."""
+        closed = self._scan("".join(self._parts)) if self._parts else []
+        self._parts = []
+        if self._block is not None:
+            snippet = self._snippet(self._block, self._offset)
+            # A stray fence at the very end opens nothing worth reporting.
+            if snippet["code"]:
+                closed.append(snippet)
+            self._block = None
+        return closed
+
+    def _scan(self, chunk):
+        """Consume ``chunk``, which ends at a line boundary (or the end of the response)."""
+        closed = []
+        base = self._offset
+        pos = 0
+        for start, end, marker in _fence_lines(chunk):
+            block = self._block
+            if chunk[start:marker].strip(" \t"):
+                # A fence after prose on the same line can only open a block.
+                if block is not None:
+                    continue
+                fence = _midline_fence(chunk[marker:end])
+                if fence is None:
+                    continue
+                char, length, info = fence
+                self._inline(chunk, pos, marker, base)
+                self._block = {
+                    "char": char, "length": length, "language": _language(info, self.language),
+                    "start": base + marker, "parts": [], "depth": 0, "indent": 0,
+                }
+                pos = end + 1
+                continue
+            line = chunk[start:end]
+            fence = _fence(line)
+            if fence is None:
+                continue
+            char, length, info = fence
+            if block is None:
+                self._inline(chunk, pos, start, base)
+                self._block = {
+                    "char": char, "length": length, "language": _language(info, self.language),
+                    "start": base + start, "parts": [], "depth": 0,
+                    "indent": len(line) - len(line.lstrip(" ")),
+                }
+                pos = end + 1
+            elif char == block["char"] and length >= block["length"]:
+                if info:
+                    if length == block["length"] and block["language"] in MARKDOWN:
+                        block["depth"] += 1
+                elif block["depth"]:
+                    block["depth"] -= 1
+                else:
+                    block["parts"].append(chunk[pos:start])
+                    closed.append(self._snippet(block, base + end))
+                    self._block = None
+                    pos = end + 1
+        if self._block is not None:
+            self._block["parts"].append(chunk[pos:])
+        else:
+            self._inline(chunk, pos, len(chunk), base)
+        self._offset = base + len(chunk)
+        return closed
+
+    def _inline(self, chunk, start, end, base):
+        if "`" in chunk[start:end]:
+            self.inline.extend(inline_code(chunk[start:end], base + start))
+
+    def _snippet(self, block, end):
+        code = "".join(block["parts"])
+        indent = block["indent"]
+        if indent:
+            # Content of an indented fence (say, inside a list item) loses that indent.
+            code = "\n".join(line[indent:] if line[:indent].isspace() else line for line in code.split("\n"))
+        return {
+            "language": block["language"],
+            "code": code.strip("\n").rstrip(),
+            "start": block["start"],
+            "end": end,
+        }
+
+
+def extract_snippets(text, language):
+    """Every fenced code block in ``text``; untagged fences get ``language``."""
+    stream = SnippetStream(language)
+    return stream.feed(text) + stream.finish()
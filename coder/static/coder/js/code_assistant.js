@@ -6,6 +6,12 @@
 // Globals
 let sessionId = "{{ active_session_id }}";
 const API_BASE = "/coder/api/";
+// Async interaction endpoints are only faster when Django runs under ASGI.
+const INTERACTIONS_PATH = window.CODER_ASYNC_API ? "async/interactions/" : "interactions/";
+// Interactions fetched per page when opening a chat; older ones load on demand.
+const CHAT_PAGE_SIZE = 20;
+let olderInteractionsUrl = null;
+let sessionsNextUrl = null;
 const PROMPT_SUGGESTIONS = [
     "Write a Python function for binary search",
     "Debug a JavaScript Promise issue",
@@ -72,17 +78,22 @@ function fillPrompt(text) {
 }
 
 // Sessions List
-async function listSessions() {
+async function listSessions(more = false) {
     const container = qs("#sessionsList");
     if (!container) return;
-    container.innerHTML = '<div class="text-gray-300 text-center py-4">Loading your chats...</div>';
+    if (!more) {
+        container.innerHTML = '<div class="text-gray-300 text-center py-4">Loading your chats...</div>';
+    }
     try {
-        const sessions = await apiGet("sessions/");
-        if (!sessions.length) {
+        const page = await apiGet(more ? sessionsNextUrl : "sessions/?fields=id,title,updated_at");
+        const sessions = page.results;
+        sessionsNextUrl = page.next;
+        qs("#moreSessions")?.remove();
+        if (!more && !sessions.length) {
             container.innerHTML = '<div class="text-gray-300 text-center py-4">No chats yet</div>';
             return;
         }
-        container.innerHTML = sessions.map((s) => `
+        const html = sessions.map((s) => `
             <div data-id="${s.id}" class="w-full flex items-center justify-between px-3 py-2 rounded-lg hover:bg-indigo-900/30 truncate">
                 <button class="load-session flex-1 truncate text-gray-100 text-left">${escapeHTML(s.title)}</button>
                 <div class="flex items-center space-x-2">
@@ -92,11 +103,23 @@ async function listSessions() {
                 </div>
             </div>
         `).join("");
-        container.querySelectorAll("[data-id]").forEach((el) => {
+        if (more) {
+            container.insertAdjacentHTML("beforeend", html);
+        } else {
+            container.innerHTML = html;
+        }
+        container.querySelectorAll("[data-id]:not([data-bound])").forEach((el) => {
+            el.dataset.bound = "1";
             el.querySelector(".load-session").addEventListener("click", () => loadSession(el.dataset.id));
             el.querySelector(".delete-session").addEventListener("click", () => deleteSession(el.dataset.id));
             el.querySelector(".edit-session").addEventListener("click", () => editSession(el.dataset.id));
         });
+        if (sessionsNextUrl) {
+            container.insertAdjacentHTML("beforeend", `
+                <button id="moreSessions" class="w-full text-sm text-indigo-300 hover:text-white py-2">Show more chats</button>
+            `);
+            qs("#moreSessions").addEventListener("click", () => listSessions(true));
+        }
     } catch (err) {
         container.innerHTML = `<div class="text-red-400 text-center py-4">Failed to load chats: ${escapeHTML(err.message)}</div>`;
     }
@@ -123,9 +146,13 @@ async function createSessionFromPrompt() {
 async function loadSession(id) {
     sessionId = id;
     try {
-        const session = await apiGet(`sessions/${id}/`);
+        const [session, page] = await Promise.all([
+            apiGet(`sessions/${id}/`),
+            apiGet(`sessions/${id}/interactions/?ordering=-created_at&page_size=${CHAT_PAGE_SIZE}`),
+        ]);
         qs("#currentSession").textContent = session.title;
-        renderChat(session.interactions || []);
+        olderInteractionsUrl = page.next;
+        renderChat(page.results.reverse());
         appendStatus(`Loaded chat: ${session.title}`, "success");
     } catch (err) {
         appendStatus(`Error: ${err.message}`, "error");
@@ -229,18 +256,27 @@ const debounceSendPrompt = debounce(async () => {
     appendChatMessage("user", prompt);
     disableInput();
     showLoading();
+    let bubble = null;
     try {
-        const result = await apiPost("interactions/", {
+        bubble = appendChatMessage("assistant", "");
+        let streamed = "";
+        const result = await apiStream(`${INTERACTIONS_PATH}stream/`, {
             session_id: sessionId,
             prompt,
             language,
             think_mode: thinkMode,
+        }, (event, data) => {
+            if (event === "token") {
+                if (!streamed) hideLoading();
+                streamed += data.content;
+                bubble.innerHTML = formatResponse(streamed, []);
+                qs("#chatMessages").scrollTop = qs("#chatMessages").scrollHeight;
+            }
         });
-        // Simulate typing animation
-        await new Promise(resolve => setTimeout(resolve, 500)); // Delay for effect
-        appendChatMessage("assistant", result.response, result.code_snippets);
+        bubble.innerHTML = formatResponse(result.response, result.code_snippets);
         promptInput.value = "";
     } catch (err) {
+        bubble?.remove();
         appendStatus(`Error: ${err.message}`, "error");
     } finally {
         hideLoading();
@@ -254,6 +290,7 @@ function renderChat(interactions) {
     const chatArea = qs("#chatMessages");
     if (!chatArea) return;
     if (!interactions.length) {
+        olderInteractionsUrl = null;
         chatArea.innerHTML = `
             <div class="flex flex-col items-center justify-center h-full text-center p-6">
                 <div class="w-20 h-20 bg-indigo-600 rounded-full flex items-center justify-center mb-4 animate-pulse">
@@ -267,14 +304,46 @@ function renderChat(interactions) {
         showPromptSuggestions();
         return;
     }
-    chatArea.innerHTML = interactions.map((i) => `
+    chatArea.innerHTML = renderInteractions(interactions);
+    showOlderButton(chatArea);
+    chatArea.scrollTop = chatArea.scrollHeight;
+    hljs.highlightAll();
+}
+
+function renderInteractions(interactions) {
+    return interactions.map((i) => `
         <div class="chat-bubble ${i.prompt ? 'ml-auto user-bubble' : 'mr-auto assistant-bubble'}">
             ${i.prompt ? `<p class="mb-2"><strong>You:</strong> ${escapeHTML(i.prompt)}</p>` : ""}
             <div>${formatResponse(i.response, i.code_snippet ? [{ language: i.language, code: i.code_snippet }] : [])}</div>
         </div>
     `).join("");
-    chatArea.scrollTop = chatArea.scrollHeight;
-    hljs.highlightAll();
+}
+
+function showOlderButton(chatArea) {
+    qs("#olderMessages")?.remove();
+    if (!olderInteractionsUrl) return;
+    chatArea.insertAdjacentHTML("afterbegin", `
+        <button id="olderMessages" class="block mx-auto text-sm text-indigo-300 hover:text-white">Load earlier messages</button>
+    `);
+    qs("#olderMessages").addEventListener("click", loadOlderInteractions);
+}
+
+async function loadOlderInteractions() {
+    const chatArea = qs("#chatMessages");
+    if (!chatArea || !olderInteractionsUrl) return;
+    try {
+        const page = await apiGet(olderInteractionsUrl);
+        olderInteractionsUrl = page.next;
+        // Keep the view where it was while older messages appear above it.
+        const fromBottom = chatArea.scrollHeight - chatArea.scrollTop;
+        qs("#olderMessages")?.remove();
+        chatArea.insertAdjacentHTML("afterbegin", renderInteractions(page.results.reverse()));
+        showOlderButton(chatArea);
+        chatArea.scrollTop = chatArea.scrollHeight - fromBottom;
+        hljs.highlightAll();
+    } catch (err) {
+        appendStatus(`Error: ${err.message}`, "error");
+    }
 }
 
 function appendChatMessage(role, content, codeSnippets = []) {
@@ -286,11 +355,14 @@ function appendChatMessage(role, content, codeSnippets = []) {
     chatArea.appendChild(div);
     chatArea.scrollTop = chatArea.scrollHeight;
     hljs.highlightAll();
+    return div;
 }
 
 // API Helpers
 async function apiGet(path) {
-    const response = await fetch(API_BASE + path, {
+    // Pagination links come back as absolute URLs.
+    const url = /^https?:/.test(path) ? path : API_BASE + path;
+    const response = await fetch(url, {
         credentials: "same-origin",
         headers: { "Accept": "application/json" },
     });
@@ -318,6 +390,51 @@ async function apiPost(path, data) {
     return response.json();
 }
 
+// Reads a text/event-stream response, calling onEvent for every event and
+// resolving with the payload of the final "done" event.
+async function apiStream(path, data, onEvent) {
+    const response = await fetch(API_BASE + path, {
+        method: "POST",
+        credentials: "same-origin",
+        headers: {
+            "Content-Type": "application/json",
+            "Accept": "text/event-stream",
+            "X-CSRFToken": getCSRF(),
+        },
+        body: JSON.stringify(data),
+    });
+    if (!response.ok || !response.body) {
+        const error = await response.text().then(parseEventError).catch(() => ({}));
+        throw new Error(error.error || `HTTP ${response.status}`);
+    }
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = "";
+    let result = null;
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        let boundary;
+        while ((boundary = buffer.indexOf("\n\n")) !== -1) {
+            const raw = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+            const event = (raw.match(/^event: (.*)$/m) || [])[1] || "message";
+            const payload = JSON.parse((raw.match(/^data: (.*)$/m) || [])[1] || "{}");
+            if (event === "error") throw new Error(payload.error || payload.detail || "Stream failed");
+            if (event === "done") result = payload;
+            onEvent(event, payload);
+        }
+    }
+    if (!result) throw new Error("Stream ended before the response was complete");
+    return result;
+}
+
+function parseEventError(text) {
+    const match = text.match(/^data: (.*)$/m);
+    return match ? JSON.parse(match[1]) : JSON.parse(text);
+}
+
 async function apiDelete(path) {
     const response = await fetch(API_BASE + path, {
         method: "DELETE",
@@ -1,3 +1,1549 @@
-from django.test import TestCase
+import asyncio
+import errno
+import json
+import os
+import signal
+import socket
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from functools import partial
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+import httpx
+import numpy as np
+import ollama
+from asgiref.sync import async_to_sync, iscoroutinefunction, sync_to_async
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import jobs
+from .admission import AdmissionController, AdmissionRejected, admission
+from .cache import ResponseCache
+from .coalescing import Coalescer, coalescer
+from .settings import (
+    CONTEXT_SUMMARY_MAX_TOKENS, CONTEXT_TURN_MAX_TOKENS, GENERATION_JOB_POLL_SECONDS, MODEL_STATE_ALIAS,
+    OLLAMA_BACKOFF_BASE, OLLAMA_BACKOFF_MAX, RESPONSE_CACHE_MAX_TEMPERATURE, SANDBOX_CODE_BYTES,
+)
+from .compression import is_compressed
+from .job_worker import JobGeneration, run_job
+from .context import ContextBuilder, ExtractiveSummarizer, OllamaSummarizer, count_tokens, truncate_tokens
+from .exceptions import OllamaError, OllamaUnavailable
+from .fake_ollama import FakeOllamaServer
+from .formatting import Formatter, FormattingError, FormattingTimeout
+from .management.commands.loadtest import compare
+from .metrics import DB_QUERIES, DB_TIME, HTTP_LATENCY
+from .middleware import ObservabilityMiddleware
+from .models import CodeInteraction, CodeSession, GenerationJob, InteractionSearchDocument
+from .routing import CircuitBreaker, OllamaRouter
+from .runners import Runner, get_runner, reachable_by_sandbox
+from .sandbox import JobTooLarge, Sandbox, default_limits, sandbox
+from .sandbox_worker import sandbox_user
+from .search import backend, highlight
+from .semantic_cache import HashingEmbedder, SemanticCache, VectorIndex
+from .services import (
+    AsyncOllamaService, OllamaService, backoff_delay, counts_against_backend, get_async_client, is_transient,
+)
+from .snippets import SnippetStream, extract_snippets
+from .tiers import ModelPolicy
+from .views import CodeInteractionMixin
+from .warmup import ModelWarmer
+
+
+class SessionTestCase(TestCase):
+    """A signed-in user with one session, shared by the tests that drive the views."""
+
+    title = "Chat"
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("alice", password="secret")
+        cls.session = CodeSession.objects.create(user=cls.user, title=cls.title)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+
+class HotPathQueryTests(TestCase):
+    """Query counts and plans for the views every page load goes through.
+
+    The SQL the views actually run is captured and ``EXPLAIN``ed. Indexes are
+    asserted by name in the plan, which MySQL/MariaDB, PostgreSQL and SQLite
+    all print, together with the absence of a sort step so a regression to a
+    filesort fails here first.
+    """
+
+    # What each backend prints when it has to sort rows itself.
+    SORT_MARKERS = ("Using filesort", "USE TEMP B-TREE FOR ORDER BY", "Sort Key")
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("alice", password="secret")
+        other = User.objects.create_user("bob", password="secret")
+        for owner in (cls.user, other):
+            for i in range(5):
+                CodeSession.objects.create(user=owner, title=f"Old {i}", is_active=False)
+        cls.session = CodeSession.objects.create(user=cls.user, title="Current", is_active=True)
+        CodeSession.objects.create(user=other, title="Current", is_active=True)
+        CodeInteraction.objects.bulk_create(
+            CodeInteraction(session=cls.session, prompt=f"prompt {i}", response="x" * 500) for i in range(30)
+        )
+        cls.first_id = CodeInteraction.objects.filter(session=cls.session).order_by('id').first().id
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def explain(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute(f"{connection.ops.explain_query_prefix()} {sql}")
+            return "\n".join(" ".join(str(column) for column in row) for row in cursor.fetchall())
+
+    def assertUsesIndex(self, queries, table, index):
+        """``EXPLAIN`` the captured reads of ``table``: each must use ``index`` and sort nothing."""
+        reads = [
+            query['sql'] for query in queries.captured_queries
+            if query['sql'].startswith('SELECT') and f"FROM {connection.ops.quote_name(table)}" in query['sql']
+        ]
+        self.assertTrue(reads, f"no query read {table}")
+        for sql in reads:
+            plan = self.explain(sql)
+            self.assertIn(index, plan, sql)
+            for marker in self.SORT_MARKERS:
+                self.assertNotIn(marker, plan, sql)
+
+    def test_code_assistant_page(self):
+        # Session and user for authentication, then the active session.
+        with self.assertNumQueries(3), CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('coder:code_assistant'))
+        self.assertEqual(response.context['active_session_id'], self.session.id)
+        self.assertUsesIndex(queries, 'coder_codesession', 'coder_sess_user_active_idx')
+
+    def test_session_list(self):
+        with self.assertNumQueries(3), CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('coder:session-list'), {'fields': 'id,title'})
+        self.assertEqual(len(response.json()['results']), 6)
+        self.assertUsesIndex(queries, 'coder_codesession', 'coder_sess_user_created_idx')
+
+    def test_session_interactions(self):
+        url = reverse('coder:session-interactions', args=[self.session.id])
+        for ordering in ('created_at', '-created_at'):
+            with self.assertNumQueries(4), CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url, {'ordering': ordering, 'page_size': 10})
+            self.assertEqual(len(response.json()['results']), 10)
+            self.assertUsesIndex(queries, 'coder_codeinteraction', 'coder_inter_sess_created_idx')
+
+    def test_context_build(self):
+        CodeSession.objects.filter(id=self.session.id).update(summary_through=self.first_id)
+        self.session.refresh_from_db()
+        # Everything fits, so nothing is folded into the summary: a single read.
+        with self.assertNumQueries(1), CaptureQueriesContext(connection) as queries:
+            context = ContextBuilder(window=50, budget=100000).build(self.session)
+        self.assertEqual(len(context.turns), 29)
+        self.assertUsesIndex(queries, 'coder_codeinteraction', 'coder_inter_sess_id_idx')
+
+    def test_one_active_session_per_user(self):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            CodeSession.objects.create(user=self.user, title="Second", is_active=True)
+        response = self.client.post(reverse('coder:session-list'), {'title': 'New'}, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            list(CodeSession.objects.filter(user=self.user, is_active=True).values_list('title', flat=True)), ['New']
+        )
+
+    def test_inactive_sessions_are_not_unique(self):
+        CodeSession.objects.create(user=self.user, title="Another old one", is_active=False)
+        self.assertEqual(CodeSession.objects.filter(user=self.user, is_active=False).count(), 6)
+
+
+class SnippetTests(TestCase):
+    RESPONSE = (
+        "Use `sorted` here:\n"
+        "````markdown\n```python\nprint(1)\n```\n````\n"
+        "then\n"
+        "  ~~~js\n  let a = 1\n  ~~~\n"
+        "```rust\nfn main() {}\n"
+    )
+
+    def test_fences(self):
+        snippets = extract_snippets(self.RESPONSE, "python")
+        self.assertEqual([(s["language"], s["code"]) for s in snippets], [
+            # A longer fence wraps a shorter one.
+            ("markdown", "```python\nprint(1)\n```"),
+            # An indented fence loses its indent.
+            ("js", "let a = 1"),
+            # An unterminated fence ends with the response.
+            ("rust", "fn main() {}"),
+        ])
+        # Inline spans are not snippets; the stream keeps them apart.
+        self.assertNotIn("sorted", [s["code"] for s in snippets])
+        stream = SnippetStream("python")
+        stream.feed(self.RESPONSE)
+        stream.finish()
+        self.assertEqual(stream.inline, [{"code": "sorted", "start": 4, "end": 12}])
+        first = snippets[0]
+        self.assertTrue(self.RESPONSE[first["start"]:first["end"]].startswith("````markdown"))
+        self.assertTrue(self.RESPONSE[first["start"]:first["end"]].endswith("````"))
+
+    def test_same_length_fences_nest_inside_markdown(self):
+        text = "```markdown\n# Example\n```python\nx = 1\n```\n```\nafter\n```sh\nls\n```\n"
+        snippets = extract_snippets(text, "python")
+        self.assertEqual([s["language"] for s in snippets], ["markdown", "sh"])
+        self.assertEqual(snippets[0]["code"], "# Example\n```python\nx = 1\n```")
+
+    def test_a_fence_opened_after_prose_closes_at_its_fence(self):
+        text = "Like this: ```python\nx = 1\n```\nand `y` too.\n"
+        stream = SnippetStream("text")
+        snippets = stream.feed(text) + stream.finish()
+        self.assertEqual([(s["language"], s["code"]) for s in snippets], [("python", "x = 1")])
+        self.assertEqual(text[snippets[0]["start"]:snippets[0]["end"]], "```python\nx = 1\n```")
+        self.assertEqual([span["code"] for span in stream.inline], ["y"])
+        # Prose that merely mentions a fence opens nothing, and neither does a stray one at the end.
+        self.assertEqual(extract_snippets("Wrap it in ``` fences.\nDone.\n```\n", "python"), [])
+
+    def test_any_chunking_gives_the_same_snippets(self):
+        expected = extract_snippets(self.RESPONSE, "python")
+        for size in (1, 2, 3, 7, 64):
+            stream = SnippetStream("python")
+            snippets = []
+            for i in range(0, len(self.RESPONSE), size):
+                snippets += stream.feed(self.RESPONSE[i:i + size])
+            snippets += stream.finish()
+            self.assertEqual(snippets, expected, size)
+            self.assertEqual([span["code"] for span in stream.inline], ["sorted"], size)
+
+    def test_snippets_arrive_once_their_fence_closes(self):
+        stream = SnippetStream("python")
+        self.assertEqual(stream.feed("```\nx = 1\n``"), [])
+        self.assertEqual(stream.feed("`"), [])
+        self.assertEqual([s["code"] for s in stream.feed("\nmore")], ["x = 1"])
+        self.assertEqual(stream.finish(), [])
+
+
+class CoalescingTests(TestCase):
+    def run_together(self, coalescer, produce, callers=4):
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(coalescer.run("k", produce))) for _ in range(callers)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_identical_requests_share_one_call(self):
+        calls = []
+
+        def produce():
+            calls.append(1)
+            time.sleep(0.1)
+            return {"response": "answer", "code_snippets": []}
+
+        results = self.run_together(Coalescer(enabled=True, across_workers=False), produce)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual([payload["response"] for payload, _ in results], ["answer"] * 4)
+        self.assertEqual(sorted(shared for _, shared in results), [False, True, True, True])
+
+    def test_followers_see_the_leaders_failure(self):
+        coalescer = Coalescer(enabled=True, across_workers=False)
+        flight, leader = coalescer.join("k")
+        follower, follower_leads = coalescer.join("k")
+        self.assertTrue(leader)
+        self.assertFalse(follower_leads)
+        coalescer.release("k", flight)
+        with self.assertRaises(Exception):
+            follower.result(timeout=1)
+        self.assertFalse(coalescer.in_flight("k"))
+
+    def test_sampled_requests_are_not_coalesced(self):
+        user = User.objects.create_user("c", password="pw")
+        session = CodeSession.objects.create(user=user, title="Chat")
+        context = ContextBuilder().build(session)
+        mixin = CodeInteractionMixin()
+        plain = mixin.prepare_generation(session, "Sort a list", "python", False, {}, context)
+        self.assertIsNotNone(plain.flight_key)
+        thinking = mixin.prepare_generation(session, "Sort a list", "python", True, {}, context)
+        self.assertIsNone(thinking.flight_key)
+        with mock.patch('coder.cache.RESPONSE_CACHE_MAX_TEMPERATURE', 0.5):
+            hot = mixin.prepare_generation(session, "Sort a list", "python", False, {}, context)
+        self.assertIsNone(hot.flight_key)
+        self.assertIsNone(mixin.prepare_generation(session, "Sort", "python", False, {"cache": False}, context).flight_key)
+
+
+class SemanticCacheTests(TestCase):
+    def vectors(self, count, dim=32):
+        return np.random.default_rng(0).standard_normal((count, dim)).astype(np.float32)
+
+    def test_paraphrases_hit_and_partitions_are_separate(self):
+        cache = SemanticCache(HashingEmbedder(), threshold=0.8, directory="")
+        lookup = cache.lookup("How do I reverse a list in python?", "python", "small")
+        self.assertIsNone(lookup.key)
+        cache.add(lookup, 7)
+        hit = cache.lookup("how do I reverse a list in Python", "python", "small")
+        self.assertEqual(hit.key, 7)
+        self.assertGreaterEqual(hit.similarity, 0.8)
+        self.assertIsNone(cache.lookup("How do I reverse a list in python?", "rust", "small").key)
+        self.assertIsNone(cache.lookup("Explain the borrow checker", "python", "small").key)
+        self.assertEqual(cache.stats()["hits"], 1)
+
+    def test_clustering_runs_off_the_request_thread(self):
+        index = VectorIndex(32, capacity=10000, nprobe=64)
+        threads = []
+        cluster = VectorIndex._cluster
+        with mock.patch.object(VectorIndex, "_cluster", side_effect=lambda vectors: (
+            threads.append(threading.current_thread()) or cluster(vectors)
+        )):
+            vectors = self.vectors(3000)
+            for key, vector in enumerate(vectors):
+                index.add(key, vector)
+            while index.compacting:
+                time.sleep(0.01)
+        self.assertTrue(threads)
+        self.assertNotIn(threading.current_thread(), threads)
+        index.compact()
+        self.assertIsNotNone(index.snapshot.centroids)
+        self.assertEqual((len(index), index.pending), (3000, 0))
+        for key in (0, 1234, 2999):
+            self.assertEqual(index.search(vectors[key])[0], key)
+
+    def test_least_recently_used_rows_are_evicted(self):
+        index = VectorIndex(32, capacity=10)
+        vectors = self.vectors(11)
+        for key, vector in enumerate(vectors[:10]):
+            index.add(key, vector)
+        index.search(vectors[0])
+        index.add(10, vectors[10])
+        index.compact()
+        self.assertEqual(len(index), 9)
+        self.assertEqual(sorted(index.snapshot.keys), [0, 3, 4, 5, 6, 7, 8, 9, 10])
+
+    def test_processes_sharing_a_directory_keep_each_others_rows(self):
+        vectors = self.vectors(4)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "python_small")
+            # Two indexes on one path stand in for two worker processes.
+            first, second = VectorIndex(32, path=path), VectorIndex(32, path=path)
+            first.add(1, vectors[1])
+            second.add(2, vectors[2])
+            first.compact()
+            second.compact()
+            self.assertEqual(second.search(vectors[1])[0], 1)
+            first.compact()
+            self.assertEqual(first.search(vectors[2])[0], 2)
+            self.assertFalse(first.snapshot.vectors.flags.writeable)
+
+            restarted = VectorIndex(32, path=path)
+            self.assertEqual(len(restarted), 2)
+            self.assertEqual(restarted.search(vectors[1])[0], 1)
+
+
+class SandboxTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.sandbox = Sandbox(limits={**default_limits(), "wall_seconds": 1})
+
+    @classmethod
+    def tearDownClass(cls):
+        if cls.sandbox._process is not None:
+            # The template exits once its socket closes.
+            cls.sandbox._socket.close()
+            cls.sandbox._process.wait(5)
+        super().tearDownClass()
+
+    def run_python(self, code):
+        return self.sandbox.run({"kind": "python", "code": code})
+
+    def test_runs_unprivileged(self):
+        result = self.run_python("import os; print(os.getuid(), os.getcwd().startswith(os.environ['TMPDIR']))")
+        uid, private = result["stdout"].split()
+        self.assertNotEqual(uid, "0")
+        self.assertEqual(private, "True")
+
+    def test_fork_loop_is_stopped(self):
+        result = self.run_python(
+            "import os\n"
+            "try:\n"
+            "    while True:\n"
+            "        if os.fork() == 0:\n"
+            "            os._exit(0)\n"
+            "except OSError as e:\n"
+            "    print(e.errno)\n"
+        )
+        self.assertFalse(result["timed_out"])
+        self.assertEqual(result["stdout"].strip(), str(errno.EAGAIN))
+
+    def test_memory_limit(self):
+        result = self.run_python("x = bytearray(1024 * 1024 * 1024)")
+        self.assertEqual(result["exit_code"], 1)
+        self.assertIn("MemoryError", result["stderr"])
+
+    def test_wall_clock_timeout(self):
+        result = self.run_python("print('started', flush=True)\nwhile True: pass")
+        self.assertTrue(result["timed_out"])
+        self.assertEqual(result["exit_code"], -signal.SIGKILL)
+        self.assertEqual(result["stdout"], "started\n")
+        self.assertLess(result["wall_time"], 3)
+
+    def test_output_is_capped_and_stops_the_job(self):
+        result = self.run_python("while True: print('x' * 1023)")
+        self.assertTrue(result["truncated"])
+        self.assertFalse(result["timed_out"])
+        self.assertEqual(len(result["stdout"]), self.sandbox.output_limit)
+
+    def test_lines_stream_as_they_are_written(self):
+        execution = self.sandbox.open({"kind": "python", "code": (
+            "import sys\n"
+            "print('one', flush=True)\n"
+            "print('oops', file=sys.stderr, flush=True)\n"
+            "print('two', end='', flush=True)\n"
+        )})
+        try:
+            lines = list(execution.lines())
+        finally:
+            execution.close()
+        # Each stream keeps its order; how the two interleave depends on scheduling.
+        for stream, expected in (("stdout", ["one\n", "two"]), ("stderr", ["oops\n"])):
+            self.assertEqual([text for name, text in lines[:-1] if name == stream], expected)
+        self.assertEqual(lines[-1][0], "exit")
+        self.assertEqual(lines[-1][1]["exit_code"], 0)
+
+    def test_oversized_jobs_are_refused_without_respawning(self):
+        self.run_python("pass")
+        template = self.sandbox._process
+        with self.assertRaises(JobTooLarge):
+            self.run_python("x = 1\n" * 100000)
+        # Neither that nor a message the template can't decode costs it its life.
+        read, write = os.pipe()
+        with self.sandbox._lock:
+            socket.send_fds(self.sandbox._socket, [b"{not json"], [write, write, write])
+        os.close(write)
+        self.assertEqual(os.read(read, 1), b"")
+        os.close(read)
+        self.assertEqual(self.run_python("print(1)")["stdout"], "1\n")
+        self.assertIs(self.sandbox._process, template)
+
+    def test_respawn_reaps_the_old_template(self):
+        self.run_python("pass")
+        template = self.sandbox._process
+        with self.sandbox._lock:
+            self.sandbox._spawn()
+        self.assertIsNotNone(template.returncode)
+        self.assertEqual(self.run_python("print(1)")["stdout"], "1\n")
+
+    def test_view_rejects_oversized_code(self):
+        self.client.force_login(User.objects.create_user("big", password="pw"))
+        with mock.patch.object(sandbox, 'submit') as submit:
+            response = self.client.post(reverse('coder:run_code'), {
+                "code": "x" * (SANDBOX_CODE_BYTES + 1), "language": "python",
+            }, content_type='application/json')
+        self.assertEqual(response.status_code, 413)
+        submit.assert_not_called()
+
+    def test_refuses_to_run_snippets_as_root(self):
+        if os.geteuid() != 0:
+            self.skipTest("needs root")
+        with self.assertRaises(SystemExit):
+            sandbox_user("no-such-sandbox-user")
+        with self.assertRaises(SystemExit):
+            sandbox_user("root")
+
+
+class RunnerTests(TestCase):
+    C_PROGRAM = '#include <stdio.h>\nint main(void) { puts("hi"); return 0; }\n'
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        # Binaries there run as the sandbox user.
+        os.chmod(tmp.name, 0o755)
+        patcher = mock.patch("coder.runners.SANDBOX_ARTIFACT_DIR", os.path.join(tmp.name, "artifacts"))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def c_runner(self):
+        runner = get_runner("c")
+        if not runner.available:
+            self.skipTest("gcc is not installed")
+        return runner
+
+    def test_toolchain_is_probed_once(self):
+        runner = Runner("c", tool="gcc", source="main.c", compile=["{tool}", "main.c"])
+        with mock.patch.object(Runner, "_probe", return_value="gcc 12") as probe, \
+                mock.patch("coder.runners.shutil.which", return_value="/usr/bin/gcc") as which:
+            values = [runner.path, runner.version, runner.available, runner.path]
+        self.assertEqual(values[:2], ["/usr/bin/gcc", "gcc 12"])
+        self.assertEqual((which.call_count, probe.call_count), (1, 1))
+
+    def test_builds_are_cached_and_share_the_runs_admission_slot(self):
+        runner = self.c_runner()
+        execution, build = runner.open(self.C_PROGRAM, user="runner-test")
+        self.assertFalse(build["cached"])
+        # Built and now running under one slot.
+        self.assertEqual(sandbox.admission.active_by_user.get("runner-test"), 1)
+        self.assertEqual(Sandbox.collect(execution)["stdout"], "hi\n")
+        self.assertNotIn("runner-test", sandbox.admission.active_by_user)
+
+        execution, build = runner.open(self.C_PROGRAM, user="runner-test")
+        self.assertEqual(build, {"cached": True})
+        self.assertEqual(Sandbox.collect(execution)["stdout"], "hi\n")
+
+    def test_failed_build_gives_back_its_slot(self):
+        execution, build = self.c_runner().open("int main(void) {", user="runner-test")
+        self.assertIsNone(execution)
+        self.assertNotEqual(build["exit_code"], 0)
+        self.assertIn("error", build["stderr"])
+        self.assertNotIn("runner-test", sandbox.admission.active_by_user)
+
+    def test_builds_only_share_a_cache_the_sandbox_user_cannot_write(self):
+        runner = Runner("go", tool="go", cache="GOCACHE", seed=["{tool}", "build", "std"], env={"GOTOOLCHAIN": "local"})
+        runner._resolved, runner._path = True, "/usr/local/go/bin/go"
+        with mock.patch.object(sandbox, "drops_privileges", False), mock.patch("coder.runners.subprocess.run") as run:
+            runner.seed_cache()
+        run.assert_not_called()
+        # Each build then caches under its own temp dir ($HOME).
+        self.assertEqual(runner.build_env(), {"GOTOOLCHAIN": "local"})
+
+        with mock.patch.object(sandbox, "drops_privileges", True), mock.patch("coder.runners.subprocess.run") as run:
+            runner.seed_cache()
+        self.assertEqual(run.call_args.args[0], ["/usr/local/go/bin/go", "build", "std"])
+        self.assertEqual(runner.build_env()["GOCACHE"], run.call_args.kwargs["env"]["GOCACHE"])
+
+    def test_toolchains_out_of_the_sandbox_users_reach_are_unavailable(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            tool = os.path.join(tmp, "private", "tool")
+            os.makedirs(os.path.dirname(tool), mode=0o700)
+            open(tool, "w").close()
+            os.chmod(tool, 0o755)
+            os.chmod(tmp, 0o755)
+            with mock.patch.object(sandbox, "drops_privileges", True):
+                self.assertFalse(reachable_by_sandbox(tool))
+                os.chmod(os.path.dirname(tool), 0o755)
+                self.assertTrue(reachable_by_sandbox(tool))
+
+
+def parse_events(body):
+    """``[(event, data)]`` of a server-sent events body."""
+    events = []
+    for block in body.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((fields["event"], json.loads(fields["data"])))
+    return events
+
+
+class StreamingTests(SessionTestCase):
+    def test_tokens_then_snippets_then_the_saved_interaction(self):
+        class Tokens:
+            def stream(self, **kwargs):
+                yield from ["Here:\n``", "`python\nx = [1,", "2]\n```\n", "Done."]
+
+        with mock.patch('coder.views.CodeInteractionMixin.service_class', Tokens):
+            response = self.client.post(reverse('coder:interaction-stream'), {
+                'session_id': self.session.id, 'prompt': "A list please", 'cache': False,
+            }, content_type='application/json')
+            self.assertEqual(response['Content-Type'], 'text/event-stream')
+            self.assertEqual(response['Cache-Control'], 'no-cache')
+            events = parse_events(b''.join(response.streaming_content).decode())
+
+        # The snippet goes out as soon as its fence closes, before the rest of the answer.
+        self.assertEqual([name for name, _ in events], ['token', 'token', 'token', 'snippet', 'token', 'done'])
+        self.assertEqual(''.join(data['content'] for name, data in events if name == 'token'),
+                         "Here:\n```python\nx = [1,2]\n```\nDone.")
+        self.assertEqual(events[3][1]['language'], 'python')
+        self.assertIn("x = [1,", events[3][1]['code'])
+        done = events[-1][1]
+        self.assertEqual(done['cache'], 'BYPASS')
+        interaction = CodeInteraction.objects.get(id=done['id'])
+        self.assertEqual(interaction.response, "Here:\n```python\nx = [1,2]\n```\nDone.")
+        self.assertEqual(interaction.status, CodeInteraction.DONE)
+
+    def test_a_failing_stream_ends_with_an_error_event(self):
+        class FailsMidway:
+            def stream(self, **kwargs):
+                yield "Here"
+                raise OllamaError("connection reset")
+
+        with mock.patch('coder.views.CodeInteractionMixin.service_class', FailsMidway):
+            response = self.client.post(reverse('coder:interaction-stream'), {
+                'session_id': self.session.id, 'prompt': "A list please", 'cache': False,
+            }, content_type='application/json')
+            events = parse_events(b''.join(response.streaming_content).decode())
+        self.assertEqual([name for name, _ in events], ['token', 'error'])
+        self.assertIn("connection reset", events[-1][1]['error'])
+        self.assertFalse(CodeInteraction.objects.filter(session=self.session).exists())
+
+
+class AsyncServiceTests(TestCase):
+    async def test_waiting_on_ollama_leaves_the_loop_free(self):
+        ticks = 0
+
+        async def tick():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        with FakeOllamaServer(ttft=0.2, tokens_per_second=0, tokens=5) as fake:
+            service = AsyncOllamaService(host=fake.url)
+            ticker = asyncio.create_task(tick())
+            try:
+                result = await service.generate(prompt="x", model="fake", system="s", options={})
+            finally:
+                ticker.cancel()
+            self.assertGreater(ticks, 5)
+            tokens = [token async for token in service.stream(prompt="x", model="fake", system="s", options={})]
+        self.assertEqual(len(tokens), 5)
+        self.assertEqual("".join(tokens), result["response"])
+
+    def test_each_event_loop_gets_its_own_client(self):
+        async def client():
+            return get_async_client("http://a")
+
+        loops = [asyncio.new_event_loop(), asyncio.new_event_loop()]
+        try:
+            first, again = (loops[0].run_until_complete(client()) for _ in range(2))
+            other = loops[1].run_until_complete(client())
+        finally:
+            for loop in loops:
+                loop.close()
+        self.assertIs(first, again)
+        self.assertIsNot(first, other)
+
+
+class RetryTests(TestCase):
+    def test_transient_errors_are_retried_with_backoff(self):
+        with FakeOllamaServer(ttft=0, error_rate=1.0) as fake, \
+                mock.patch('coder.services.OLLAMA_MAX_RETRIES', 2), \
+                mock.patch('coder.services.backoff_delay', return_value=0) as backoff:
+            with self.assertRaises(OllamaError) as raised:
+                OllamaService(host=fake.url).generate(prompt="x", model="fake", system="s", options={})
+        self.assertEqual(fake.requests, 3)
+        self.assertEqual([c.args for c in backoff.call_args_list], [(0,), (1,)])
+        self.assertEqual(raised.exception.__cause__.status_code, 503)
+
+    def test_what_counts_as_transient(self):
+        self.assertTrue(is_transient(ollama.ResponseError("busy", 503)))
+        self.assertFalse(is_transient(ollama.ResponseError("model not found", 404)))
+        self.assertTrue(is_transient(httpx.ConnectError("refused")))
+        self.assertTrue(is_transient(ConnectionError("refused")))
+        # Ollama already has the work; a retry would only double the wait.
+        self.assertFalse(is_transient(httpx.ReadTimeout("slow")))
+        self.assertTrue(counts_against_backend(httpx.ReadTimeout("slow")))
+
+    def test_backoff_is_jittered_and_capped(self):
+        with mock.patch('coder.services.random.uniform', side_effect=lambda low, high: high):
+            delays = [backoff_delay(attempt) for attempt in range(20)]
+        self.assertEqual(delays, sorted(delays))
+        self.assertEqual(delays[0], OLLAMA_BACKOFF_BASE)
+        self.assertEqual(delays[-1], OLLAMA_BACKOFF_MAX)
+
+    def test_breaker_opens_probes_once_and_closes(self):
+        breaker = CircuitBreaker(threshold=2, cooldown=0.05)
+        breaker.record_failure()
+        self.assertTrue(breaker.allow())
+        breaker.record_failure()
+        self.assertFalse(breaker.allow())
+        self.assertGreater(breaker.retry_after(), 0)
+        time.sleep(0.06)
+        # A single probe after the cooldown; its failure re-opens the breaker.
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        breaker.record_failure()
+        self.assertFalse(breaker.allow())
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())
+        breaker.record_success()
+        self.assertFalse(breaker.is_open)
+        self.assertTrue(breaker.allow())
+
+
+class RouterTests(TestCase):
+    def setUp(self):
+        caches[MODEL_STATE_ALIAS].clear()
+        self.addCleanup(caches[MODEL_STATE_ALIAS].clear)
+        self.router = OllamaRouter(["http://a", "http://b", "http://c"], health_interval=0)
+        self.a, self.b, self.c = self.router.backends
+
+    def ranked(self):
+        return [backend.host for backend in self.router._ranked("m")]
+
+    def test_warm_backends_first_then_least_busy(self):
+        self.b.models.add("m:latest")
+        self.assertEqual(self.ranked(), ["http://b", "http://a", "http://c"])
+        self.a.in_flight = 2
+        self.assertEqual(self.ranked(), ["http://b", "http://c", "http://a"])
+        self.c.models.add("m:latest")
+        self.c.in_flight = 1
+        self.assertEqual(self.ranked(), ["http://b", "http://c", "http://a"])
+
+    def test_loading_and_open_breakers_rank_last(self):
+        self.a.models.add("m:latest")
+        self.a.loading.add("m:latest")
+        self.assertEqual(self.ranked(), ["http://b", "http://c", "http://a"])
+        for _ in range(self.b.breaker.threshold):
+            self.b.breaker.record_failure()
+        self.assertEqual(self.ranked(), ["http://c", "http://a", "http://b"])
+        self.c.healthy = False
+        self.assertEqual(self.ranked(), ["http://a", "http://b"])
+
+    def test_acquire_skips_open_breakers_until_every_one_is_open(self):
+        for backend in (self.a, self.b):
+            for _ in range(backend.breaker.threshold):
+                backend.breaker.record_failure()
+        self.assertIs(self.router.acquire("m"), self.c)
+        for _ in range(self.c.breaker.threshold):
+            self.c.breaker.record_failure()
+        with self.assertRaises(OllamaUnavailable) as raised:
+            self.router.acquire("m")
+        self.assertGreater(raised.exception.retry_after, 0)
+
+    def test_release_tracks_load_and_failures(self):
+        backend = self.router.acquire("m")
+        self.assertEqual(self.router.load("m"), 1 / 3)
+        self.router.release(backend, "m", failed=True)
+        self.assertEqual(self.router.load("m"), 0)
+        self.assertEqual(backend.breaker.failures, 1)
+        self.assertFalse(backend.has_model("m"))
+        # Refused, e.g. an unknown model: not the backend's fault, but nothing was loaded.
+        backend = self.router.acquire("m")
+        self.router.release(backend, "m")
+        self.assertEqual(backend.breaker.failures, 0)
+        self.assertFalse(backend.has_model("m"))
+        backend = self.router.acquire("m")
+        self.router.release(backend, "m", succeeded=True)
+        self.assertTrue(backend.has_model("m"))
+
+
+class ResponseCacheTests(TestCase):
+    def setUp(self):
+        self.cache = ResponseCache(prefix="test:response")
+        self.cache.cache.clear()
+        self.addCleanup(self.cache.cache.clear)
+
+    def key(self, **changes):
+        arguments = dict(model="m", system="s", prompt="p", options={"temperature": 0, "top_p": 0.9},
+                         history=[("q", "a")])
+        arguments.update(changes)
+        return self.cache.key(**arguments)
+
+    def test_key_covers_everything_that_changes_the_answer(self):
+        key = self.key()
+        self.assertEqual(self.key(options={"top_p": 0.9, "temperature": 0}), key)
+        self.assertEqual(self.key(affinity=42), key)
+        for changes in ({"model": "n"}, {"system": "t"}, {"prompt": "P"}, {"options": {"temperature": 0.1}},
+                        {"history": []}, {"history": [("q", "b")]}):
+            self.assertNotEqual(self.key(**changes), key, changes)
+
+    def test_only_deterministic_requests_are_cached(self):
+        self.assertTrue(self.cache.accepts({}))
+        self.assertTrue(self.cache.accepts({"temperature": RESPONSE_CACHE_MAX_TEMPERATURE}))
+        self.assertFalse(self.cache.accepts({"temperature": RESPONSE_CACHE_MAX_TEMPERATURE + 0.1}))
+        self.assertFalse(self.cache.accepts({}, think_mode=True))
+        with mock.patch('coder.cache.RESPONSE_CACHE_ENABLED', False):
+            self.assertFalse(self.cache.accepts({}))
+
+    def test_hits_and_misses_are_counted(self):
+        key = self.key()
+        self.assertIsNone(self.cache.get(key))
+        self.cache.set(key, "answer")
+        self.assertEqual(self.cache.get(key), "answer")
+        self.assertEqual(async_to_sync(self.cache.aget)(key), "answer")
+        stats = self.cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["hit_ratio"]), (2, 1, 0.6667))
+
+
+class ContextTests(SessionTestCase):
+    def ask(self, prompt, response="ok", status=CodeInteraction.DONE):
+        return CodeInteraction.objects.create(session=self.session, prompt=prompt, response=response, status=status)
+
+    def test_token_helpers(self):
+        self.assertEqual(count_tokens("def add(a, b):"), 8)
+        self.assertEqual(count_tokens("internationalization"), 5)
+        self.assertEqual(truncate_tokens("one two three four", 2), "one two [...]")
+        self.assertEqual(truncate_tokens("one two", 2), "one two")
+
+    def test_turns_within_budget_are_replayed_verbatim(self):
+        for i in range(3):
+            self.ask(f"question {i}", f"answer {i}")
+        self.ask("still running", status=CodeInteraction.PENDING)
+        context = ContextBuilder(window=4, budget=1000, fold_to=2).build(self.session)
+        self.assertEqual(context.summary, "")
+        self.assertEqual(context.system("sys"), "sys")
+        self.assertEqual([m["content"] for m in context.messages()], [
+            "question 0", "answer 0", "question 1", "answer 1", "question 2", "answer 2",
+        ])
+
+    def test_long_answers_are_clipped(self):
+        self.ask("dump", "word " * (CONTEXT_TURN_MAX_TOKENS + 50))
+        turn = ContextBuilder(window=4, budget=100000).build(self.session).turns[0]
+        self.assertTrue(turn.response.endswith(" [...]"))
+        self.assertEqual(count_tokens(turn.response), CONTEXT_TURN_MAX_TOKENS + count_tokens("[...]"))
+
+    def test_oldest_turns_fold_into_the_summary(self):
+        first = self.ask("How do I add numbers?", "def add(a, b):\n    return a + b")
+        for i in range(4):
+            self.ask(f"question {i}")
+        builder = ContextBuilder(window=4, budget=1000, fold_to=2)
+        context = builder.build(self.session)
+        self.assertEqual([turn.prompt for turn in context.turns], ["question 2", "question 3"])
+        self.assertEqual(context.summary.splitlines(), [
+            "- User asked: How do I add numbers? (answer defined add)",
+            "- User asked: question 0",
+            "- User asked: question 1",
+        ])
+        self.assertIn(context.summary, context.system("sys"))
+        self.session.refresh_from_db()
+        self.assertGreater(self.session.summary_through, first.id)
+        # The next turns only append to the prompt until the window is full again.
+        self.ask("question 4")
+        again = builder.build(self.session)
+        self.assertEqual(again.summary, context.summary)
+        self.assertEqual([turn.prompt for turn in again.turns], ["question 2", "question 3", "question 4"])
+
+    def test_turns_over_the_token_budget_fold(self):
+        for i in range(3):
+            self.ask(f"question {i}", "word " * 40)
+        context = ContextBuilder(window=10, budget=100, fold_to=10).build(self.session)
+        self.assertEqual([turn.prompt for turn in context.turns], ["question 1", "question 2"])
+        self.assertLessEqual(sum(turn.tokens for turn in context.turns), 100)
+
+    def test_summary_stays_within_its_budget(self):
+        lines = [f"- User asked: question {i}" for i in range(200)]
+        summary = ExtractiveSummarizer().fold("\n".join(lines), [])
+        self.assertLessEqual(count_tokens(summary), CONTEXT_SUMMARY_MAX_TOKENS)
+        self.assertTrue(summary.endswith("question 199"))
+
+    def test_model_summary_falls_back_to_extractive(self):
+        self.ask("question")
+        turns = ContextBuilder(window=4).build(self.session).turns
+        with mock.patch('coder.services.OllamaService.generate', side_effect=OllamaError("down")):
+            summary = OllamaSummarizer().fold("", turns)
+        self.assertEqual(summary, "- User asked: question")
+
+
+class FormatterTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.formatter = Formatter(workers=2, timeout=10)
+
+    @classmethod
+    def tearDownClass(cls):
+        for worker in list(cls.formatter._idle.queue):
+            worker.kill()
+        cls.formatter._dispatch.shutdown()
+        super().tearDownClass()
+
+    def test_results_and_errors_are_cached(self):
+        before = self.formatter.stats()
+        self.assertEqual(self.formatter.format("cached=1"), "cached = 1\n")
+        self.assertEqual(self.formatter.format("cached=1"), "cached = 1\n")
+        for _ in range(2):
+            with self.assertRaises(FormattingError):
+                self.formatter.format("class (")
+        after = self.formatter.stats()
+        self.assertEqual((after["hits"] - before["hits"], after["misses"] - before["misses"]), (2, 2))
+
+    def test_format_many_keeps_order_and_reports_failures(self):
+        results = self.formatter.format_many(["a=1", "def (", "b=2"])
+        self.assertEqual([formatted for formatted, _ in results], ["a = 1\n", None, "b = 2\n"])
+        self.assertIsNotNone(results[1][1])
+
+    def test_timeout_replaces_the_worker(self):
+        self.formatter.start()
+        workers = set(self.formatter._idle.queue)
+        code = "".join(f"value_{i} = [ {i},{i} ]\n" for i in range(5000))
+        with mock.patch.object(self.formatter, 'timeout', 1e-6):
+            with self.assertRaises(FormattingTimeout):
+                self.formatter.format(code)
+        self.assertEqual(len(set(self.formatter._idle.queue) - workers), 1)
+        self.assertEqual(self.formatter._idle.qsize(), 2)
+        # Timeouts aren't cached, and the replacement worker formats it.
+        self.assertTrue(self.formatter.format(code).startswith("value_0 = [0, 0]\n"))
+
+
+class AdmissionTests(TestCase):
+    def controller(self, **kwargs):
+        return AdmissionController(**{
+            "max_concurrency": 1, "max_per_user": 1, "queue_size": 10, "queue_per_user": 5, "queue_timeout": 5,
+            "enabled": True, **kwargs,
+        })
+
+    async def test_waiting_users_take_turns(self):
+        controller = self.controller()
+        held = await controller.aacquire("a")
+        admitted = []
+
+        async def wait(user, name):
+            ticket = await controller.aacquire(user)
+            admitted.append((name, ticket))
+
+        for user, name in (("a", "a2"), ("a", "a3"), ("b", "b1")):
+            asyncio.create_task(wait(user, name))
+            await asyncio.sleep(0)
+        self.assertEqual(controller.stats()["queued"], 3)
+        for _ in range(3):
+            controller.release(held)
+            await asyncio.sleep(0.01)
+            held = admitted[-1][1]
+        controller.release(held)
+        # b doesn't wait behind all of a's burst.
+        self.assertEqual([name for name, _ in admitted], ["a2", "b1", "a3"])
+        self.assertEqual((controller.active, controller.queued), (0, 0))
+
+    def test_full_queues_and_timeouts_are_rejected(self):
+        controller = self.controller(queue_size=2, queue_per_user=1, queue_timeout=0.05)
+        held = controller.acquire("a")
+        with self.assertRaises(AdmissionRejected) as rejected:
+            controller.acquire("b")
+        self.assertEqual(rejected.exception.reason, "queue timeout")
+        self.assertGreaterEqual(rejected.exception.retry_after, 1)
+
+        waiter = threading.Thread(target=lambda: self.assertRaises(AdmissionRejected, controller.acquire, "b"))
+        waiter.start()
+        while not controller.queued:
+            time.sleep(0.001)
+        with self.assertRaises(AdmissionRejected) as rejected:
+            controller.acquire("b")
+        self.assertEqual(rejected.exception.reason, "per-user queue full")
+        waiter.join()
+        controller.release(held)
+        self.assertEqual(controller.stats()["rejected"], 1)
+        self.assertEqual(controller.stats()["timed_out"], 2)
+        self.assertEqual((controller.active, controller.queued), (0, 0))
+
+    async def test_cancelled_waiter_leaves_the_queue(self):
+        controller = self.controller()
+        held = await controller.aacquire("a")
+        waiter = asyncio.create_task(controller.aacquire("b"))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await waiter
+        self.assertEqual(controller.queued, 0)
+        controller.release(held)
+        # The freed slot isn't handed to the request that went away.
+        self.assertEqual(controller.active, 0)
+
+
+class AdmissionReleaseTests(SessionTestCase):
+    """The generation views give back their admission slot however the request ends."""
+
+    def setUp(self):
+        super().setUp()
+        self.active = admission.active
+
+    def post(self, name):
+        return self.client.post(reverse(name), {
+            'session_id': self.session.id, 'prompt': "Write a parser", 'cache': False,
+        }, content_type='application/json')
+
+    def test_slot_is_released_when_ollama_fails(self):
+        class Broken:
+            def generate(self, **kwargs):
+                raise OllamaError("boom")
+
+            def stream(self, **kwargs):
+                raise OllamaError("boom")
+
+        with mock.patch('coder.views.CodeInteractionMixin.service_class', Broken):
+            self.assertEqual(self.post('coder:interaction-list').status_code, 503)
+            self.assertEqual(admission.active, self.active)
+            response = self.post('coder:interaction-stream')
+            self.assertIn("event: error", b''.join(response.streaming_content).decode())
+        self.assertEqual(admission.active, self.active)
+
+    def test_slot_is_released_when_the_client_leaves(self):
+        class Endless:
+            def stream(self, **kwargs):
+                while True:
+                    yield "token "
+
+        with mock.patch('coder.views.CodeInteractionMixin.service_class', Endless):
+            response = self.post('coder:interaction-stream')
+            self.assertEqual(admission.active, self.active + 1)
+            self.assertIn(b"event: token", next(iter(response.streaming_content)))
+            response.close()
+            self.assertEqual(admission.active, self.active)
+
+            # Before the first byte too.
+            response = self.post('coder:interaction-stream')
+            self.assertEqual(admission.active, self.active + 1)
+            response.close()
+        self.assertEqual(admission.active, self.active)
+        self.assertFalse(CodeInteraction.objects.filter(session=self.session).exists())
+
+    def test_a_request_left_to_lead_takes_a_slot(self):
+        test = self
+
+        class Counting:
+            def generate(self, **kwargs):
+                test.assertEqual(admission.active, test.active + 1)
+                return {"response": "answer"}
+
+            def stream(self, **kwargs):
+                test.assertEqual(admission.active, test.active + 1)
+                yield "answer"
+
+        mixin = CodeInteractionMixin()
+        with mock.patch.object(CodeInteractionMixin, 'service_class', Counting):
+            for respond in (mixin.generate_response, lambda generation: "".join(mixin.event_stream(generation))):
+                generation = mixin.prepare_generation(
+                    self.session, "Write a parser", "python", False, {}, ContextBuilder().build(self.session)
+                )
+                # An identical flight is in progress during admission, then ends first.
+                flight, _ = coalescer.join(generation.flight_key)
+                mixin.admit(generation)
+                self.assertIsNone(generation.ticket)
+                coalescer.release(generation.flight_key, flight)
+                result = respond(generation)
+                self.assertNotIn("error", str(result))
+                self.assertTrue(generation.ticket.released)
+                self.assertEqual(admission.active, self.active)
+
+
+class PaginationTests(SessionTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        CodeInteraction.objects.bulk_create(
+            CodeInteraction(session=cls.session, prompt=f"prompt {i}", response="r") for i in range(25)
+        )
+        started = timezone.now()
+        cls.ids = list(CodeInteraction.objects.order_by('id').values_list('id', flat=True))
+        for i, pk in enumerate(cls.ids):
+            CodeInteraction.objects.filter(id=pk).update(created_at=started + timedelta(seconds=i))
+
+    def pages(self, url, params):
+        pages = []
+        response = self.client.get(url, params)
+        while True:
+            self.assertEqual(response.status_code, 200)
+            body = response.json()
+            self.assertNotIn('count', body)
+            pages.append(body['results'])
+            if not body['next']:
+                return pages
+            response = self.client.get(body['next'])
+
+    def test_next_links_walk_every_interaction_once(self):
+        url = reverse('coder:session-interactions', args=[self.session.id])
+        pages = self.pages(url, {'page_size': 10})
+        self.assertEqual([len(page) for page in pages], [10, 10, 5])
+        self.assertEqual([item['id'] for page in pages for item in page], self.ids)
+        pages = self.pages(url, {'page_size': 10, 'ordering': '-created_at'})
+        self.assertEqual([item['id'] for page in pages for item in page], self.ids[::-1])
+
+    def test_new_interactions_do_not_shift_the_pages(self):
+        url = reverse('coder:interaction-list')
+        first = self.client.get(url, {'page_size': 10}).json()
+        CodeInteraction.objects.create(session=self.session, prompt="late", response="r")
+        second = self.client.get(first['next']).json()
+        self.assertEqual([item['id'] for item in second['results']], self.ids[10:20])
+
+    def test_fields_and_page_size_limits(self):
+        url = reverse('coder:session-interactions', args=[self.session.id])
+        body = self.client.get(url, {'fields': 'id,prompt', 'page_size': 1000}).json()
+        self.assertEqual(len(body['results']), 25)
+        self.assertEqual(set(body['results'][0]), {'id', 'prompt'})
+        body = self.client.get(url, {'omit': 'response,code_snippet', 'page_size': 1}).json()
+        self.assertEqual(set(body['results'][0]), {'id', 'prompt', 'language', 'status', 'created_at'})
+        self.assertIn('cursor=', body['next'])
+
+
+class CompressedTextTests(SessionTestCase):
+    RESPONSE = "Here you go:\n```python\n" + "def add(a, b):\n    return a + b\n\n" * 40 + "```\n"
+
+    def raw(self, interaction_id, column):
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT {column} FROM coder_codeinteraction WHERE id = %s", [interaction_id])
+            return cursor.fetchone()[0]
+
+    def test_round_trip(self):
+        interaction = CodeInteraction.objects.create(
+            session=self.session, prompt="Add two numbers ünïcode", response=self.RESPONSE
+        )
+        stored = self.raw(interaction.id, "response_compressed")
+        self.assertTrue(is_compressed(stored))
+        self.assertEqual(self.raw(interaction.id, "response"), "")
+        self.assertLess(len(stored), len(self.RESPONSE) / 3)
+        interaction.refresh_from_db()
+        self.assertEqual(interaction.prompt, "Add two numbers ünïcode")
+        self.assertEqual(interaction.response, self.RESPONSE)
+        self.assertEqual(interaction.code_snippet, "")
+
+    def test_backfill_legacy_rows(self):
+        interaction = CodeInteraction.objects.create(session=self.session, prompt="p", response="r")
+        # A row as written before migration 0005: text in the plain columns only.
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "UPDATE coder_codeinteraction SET prompt = %s, response = %s, "
+                "prompt_compressed = NULL, response_compressed = NULL WHERE id = %s",
+                ["old prompt", self.RESPONSE, interaction.id],
+            )
+        interaction.refresh_from_db()
+        self.assertEqual(interaction.response, self.RESPONSE)
+        with self.assertNumQueries(1):
+            legacy = CodeInteraction.objects.only('id', 'response').get(id=interaction.id)
+            self.assertEqual(legacy.response, self.RESPONSE)
+        with self.assertNumQueries(1):
+            legacy = CodeInteraction.objects.only('id').get(id=interaction.id)
+        with self.assertNumQueries(1):
+            self.assertEqual(legacy.prompt, "old prompt")
+
+        call_command("compress_interactions", batch_size=1, sleep=0, stdout=StringIO())
+        self.assertTrue(is_compressed(self.raw(interaction.id, "response_compressed")))
+        self.assertEqual(self.raw(interaction.id, "response"), "")
+        interaction.refresh_from_db()
+        self.assertEqual(interaction.prompt, "old prompt")
+        self.assertEqual(interaction.response, self.RESPONSE)
+
+
+class SearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("alice", password="secret", is_staff=True, is_superuser=True)
+        other = User.objects.create_user("bob", password="secret")
+        cls.session = CodeSession.objects.create(user=cls.user, title="Parsing")
+        cls.parser = CodeInteraction.objects.create(
+            session=cls.session, prompt="How do I tokenize a string?",
+            response="Use a tokenizer: ```python\ntokens = tokenize(text)\n```",
+        )
+        cls.sorting = CodeInteraction.objects.create(
+            session=cls.session, prompt="Sort a list", response="Call sorted() on the list.",
+        )
+        CodeInteraction.objects.create(
+            session=CodeSession.objects.create(user=other, title="Theirs"),
+            prompt="tokenize this", response="tokenize it yourself",
+        )
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_search_is_scoped_and_highlighted(self):
+        if connection.vendor == 'sqlite':
+            self.assertEqual(backend().name, 'fts5')
+        response = self.client.get(reverse('coder:interaction-search'), {'q': 'Tokeni'})
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEqual([r['id'] for r in results], [self.parser.id])
+        self.assertEqual(results[0]['session_title'], "Parsing")
+        self.assertIn("<mark>tokenize</mark>", results[0]['highlights']['prompt'][0])
+
+    def test_every_word_must_match(self):
+        url = reverse('coder:interaction-search')
+        self.assertEqual(self.client.get(url, {'q': 'sorted list'}).json()['count'], 1)
+        self.assertEqual(self.client.get(url, {'q': 'sorted tokenizer'}).json()['count'], 0)
+        self.assertEqual(self.client.get(url).status_code, 400)
+
+    def test_index_follows_saves_and_deletes(self):
+        self.sorting.response = "Use heapq for the largest items."
+        self.sorting.save()
+        url = reverse('coder:interaction-search')
+        self.assertEqual(self.client.get(url, {'q': 'heapq'}).json()['count'], 1)
+        self.sorting.delete()
+        self.assertEqual(self.client.get(url, {'q': 'heapq'}).json()['count'], 0)
+        self.assertFalse(InteractionSearchDocument.objects.filter(interaction_id=self.sorting.id).exists())
+
+    def test_only_completed_text_changes_reindex(self):
+        with self.assertNumQueries(1):
+            self.sorting.language = "rust"
+            self.sorting.save(update_fields=['language'])
+        pending = CodeInteraction.objects.create(
+            session=self.session, prompt="Draft", response="half an answer", status=CodeInteraction.PENDING,
+        )
+        self.assertFalse(InteractionSearchDocument.objects.filter(interaction_id=pending.id).exists())
+        self.sorting.response = "Use heapq for the largest items. " + "filler " * 1000 + "finally bisect"
+        self.sorting.code_snippet = "import operator"
+        self.sorting.save()
+        url = reverse('coder:interaction-search')
+        # The whole response and the snippet are searchable.
+        for word in ("bisect", "operator"):
+            self.assertEqual(self.client.get(url, {'q': word}).json()['count'], 1)
+        response = self.client.get(reverse('admin:coder_codeinteraction_changelist'), {'q': 'operator'})
+        self.assertEqual(response.context['cl'].result_count, 1)
+
+    def test_admin_search_uses_index(self):
+        response = self.client.get(reverse('admin:coder_codeinteraction_changelist'), {'q': 'tokenize'})
+        self.assertEqual(response.context['cl'].result_count, 2)
+
+    def test_rebuild(self):
+        InteractionSearchDocument.objects.all().delete()
+        call_command("rebuild_search_index", sleep=0, stdout=StringIO())
+        self.assertEqual(InteractionSearchDocument.objects.count(), 3)
+
+    def test_highlight_escapes_html(self):
+        self.assertEqual(highlight("a <b> tokenizer", ["token"]), ["a &lt;b&gt; <mark>tokenizer</mark>"])
+
+
+class FakeStreamService:
+    def stream(self, **kwargs):
+        yield from ["Here it is:\n", "```python\nprint(1)\n```\n"]
+
+
+class GenerationJobTests(SessionTestCase):
+
+    def enqueue(self, key=None, **data):
+        headers = {'HTTP_IDEMPOTENCY_KEY': key} if key else {}
+        return self.client.post(
+            reverse('coder:job-list'), {'session_id': self.session.id, 'prompt': 'Print one', **data},
+            content_type='application/json', **headers,
+        )
+
+    def run_next(self):
+        job = jobs.claim("test-worker")
+        with mock.patch.object(JobGeneration, 'service_class', FakeStreamService):
+            run_job(job, "test-worker")
+        job.refresh_from_db()
+        return job
+
+    def test_idempotent_enqueue(self):
+        first = self.enqueue(key="abc")
+        self.assertEqual(first.status_code, 202)
+        self.assertEqual(first.json()['interaction']['status'], CodeInteraction.PENDING)
+        again = self.enqueue(key="abc")
+        self.assertEqual(again.status_code, 200)
+        self.assertEqual(again.json()['id'], first.json()['id'])
+        self.assertEqual(GenerationJob.objects.count(), 1)
+
+    def test_worker_completes_job(self):
+        job_id = self.enqueue(cache=False).json()['id']
+        job = self.run_next()
+        self.assertEqual(job.id, job_id)
+        self.assertEqual(job.status, GenerationJob.DONE)
+        interaction = job.interaction
+        interaction.refresh_from_db()
+        self.assertEqual(interaction.status, CodeInteraction.DONE)
+        self.assertEqual(interaction.code_snippet.strip(), "print(1)")
+        # Indexed once, when it finished.
+        self.assertEqual(InteractionSearchDocument.objects.get(interaction=interaction).response, interaction.response)
+        response = self.client.get(reverse('coder:job-events', args=[job_id]), HTTP_LAST_EVENT_ID="5")
+        body = b''.join(response.streaming_content).decode()
+        self.assertIn('"text": "it is:', body)
+        self.assertIn("event: done", body)
+
+    def test_events_never_hold_a_sync_worker(self):
+        job_id = self.enqueue(cache=False).json()['id']
+        jobs.claim("w")
+        CodeInteraction.objects.filter(job__id=job_id).update(response="Here")
+        response = self.client.get(reverse('coder:job-events', args=[job_id]))
+        body = b''.join(response.streaming_content).decode()
+        self.assertIn('event: progress', body)
+        self.assertTrue(body.endswith(f"retry: {int(GENERATION_JOB_POLL_SECONDS * 1000)}\n\n"))
+
+    async def test_async_events_follow_the_job(self):
+        job_id = (await sync_to_async(self.enqueue)(cache=False)).json()['id']
+        await sync_to_async(self.run_next)()
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(
+            reverse('coder:async_job_events', args=[job_id]), headers={"Last-Event-ID": "5"}
+        )
+        body = b''.join([chunk async for chunk in response.streaming_content]).decode()
+        self.assertIn('"text": "it is:', body)
+        self.assertIn("event: done", body)
+
+    def test_priority_order_and_pending_not_in_context(self):
+        low = self.enqueue(priority=-5).json()['id']
+        normal = self.enqueue().json()['id']
+        self.assertEqual(jobs.claim("w").id, normal)
+        self.assertEqual(jobs.claim("w").id, low)
+        self.assertIsNone(jobs.claim("w"))
+        self.assertEqual(context_builder_turns(self.session), 0)
+
+    def test_cancel(self):
+        queued = self.enqueue().json()['id']
+        response = self.client.post(reverse('coder:job-cancel', args=[queued]))
+        self.assertEqual(response.json()['status'], GenerationJob.CANCELLED)
+        self.assertIsNone(jobs.claim("w"))
+
+        self.enqueue()
+        running = jobs.claim("w")
+        self.client.post(reverse('coder:job-cancel', args=[running.id]))
+        with self.assertRaises(jobs.JobLost):
+            jobs.heartbeat(running, "w")
+        run_job(running, "w")
+        running.refresh_from_db()
+        self.assertEqual(running.status, GenerationJob.CANCELLED)
+
+    def test_lease_is_renewed_before_the_first_token(self):
+        class SlowStart:
+            def stream(self, **kwargs):
+                time.sleep(0.4)
+                yield "print(1)"
+
+        self.enqueue(cache=False)
+        job = jobs.claim("w")
+        with mock.patch.object(JobGeneration, 'service_class', SlowStart), \
+                mock.patch('coder.job_worker.GENERATION_JOB_POLL_SECONDS', 0.05), \
+                mock.patch.object(jobs, 'heartbeat', wraps=jobs.heartbeat) as heartbeat:
+            run_job(job, "w")
+        # One when the job starts, the rest while Ollama had nothing to show.
+        self.assertGreaterEqual(heartbeat.call_count, 5)
+        job.refresh_from_db()
+        self.assertEqual(job.status, GenerationJob.DONE)
+
+    def test_upstream_503_is_retried(self):
+        self.enqueue(cache=False)
+        job = jobs.claim("w")
+        with FakeOllamaServer(ttft=0, error_rate=1.0) as fake, \
+                mock.patch.object(JobGeneration, 'service_class', partial(OllamaService, host=fake.url)), \
+                mock.patch('coder.services.OLLAMA_MAX_RETRIES', 0):
+            run_job(job, "w")
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (GenerationJob.QUEUED, 1))
+        self.assertIn("server busy", job.error)
+
+    def test_crashed_worker_is_retried(self):
+        self.enqueue()
+        job = jobs.claim("dead-worker")
+        GenerationJob.objects.filter(id=job.id).update(lease_expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(jobs.reap(), 1)
+        job = self.run_next()
+        self.assertEqual((job.status, job.attempts), (GenerationJob.DONE, 2))
+
+
+class PrefixReuseTests(TestCase):
+    def test_follow_up_turns_only_prefill_the_new_turn(self):
+        user = User.objects.create_user("p", password="pw")
+        self.client.force_login(user)
+        session = CodeSession.objects.create(user=user, title="Chat")
+        builder = ContextBuilder(window=4, budget=100000, fold_to=2)
+        with FakeOllamaServer(ttft=0, tokens_per_second=0, tokens=40) as fake, \
+                mock.patch('coder.views.CodeInteractionMixin.service_class', partial(OllamaService, host=fake.url)), \
+                mock.patch('coder.views.context_builder', builder):
+            for turn in range(10):
+                response = self.client.post(reverse('coder:interaction-list'), {
+                    'session_id': session.id, 'prompt': f"Now handle case {turn}", 'cache': False,
+                }, content_type='application/json')
+                self.assertEqual(response.status_code, 201)
+        # Only turns that fold history into the summary change the start of the prompt.
+        new_turn = fake.prefilled[1]
+        self.assertLess(new_turn, fake.prefilled[0])
+        self.assertEqual(fake.prefilled[1:5], [new_turn] * 4)
+        self.assertLessEqual(sum(tokens > new_turn for tokens in fake.prefilled[1:]), 3)
+
+    def test_sessions_stick_to_their_backend(self):
+        router = OllamaRouter(["http://a", "http://b"])
+        for backend in router.backends:
+            backend.models.add("m:latest")
+        home = router.acquire("m", affinity=1)
+        router.release(home, "m")
+        # One request on each backend; the session still goes home.
+        router.acquire("m")
+        router.acquire("m")
+        self.assertIs(router.acquire("m", affinity=1), home)
+        home.in_flight += 3
+        # Far busier than the other backend now, so the session moves.
+        self.assertIsNot(router.acquire("m", affinity=1), home)
+
+
+class ModelTierTests(TestCase):
+    def setUp(self):
+        self.router = OllamaRouter(["http://a"])
+        self.policy = ModelPolicy([("fast", "small"), ("default", "medium"), ("deep", "large")], 2, self.router)
+
+    def choose(self, prompt, language="python", think_mode=False, context_tokens=0):
+        decision = self.policy.choose(prompt, language, think_mode, context_tokens)
+        return decision.tier.name, decision.reason
+
+    def test_classification(self):
+        self.assertEqual(self.choose("What does zip do?"), ("fast", "short"))
+        self.assertEqual(self.choose("What does zip do?", think_mode=True), ("deep", "think_mode"))
+        self.assertEqual(self.choose("What does a lifetime mean?", language="rust"), ("default", "default"))
+        self.assertEqual(self.choose("Fix this:\n```python\nprint(x\n```"), ("default", "code"))
+        self.assertEqual(self.choose("Refactor the worker for better performance and concurrency"), ("deep", "cues"))
+        self.assertEqual(self.choose("What does zip do?", context_tokens=5000), ("deep", "long"))
+
+    def test_busy_tiers_fall_back(self):
+        self.router.in_flight_by_model["large:latest"] = 2
+        self.assertEqual(self.choose("x", think_mode=True), ("default", "fallback"))
+        self.router.in_flight_by_model["medium:latest"] = 5
+        self.assertEqual(self.choose("x", think_mode=True), ("fast", "fallback"))
+
+
+class WarmupTests(TestCase):
+    def setUp(self):
+        caches[MODEL_STATE_ALIAS].clear()
+        self.addCleanup(caches[MODEL_STATE_ALIAS].clear)
+
+    def test_warmer_loads_missing_models_and_routes_around_loading(self):
+        with FakeOllamaServer(ttft=0, models=("small:latest", "large:latest"), loaded=(), load_time=0.05) as fake:
+            router = OllamaRouter([fake.url, "http://b"], health_interval=0)
+            slow, other = router.backends
+            warmer = ModelWarmer(["small", "large"], router, idle=0)
+
+            # While a backend loads a model it is the last choice for it.
+            router.start_loading(slow, "large")
+            self.assertIs(router.acquire("large"), other)
+            router.release(other, "large")
+            other.healthy = False
+            self.assertTrue(router.loading_everywhere("large"))
+            self.assertEqual(ModelPolicy([("fast", "small"), ("deep", "large")], 0, router).choose(
+                "x", "python", True).tier.name, "fast")
+            router.finish_loading(slow, "large", loaded=False)
+
+            warmer.run_once()
+            self.assertEqual(fake.loaded, {"small:latest", "large:latest"})
+            self.assertEqual(fake.loads, 2)
+            self.assertEqual(slow.models, {"small:latest", "large:latest"})
+            self.assertEqual(slow.loading, set())
+            # Renewing keeps them loaded without loading them again.
+            warmer.run_once()
+            self.assertEqual(fake.loads, 2)
+
+    def test_only_recently_used_models_stay_warm(self):
+        router = OllamaRouter(["http://a"], health_interval=0)
+        warmer = ModelWarmer(["small"], router, idle=60)
+        warmer.started = 0
+        router.last_used = {"large:latest": 1000.0, "old:latest": 10.0}
+        with mock.patch("coder.warmup.time.time", return_value=1030.0):
+            self.assertEqual(warmer.wanted(), ["large:latest"])
+        warmer.started = 1000.0
+        with mock.patch("coder.warmup.time.time", return_value=1030.0):
+            self.assertEqual(sorted(warmer.wanted()), ["large:latest", "small:latest"])
+
+    def test_model_state_is_shared_between_processes(self):
+        # Two routers stand in for two worker processes sharing the cache.
+        warming = OllamaRouter(["http://a", "http://b"], health_interval=0)
+        serving = OllamaRouter(["http://a", "http://b"], health_interval=0)
+        warming.start_loading(warming.backends[0], "large")
+        serving.sync_state(force=True)
+        self.assertTrue(serving.backends[0].is_loading("large"))
+        self.assertEqual(serving.acquire("large"), serving.backends[1])
+        warming.start_loading(warming.backends[1], "large")
+        serving.sync_state(force=True)
+        self.assertTrue(serving.loading_everywhere("large"))
+        warming.finish_loading(warming.backends[0], "large", loaded=True)
+        serving.sync_state(force=True)
+        self.assertFalse(serving.loading_everywhere("large"))
+
+        # The models one process serves keep them warm for a warmer elsewhere.
+        warmer = ModelWarmer(["small"], warming, idle=60)
+        self.assertEqual(sorted(warmer.wanted()), ["large:latest", "small:latest"])
+
+    def test_one_warmer_per_host(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            lock_file = os.path.join(tmp, "warmer.lock")
+            first = ModelWarmer(["small"], OllamaRouter(["http://a"], health_interval=0), lock_file=lock_file)
+            second = ModelWarmer(["small"], OllamaRouter(["http://a"], health_interval=0), lock_file=lock_file)
+            self.assertTrue(first.hold_lock())
+            self.assertFalse(second.hold_lock())
+            first.release_lock()
+            self.assertTrue(second.hold_lock())
+            second.release_lock()
+
+    def test_admission_turns_away_models_loading_everywhere(self):
+        router = OllamaRouter(["http://a"], health_interval=0)
+        controller = AdmissionController(max_concurrency=1, router=router)
+        router.start_loading(router.backends[0], "large")
+        with self.assertRaises(AdmissionRejected) as rejected:
+            controller.acquire(1, "large")
+        self.assertEqual(rejected.exception.reason, "model loading")
+        self.assertEqual(controller.stats()["rejected"], 1)
+        controller.release(controller.acquire(1, "small"))
+        router.finish_loading(router.backends[0], "large", loaded=True)
+        controller.release(controller.acquire(1, "large"))
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("m", password="pw")
+        self.client.force_login(self.user)
+
+    def test_request_metrics_and_request_id(self):
+        response = self.client.get(reverse('coder:session-list'), HTTP_X_REQUEST_ID="abc123")
+        self.assertEqual(response['X-Request-ID'], "abc123")
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+
+        User.objects.filter(id=self.user.id).update(is_staff=True)
+        response = self.client.get('/metrics')
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        body = response.content.decode()
+        self.assertIn('# TYPE http_request_duration_seconds histogram', body)
+        self.assertIn('http_request_duration_seconds_count{view="coder:session-list",method="GET",status="200"}', body)
+        self.assertIn('http_request_db_queries_bucket{view="coder:session-list",le="+Inf"}', body)
+
+
+class AsyncMetricsTests(TestCase):
+    def series(self, metric, **labels):
+        """``(count, sum)`` of a histogram series."""
+        counts = metric.values.get(metric.key(labels))
+        return (counts[-1], counts[-2]) if counts else (0, 0)
+
+    def test_middleware_stays_async(self):
+        async def view(request):
+            pass
+
+        self.assertTrue(iscoroutinefunction(ObservabilityMiddleware(view)))
+        self.assertFalse(iscoroutinefunction(ObservabilityMiddleware(lambda request: None)))
+
+    async def test_queries_on_any_executor_thread_are_measured(self):
+        def select():
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1")
+
+        async def view(request):
+            await sync_to_async(select, thread_sensitive=False)()
+            await sync_to_async(select)()
+            return HttpResponse()
+
+        before = self.series(DB_QUERIES, view="unmatched")
+        await ObservabilityMiddleware(view)(RequestFactory().get("/"))
+        count, queries = self.series(DB_QUERIES, view="unmatched")
+        self.assertEqual((count, queries), (before[0] + 1, before[1] + 2))
+
+    async def test_async_view_queries_are_measured(self):
+        user = await User.objects.acreate_user("a", password="pw")
+        session = await CodeSession.objects.acreate(user=user, title="Async")
+        job, _ = await sync_to_async(jobs.enqueue)(session, "Print one", "python")
+        await sync_to_async(jobs.finish)(job, GenerationJob.DONE)
+        await self.async_client.aforce_login(user)
+        view = 'coder:async_job_events'
+        queries_before = self.series(DB_QUERIES, view=view)
+        time_before = self.series(DB_TIME, view=view)
+        latency_before = self.series(HTTP_LATENCY, view=view, method="GET", status=200)
+
+        response = await self.async_client.get(reverse(view, args=[job.id]))
+        self.assertIn("event: done", b''.join([chunk async for chunk in response.streaming_content]).decode())
+        await sync_to_async(response.close)()
+
+        self.assertEqual(self.series(HTTP_LATENCY, view=view, method="GET", status=200)[0], latency_before[0] + 1)
+        count, queries = self.series(DB_QUERIES, view=view)
+        self.assertEqual(count, queries_before[0] + 1)
+        # Session, user, job and interaction, all run from sync_to_async threads.
+        self.assertGreaterEqual(queries - queries_before[1], 4)
+        self.assertGreater(self.series(DB_TIME, view=view)[1], time_before[1])
+
+
+class LoadTestTests(TestCase):
+    def report(self, requests, p95, throughput, errors=0):
+        endpoint = {"requests": requests, "p50_ms": 10.0, "p95_ms": p95, "p99_ms": p95,
+                    "throughput": throughput, "error_rate": errors / requests}
+        return {"endpoints": {"list_sessions": endpoint}}
+
+    def test_compare_flags_only_real_regressions(self):
+        baseline = self.report(100, 50.0, 40.0)
+        self.assertEqual(compare(self.report(100, 55.0, 38.0), baseline, 0.2), [])
+        self.assertEqual(compare(self.report(100, 80.0, 40.0), baseline, 0.2), ["list_sessions p95_ms: 50.0 -> 80.0"])
+        self.assertEqual(len(compare(self.report(100, 50.0, 20.0, errors=5), baseline, 0.2)), 2)
+        # Too few requests for a meaningful p95.
+        self.assertEqual(compare(self.report(20, 80.0, 40.0), self.report(20, 50.0, 40.0), 0.2), [])
+
+    def test_fake_ollama_injects_errors(self):
+        with FakeOllamaServer(ttft=0, tokens=3, error_rate=1.0, seed=1) as fake:
+            response = httpx.post(f"{fake.url}/api/chat", json={"model": "m", "messages": [], "stream": False})
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(fake.errors, 1)
+
+
+def context_builder_turns(session):
+    return len(ContextBuilder(window=50, budget=100000).build(session).turns)
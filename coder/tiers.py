@@ -0,0 +1,112 @@
+# coder/tiers.py
+"""Pick the model for a prompt from ``MODEL_TIERS``, fastest tier first.
+
+Most prompts are short questions a small model answers as well as a large
+one, at a fraction of the GPU time. A cheap classifier sorts each prompt
+into simple, normal or complex from its length (with the conversation
+context), the language, ``think_mode`` and a few wording cues. Simple goes
+to the first tier, complex to the last and normal to the one in between
+(the last of two). When the chosen tier's model already has
+``MODEL_TIER_FALLBACK_IN_FLIGHT`` requests per backend in flight, the
+request falls back to the next faster tier rather than queue behind them, and
+so does one whose model is being loaded on every backend. Load is what this
+process sees through its router, like admission control.
+
+Without ``MODEL_TIERS`` every prompt goes to ``OLLAMA_MODEL``.
+"""
+import re
+
+from .context import count_tokens
+from .routing import get_router
+from .settings import (
+    MODEL_TIERS,
+    MODEL_TIER_COMPLEX_MIN_TOKENS,
+    MODEL_TIER_FALLBACK_IN_FLIGHT,
+    MODEL_TIER_HARD_LANGUAGES,
+    MODEL_TIER_SIMPLE_MAX_TOKENS,
+    OLLAMA_MODEL,
+)
+
+SIMPLE, NORMAL, COMPLEX = "simple", "normal", "complex"
+
+QUESTION_RE = re.compile(
+    r"^\s*(?:what|which|why|when|where|how (?:do|does|can|to)|is there|can i|does|explain|define)\b", re.IGNORECASE
+)
+COMPLEX_RE = re.compile(
+    r"\b(?:refactor\w*|architect\w*|design\w*|optimi[sz]\w*|concurren\w*|thread\w*|async\w*|performance|"
+    r"migrat\w*|secur\w*|debug\w*|multi-?file|end[- ]to[- ]end|scal(?:e|able|ing)|distributed|test suite)\b",
+    re.IGNORECASE,
+)
+# Pasted code: a fence, or several indented lines.
+CODE_RE = re.compile(r"```|(?:^(?: {4}|\t).*\n){3,}", re.MULTILINE)
+
+
+class Tier:
+    def __init__(self, name, model):
+        self.name = name
+        self.model = model
+
+    def __repr__(self):
+        return f"Tier({self.name!r}, {self.model!r})"
+
+
+class Decision:
+    def __init__(self, tier, level, reason):
+        self.tier = tier
+        self.level = level
+        self.reason = reason
+
+    @property
+    def model(self):
+        return self.tier.model
+
+
+def classify(prompt, language, think_mode, context_tokens=0):
+    """``(level, reason)`` for a prompt: how capable a model it needs, and why."""
+    if think_mode:
+        return COMPLEX, "think_mode"
+    tokens = count_tokens(prompt)
+    if tokens + context_tokens >= MODEL_TIER_COMPLEX_MIN_TOKENS:
+        return COMPLEX, "long"
+    cues = len(set(match.lower() for match in COMPLEX_RE.findall(prompt)))
+    if cues >= 2:
+        return COMPLEX, "cues"
+    has_code = CODE_RE.search(prompt) is not None
+    if (tokens <= MODEL_TIER_SIMPLE_MAX_TOKENS and not cues and not has_code
+            and language not in MODEL_TIER_HARD_LANGUAGES
+            and (QUESTION_RE.match(prompt) or tokens <= MODEL_TIER_SIMPLE_MAX_TOKENS // 2)):
+        return SIMPLE, "short"
+    return NORMAL, "code" if has_code else "cues" if cues else "default"
+
+
+class ModelPolicy:
+    def __init__(self, tiers=None, fallback_in_flight=MODEL_TIER_FALLBACK_IN_FLIGHT, router=None):
+        self.tiers = [Tier(name, model) for name, model in (tiers or MODEL_TIERS or [("default", OLLAMA_MODEL)])]
+        self.fallback_in_flight = fallback_in_flight
+        self._router = router
+
+    @property
+    def router(self):
+        return self._router or get_router()
+
+    def choose(self, prompt, language, think_mode, context_tokens=0):
+        level, reason = classify(prompt, language, think_mode, context_tokens)
+        index = {SIMPLE: 0, NORMAL: len(self.tiers) // 2, COMPLEX: len(self.tiers) - 1}[level]
+        while index > 0 and self.busy(self.tiers[index]):
+            index -= 1
+            reason = "fallback"
+        return Decision(self.tiers[index], level, reason)
+
+    def busy(self, tier):
+        if self.router.loading_everywhere(tier.model):
+            return True
+        return bool(self.fallback_in_flight) and self.router.load(tier.model) >= self.fallback_in_flight
+
+    def stats(self):
+        return [
+            {"tier": tier.name, "model": tier.model, "load": round(self.router.load(tier.model), 2)}
+            for tier in self.tiers
+        ]
+
+
+model_policy = ModelPolicy()
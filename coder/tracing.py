@@ -0,0 +1,107 @@
+# coder/tracing.py
+"""Per-request spans, to see where a slow request spent its time.
+
+``ObservabilityMiddleware`` opens a trace for every request under its
+request id (the ``X-Request-ID`` header, or a new one, echoed back). The
+pipeline marks its stages with ``span()`` and database queries are added as
+they run. With ``TRACING_ENABLED`` the finished trace is logged as one JSON
+line on the ``coder.trace`` logger; otherwise only the request id is kept,
+for log lines. Background jobs carry the id of the request that queued them.
+"""
+import json
+import logging
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from .settings import TRACING_ENABLED
+
+logger = logging.getLogger("coder.trace")
+
+# Per trace, so one chatty request can't flood the log.
+MAX_SPANS = 200
+
+_current = ContextVar("coder_trace", default=None)
+
+
+class Trace:
+    def __init__(self, request_id=None, name=""):
+        self.request_id = request_id or uuid.uuid4().hex
+        self.name = name
+        self.started = time.monotonic()
+        self.spans = []
+        self.attributes = {}
+        self.dropped = 0
+
+    def add(self, name, start, end, **attributes):
+        """Record a span that ran from ``start`` to ``end`` (``time.monotonic()`` values)."""
+        if not TRACING_ENABLED:
+            return
+        if len(self.spans) >= MAX_SPANS:
+            self.dropped += 1
+            return
+        self.spans.append({
+            "name": name,
+            "start_ms": round((start - self.started) * 1000, 2),
+            "duration_ms": round((end - start) * 1000, 2),
+            **attributes,
+        })
+
+    def finish(self, **attributes):
+        if not TRACING_ENABLED:
+            return
+        logger.info(json.dumps({
+            "request_id": self.request_id,
+            "name": self.name,
+            "duration_ms": round((time.monotonic() - self.started) * 1000, 2),
+            **self.attributes,
+            **attributes,
+            "spans": self.spans,
+            **({"dropped_spans": self.dropped} if self.dropped else {}),
+        }, default=str))
+
+
+def start(request_id=None, name=""):
+    """Begin a trace in the current context; returns it."""
+    trace = Trace(request_id, name)
+    _current.set(trace)
+    return trace
+
+
+def current():
+    return _current.get()
+
+
+def request_id():
+    trace = _current.get()
+    return trace.request_id if trace else None
+
+
+def add(name, start, end, **attributes):
+    """Record a span on the current trace, if there is one."""
+    trace = _current.get()
+    if trace is not None:
+        trace.add(name, start, end, **attributes)
+
+
+@contextmanager
+def span(name, **attributes):
+    """Time the enclosed block as a span of the current trace."""
+    trace = _current.get()
+    if trace is None or not TRACING_ENABLED:
+        yield
+        return
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        trace.add(name, started, time.monotonic(), **attributes)
+
+
+class RequestIdFilter(logging.Filter):
+    """Adds ``request_id`` to every log record, for the log format."""
+
+    def filter(self, record):
+        record.request_id = request_id() or "-"
+        return True
@@ -8,10 +8,17 @@ app_name = 'coder'
 router = DefaultRouter()
 router.register(r'sessions', views.CodeSessionViewSet, basename='session')
 router.register(r'interactions', views.CodeInteractionViewSet, basename='interaction')
+router.register(r'jobs', views.GenerationJobViewSet, basename='job')
 
 urlpatterns = [
     path('', views.CodeAssistantView.as_view(), name='code_assistant'),
     path('api/run_code/', views.CodeExecutionView.as_view(), name='run_code'),
+    path('api/run_code/stream/', views.CodeExecutionStreamView.as_view(), name='run_code_stream'),
     path('api/format_code/', views.CodeFormattingView.as_view(), name='format_code'),
+    path('api/async/interactions/', views.AsyncCodeInteractionView.as_view(), name='async_interaction'),
+    path('api/async/interactions/stream/', views.AsyncCodeInteractionStreamView.as_view(), name='async_interaction_stream'),
+    path('api/async/jobs/<int:pk>/events/', views.AsyncGenerationJobEventsView.as_view(), name='async_job_events'),
+    path('api/cache/stats/', views.ResponseCacheStatsView.as_view(), name='response_cache_stats'),
+    path('api/admission/stats/', views.AdmissionStatsView.as_view(), name='admission_stats'),
     path('api/', include(router.urls)),
 ]
\ No newline at end of file
@@ -1,38 +1,101 @@
 # coder/views.py
-import re
-import os
-from django.http import JsonResponse
+import asyncio
+import hmac
+import json
+import logging
+import time
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.conf import settings
+from django.views import View
+from asgiref.sync import sync_to_async
 from rest_framework import viewsets, permissions, status
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.decorators import action
+from rest_framework.renderers import BaseRenderer, JSONRenderer
 from django.shortcuts import get_object_or_404, render
-import subprocess
-try:
-    import black
-except ImportError:
-    black = None
-from .models import CodeSession, CodeInteraction
-from .serializers import CodeSessionSerializer, CodeInteractionSerializer, CodeSessionListSerializer
-from .services import OllamaService
-from .settings import CODE_LANGUAGES
+from django.urls import reverse
+from .models import CodeSession, CodeInteraction, GenerationJob
+from .serializers import (
+    CodeSessionSerializer, CodeInteractionSerializer, CodeSessionListSerializer, SearchResultSerializer,
+    GenerationJobSerializer,
+)
+from .pagination import SessionCursorPagination, InteractionCursorPagination, JobCursorPagination, SearchPagination
+from .exceptions import OllamaUnavailable
+from .services import OllamaService, AsyncOllamaService
+from .settings import (
+    CODE_LANGUAGES, ASYNC_API, FORMAT_BATCH_MAX, GENERATION_JOB_POLL_SECONDS, GENERATION_JOB_SUBSCRIBE_SECONDS,
+    METRICS_TOKEN,
+)
+from .snippets import SnippetStream, extract_snippets
+from .cache import response_cache
+from .semantic_cache import semantic_cache
+from .coalescing import coalescer
+from .admission import admission, AdmissionRejected
+from .context import context_builder, count_tokens
+from .tiers import model_policy
+from .routing import get_router
+from .formatting import formatter, FormattingError
+from .sandbox import sandbox, JobTooLarge, SandboxError
+from .runners import get_runner
+from .metrics import GENERATIONS, MODEL_TIER, PROMPT_TOKENS, registry
+from . import jobs, search, tracing
+
+logger = logging.getLogger(__name__)
+
+
+class EventStreamRenderer(BaseRenderer):
+    media_type = 'text/event-stream'
+    format = 'sse'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        # Only reached for early error responses; streamed bodies bypass renderers.
+        return sse_event('error', data).encode()
+
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
 
 class CodeSessionViewSet(viewsets.ModelViewSet):
     serializer_class = CodeSessionSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = SessionCursorPagination
 
     def get_queryset(self):
-        return CodeSession.objects.filter(user=self.request.user)
+        # The prompt summary is internal and can be large; saves then leave it alone too.
+        return CodeSession.objects.filter(user=self.request.user).defer('summary', 'summary_through')
 
     def list(self, request):
-        queryset = self.get_queryset()
-        serializer = CodeSessionListSerializer(queryset, many=True)
-        return Response(serializer.data)
+        queryset = CodeSession.objects.filter(user=request.user).only(*CodeSessionListSerializer.columns(request))
+        page = self.paginate_queryset(queryset)
+        serializer = CodeSessionListSerializer(page, many=True, context=self.get_serializer_context())
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=True, methods=['get'])
+    def interactions(self, request, pk=None):
+        """The session's interactions, a page at a time; takes ``fields``/``omit`` and ``ordering``."""
+        session = get_object_or_404(CodeSession.objects.only('id'), id=pk, user=request.user)
+        queryset = CodeInteraction.objects.filter(session=session).only(*CodeInteractionSerializer.columns(request))
+        paginator = InteractionCursorPagination()
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        serializer = CodeInteractionSerializer(page, many=True, context=self.get_serializer_context())
+        return paginator.get_paginated_response(serializer.data)
 
     def perform_create(self, serializer):
-        CodeSession.objects.filter(user=self.request.user, is_active=True).update(is_active=False)
-        serializer.save(user=self.request.user, is_active=True)
+        # A user has at most one active session; the unique active_user column enforces it.
+        with transaction.atomic():
+            self.deactivate_sessions()
+            serializer.save(user=self.request.user, is_active=True)
+
+    def perform_update(self, serializer):
+        with transaction.atomic():
+            if serializer.validated_data.get('is_active'):
+                self.deactivate_sessions(exclude=serializer.instance.id)
+            serializer.save()
+
+    def deactivate_sessions(self, exclude=None):
+        CodeSession.objects.filter(user=self.request.user, is_active=True).exclude(id=exclude).update(is_active=False)
 
     @action(detail=True, methods=['delete'])
     def delete_session(self, request, pk=None):
@@ -42,33 +105,42 @@ class CodeSessionViewSet(viewsets.ModelViewSet):
 
     @action(detail=True, methods=['patch'])
     def update_session(self, request, pk=None):
-        session = get_object_or_404(CodeSession, id=pk, user=request.user)
+        session = get_object_or_404(self.get_queryset(), id=pk)
         serializer = CodeSessionSerializer(session, data=request.data, partial=True)
         if serializer.is_valid():
-            serializer.save()
+            self.perform_update(serializer)
             return Response(serializer.data)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-class CodeInteractionViewSet(viewsets.ModelViewSet):
-    serializer_class = CodeInteractionSerializer
-    permission_classes = [permissions.IsAuthenticated]
-
-    def get_queryset(self):
-        return CodeInteraction.objects.filter(session__user=self.request.user)
+class Generation:
+    """Everything known about one prompt on its way through the pipeline."""
 
-    def create(self, request):
-        session_id = request.data.get('session_id')
-        prompt = request.data.get('prompt')
-        language = request.data.get('language', 'python')
-        think_mode = request.data.get('think_mode', False)
+    def __init__(self, session, prompt, language, think_mode, data, context):
+        self.session = session
+        self.prompt = prompt
+        self.language = language
+        self.think_mode = think_mode
+        self.data = data
+        self.context = context
+        self.kwargs = None
+        self.cache_key = None
+        # Identical requests in flight at the same time share one Ollama call under this key.
+        self.flight_key = None
+        self.semantic = None
+        # The model tier chosen for the prompt, see coder/tiers.py.
+        self.choice = None
+        self.cache_status = 'BYPASS'
+        # Set by admit(): the cached answer, or the admission slot for calling Ollama.
+        self.cached = None
+        self.ticket = None
 
-        if not session_id:
-            return Response({"error": "session_id is required"}, status=status.HTTP_400_BAD_REQUEST)
-        if not prompt:
-            return Response({"error": "prompt is required"}, status=status.HTTP_400_BAD_REQUEST)
 
-        session = get_object_or_404(CodeSession, id=session_id, user=request.user)
+class CodeInteractionMixin:
+    """Prompt assembly and post-processing shared by the sync and async interaction views."""
+    service_class = OllamaService
+    async_service_class = AsyncOllamaService
 
+    def build_system_prompt(self, language, think_mode):
         system_prompt = (
             "You are Grok, a witty and helpful coding assistant created by xAI. "
             "Provide clear, concise, and accurate answers with a touch of humor. "
@@ -81,58 +153,714 @@ class CodeInteractionViewSet(viewsets.ModelViewSet):
                 "\nThink step-by-step, explain your reasoning clearly, "
                 "and provide a detailed solution with thorough comments."
             )
+        return system_prompt
 
-        recent_interactions = CodeInteraction.objects.filter(session=session).order_by('-created_at')[:3]
-        context = "\n".join([f"User: {i.prompt}\nAssistant: {i.response}" for i in recent_interactions])
+    def build_context(self, session):
+        with tracing.span("context"):
+            return context_builder.build(session)
 
-        ollama_service = OllamaService()
+    def generation_options(self, think_mode):
+        return {"temperature": 0.7 if not think_mode else 0.9, "max_tokens": 2000}
+
+    def prepare_generation(self, session, prompt, language, think_mode, data, context):
+        generation = Generation(session, prompt, language, think_mode, data, context)
+        generation.choice = model_policy.choose(prompt, language, think_mode, context.tokens)
+        MODEL_TIER.inc(tier=generation.choice.tier.name, reason=generation.choice.reason)
+        # Keyword arguments for OllamaService.generate/stream
+        generation.kwargs = {
+            "prompt": prompt,
+            "history": context.messages(),
+            "model": generation.choice.model,
+            "system": context.system(self.build_system_prompt(language, think_mode)),
+            "options": self.generation_options(think_mode),
+            "affinity": session.id,
+        }
+        PROMPT_TOKENS.observe(context.tokens + count_tokens(prompt), part="prompt")
+        PROMPT_TOKENS.observe(context.tokens, part="context")
+        # Sampled answers (think_mode, hot temperatures) are neither cached nor
+        # shared: each of those requests gets its own generation.
+        cacheable = data.get('cache', True) is not False and response_cache.accepts(
+            generation.kwargs['options'], think_mode
+        )
+        if cacheable:
+            generation.cache_key = generation.flight_key = response_cache.key(**generation.kwargs)
+            generation.cache_status = 'MISS'
+            # Answers that build on earlier turns can't be reused for a paraphrase.
+            if semantic_cache is not None and not context:
+                try:
+                    generation.semantic = semantic_cache.lookup(prompt, language, generation.kwargs['model'])
+                except Exception as e:
+                    logger.warning("Semantic cache lookup failed: %s", e)
+        return generation
+
+    def admit(self, generation):
+        """Check the caches and, if Ollama will be needed, wait for an admission slot.
+
+        Raises ``AdmissionRejected`` when the queue is full or the wait times out.
+        """
+        with tracing.span("cache"):
+            generation.cached = self.cached_payload(generation)
+        if generation.cached is None and not coalescer.in_flight(generation.flight_key):
+            with tracing.span("admission"):
+                generation.ticket = admission.acquire(generation.session.user_id, generation.kwargs['model'])
+            # While we queued, an identical request may have started or even finished.
+            if generation.ticket.waited:
+                generation.cached = self.cached_payload(generation)
+            if generation.cached is not None or coalescer.in_flight(generation.flight_key):
+                admission.release(generation.ticket)
+
+    def admit_leader(self, generation):
+        """Take a slot for a request that leads a flight after all.
+
+        ``admit`` lets a request that would follow an identical flight skip
+        the queue. If that flight ends before this one joins it, this request
+        calls Ollama itself and needs a slot like any other.
+        """
+        if generation.ticket is None or generation.ticket.released:
+            with tracing.span("admission"):
+                generation.ticket = admission.acquire(generation.session.user_id, generation.kwargs['model'])
+
+    def leader_stream(self, generation):
+        self.admit_leader(generation)
+        return self.service_class().stream(**generation.kwargs)
+
+    def cached_payload(self, generation):
+        if generation.cache_key:
+            cached = response_cache.get(generation.cache_key)
+            if cached is not None:
+                generation.cache_status = 'HIT'
+                return cached
+        if generation.semantic and generation.semantic.key:
+            match = CodeInteraction.objects.filter(id=generation.semantic.key).only('response').first()
+            if match:
+                generation.cache_status = 'SEMANTIC'
+                return self.postprocess(match.response, generation.language)
+        return None
+
+    def generate_response(self, generation):
+        """Return ``{"response", "code_snippets"}``, from cache when possible."""
+        payload = generation.cached
+        if payload is None:
+            try:
+                def produce():
+                    self.admit_leader(generation)
+                    result = self.service_class().generate(**generation.kwargs)
+                    return self.postprocess(result.get('response', ''), generation.language)
+                payload, shared = coalescer.run(generation.flight_key, produce)
+            finally:
+                admission.release(generation.ticket)
+            if shared:
+                generation.cache_status = 'COALESCED'
+        return payload
+
+    def postprocess(self, ai_response, language):
+        code_snippets = self.extract_code_snippets(ai_response, language)
+        return {
+            "response": ai_response,
+            "code_snippets": self.format_snippets(code_snippets),
+        }
+
+    def finish_generation(self, generation, payload):
+        """Persist the interaction and remember a freshly generated answer."""
+        GENERATIONS.inc(cache=generation.cache_status)
+        with tracing.span("save"):
+            interaction = self.save_interaction(
+                generation.session, generation.prompt, payload['response'], payload['code_snippets'],
+                generation.language,
+            )
+        if generation.cache_status == 'MISS':
+            response_cache.set(generation.cache_key, payload)
+            if generation.semantic is not None:
+                semantic_cache.add(generation.semantic, interaction.id)
+        return interaction
+
+    def event_stream(self, generation):
+        """Server-sent events for one generation.
+
+        Emits ``token`` events as Ollama produces text, a ``snippet`` event
+        (already formatted) each time a fenced code block closes, and a final
+        ``done`` event carrying the saved interaction.
+        """
+        extractor = SnippetStream(generation.language)
+        chunks = []
+        formatted_code = []
         try:
-            result = ollama_service.generate(
-                prompt=f"{context}\n\nUser: {prompt}",
-                model=os.getenv("OLLAMA_MODEL", "deepseek-coder"),
-                system=system_prompt,
-                options={"temperature": 0.7 if not think_mode else 0.9, "max_tokens": 2000}
+            cached = generation.cached
+            if cached is not None:
+                # Replay a cached answer through the same events as a live one.
+                yield sse_event('token', {'content': cached['response']})
+                for snippet in cached['code_snippets']:
+                    yield sse_event('snippet', snippet)
+                payload = cached
+            else:
+                # Identical concurrent prompts follow the first one's tokens.
+                flight, leader = coalescer.join(generation.flight_key)
+                try:
+                    if leader:
+                        tokens = coalescer.lead(generation.flight_key, flight, lambda: self.leader_stream(generation))
+                    else:
+                        tokens = flight.follow()
+                    for token in tokens:
+                        chunks.append(token)
+                        yield sse_event('token', {'content': token})
+                        for snippet in extractor.feed(token):
+                            formatted_code.append(self.format_snippet(snippet))
+                            yield sse_event('snippet', formatted_code[-1])
+                    for snippet in extractor.finish():
+                        formatted_code.append(self.format_snippet(snippet))
+                        yield sse_event('snippet', formatted_code[-1])
+                    payload = {
+                        "response": ''.join(chunks),
+                        "code_snippets": formatted_code or [{"language": generation.language, "code": ""}],
+                    }
+                    if leader:
+                        coalescer.finish(generation.flight_key, flight, payload)
+                finally:
+                    admission.release(generation.ticket)
+                    if leader:
+                        coalescer.release(generation.flight_key, flight)
+                if not leader or flight.shared:
+                    generation.cache_status = 'COALESCED'
+
+            interaction = self.finish_generation(generation, payload)
+            yield sse_event('done', {
+                **CodeInteractionSerializer(interaction).data,
+                'code_snippets': payload['code_snippets'],
+                'cache': generation.cache_status,
+                'model': generation.kwargs['model'],
+            })
+        except Exception as e:
+            yield sse_event('error', {
+                "error": f"Oops, something went wrong with Ollama: {str(e)}. Please try again!"
+            })
+
+    def format_snippet(self, snippet):
+        if formatter.available and snippet['language'] == 'python' and snippet['code']:
+            try:
+                snippet['code'] = formatter.format(snippet['code'])
+            except FormattingError as e:
+                logger.warning("Code formatting failed: %s", e)
+        return snippet
+
+    def format_snippets(self, snippets):
+        """Format every Python snippet of a response in parallel on the black pool."""
+        python = [s for s in snippets if s['language'] == 'python' and s['code']]
+        if formatter.available and python:
+            with tracing.span("format", snippets=len(python)):
+                results = formatter.format_many([s['code'] for s in python])
+            for snippet, (formatted, error) in zip(python, results):
+                if error:
+                    logger.warning("Code formatting failed: %s", error)
+                else:
+                    snippet['code'] = formatted
+        return snippets
+
+    def save_interaction(self, session, prompt, ai_response, formatted_code, language):
+        return CodeInteraction.objects.create(
+            session=session,
+            prompt=prompt,
+            response=ai_response,
+            code_snippet=formatted_code[0]['code'] if formatted_code else '',
+            language=language
+        )
+
+    async def abuild_context(self, session):
+        return await sync_to_async(context_builder.build)(session)
+
+    async def aprepare_generation(self, session, prompt, language, think_mode, data, context):
+        # May embed the prompt over HTTP for the semantic cache.
+        return await sync_to_async(self.prepare_generation, thread_sensitive=False)(
+            session, prompt, language, think_mode, data, context
+        )
+
+    async def aadmit(self, generation):
+        with tracing.span("cache"):
+            generation.cached = await self.acached_payload(generation)
+        if generation.cached is None and not coalescer.in_flight(generation.flight_key):
+            with tracing.span("admission"):
+                generation.ticket = await admission.aacquire(generation.session.user_id, generation.kwargs['model'])
+            if generation.ticket.waited:
+                generation.cached = await self.acached_payload(generation)
+            if generation.cached is not None or coalescer.in_flight(generation.flight_key):
+                admission.release(generation.ticket)
+
+    async def aadmit_leader(self, generation):
+        if generation.ticket is None or generation.ticket.released:
+            with tracing.span("admission"):
+                generation.ticket = await admission.aacquire(generation.session.user_id, generation.kwargs['model'])
+
+    async def aleader_stream(self, generation):
+        await self.aadmit_leader(generation)
+        async for chunk in self.async_service_class().stream(**generation.kwargs):
+            yield chunk
+
+    async def acached_payload(self, generation):
+        if generation.cache_key:
+            cached = await response_cache.aget(generation.cache_key)
+            if cached is not None:
+                generation.cache_status = 'HIT'
+                return cached
+        if generation.semantic and generation.semantic.key:
+            match = await CodeInteraction.objects.filter(id=generation.semantic.key).only('response').afirst()
+            if match:
+                generation.cache_status = 'SEMANTIC'
+                return await self.apostprocess(match.response, generation.language)
+        return None
+
+    async def agenerate_response(self, generation):
+        payload = generation.cached
+        if payload is None:
+            async def produce():
+                await self.aadmit_leader(generation)
+                result = await self.async_service_class().generate(**generation.kwargs)
+                return await self.apostprocess(result.get('response', ''), generation.language)
+            try:
+                payload, shared = await coalescer.arun(generation.flight_key, produce)
+            finally:
+                admission.release(generation.ticket)
+            if shared:
+                generation.cache_status = 'COALESCED'
+        return payload
+
+    async def apostprocess(self, ai_response, language):
+        code_snippets = self.extract_code_snippets(ai_response, language)
+        return {
+            "response": ai_response,
+            "code_snippets": await sync_to_async(self.format_snippets, thread_sensitive=False)(code_snippets),
+        }
+
+    async def afinish_generation(self, generation, payload):
+        GENERATIONS.inc(cache=generation.cache_status)
+        with tracing.span("save"):
+            interaction = await self.asave_interaction(
+                generation.session, generation.prompt, payload['response'], payload['code_snippets'],
+                generation.language,
             )
-            ai_response = result.get('response', '')
-            code_snippets = self.extract_code_snippets(ai_response, language)
-
-            formatted_code = []
-            for snippet in code_snippets:
-                if black and language == 'python' and snippet['code']:
-                    try:
-                        snippet['code'] = black.format_str(snippet['code'], mode=black.FileMode())
-                    except Exception as e:
-                        print(f"Code formatting failed: {e}")
-                formatted_code.append(snippet)
-
-            interaction = CodeInteraction.objects.create(
-                session=session,
-                prompt=prompt,
-                response=ai_response,
-                code_snippet=formatted_code[0]['code'] if formatted_code else '',
-                language=language
+        if generation.cache_status == 'MISS':
+            await response_cache.aset(generation.cache_key, payload)
+            if generation.semantic is not None:
+                semantic_cache.add(generation.semantic, interaction.id)
+        return interaction
+
+    async def aevent_stream(self, generation):
+        extractor = SnippetStream(generation.language)
+        chunks = []
+        formatted_code = []
+        try:
+            cached = generation.cached
+            if cached is not None:
+                yield sse_event('token', {'content': cached['response']})
+                for snippet in cached['code_snippets']:
+                    yield sse_event('snippet', snippet)
+                payload = cached
+            else:
+                flight, leader = coalescer.join(generation.flight_key)
+                try:
+                    if leader:
+                        tokens = coalescer.alead(generation.flight_key, flight, lambda: self.aleader_stream(generation))
+                    else:
+                        tokens = flight.afollow()
+                    async for token in tokens:
+                        chunks.append(token)
+                        yield sse_event('token', {'content': token})
+                        for snippet in extractor.feed(token):
+                            formatted_code.append(await self.aformat_snippet(snippet))
+                            yield sse_event('snippet', formatted_code[-1])
+                    for snippet in extractor.finish():
+                        formatted_code.append(await self.aformat_snippet(snippet))
+                        yield sse_event('snippet', formatted_code[-1])
+                    payload = {
+                        "response": ''.join(chunks),
+                        "code_snippets": formatted_code or [{"language": generation.language, "code": ""}],
+                    }
+                    if leader:
+                        await coalescer.afinish(generation.flight_key, flight, payload)
+                finally:
+                    admission.release(generation.ticket)
+                    if leader:
+                        coalescer.release(generation.flight_key, flight)
+                if not leader or flight.shared:
+                    generation.cache_status = 'COALESCED'
+
+            interaction = await self.afinish_generation(generation, payload)
+            yield sse_event('done', {
+                **CodeInteractionSerializer(interaction).data,
+                'code_snippets': payload['code_snippets'],
+                'cache': generation.cache_status,
+                'model': generation.kwargs['model'],
+            })
+        except Exception as e:
+            yield sse_event('error', {
+                "error": f"Oops, something went wrong with Ollama: {str(e)}. Please try again!"
+            })
+
+    async def aformat_snippet(self, snippet):
+        # Waiting on the black pool blocks; keep it off the event loop.
+        return await sync_to_async(self.format_snippet, thread_sensitive=False)(snippet)
+
+    async def asave_interaction(self, session, prompt, ai_response, formatted_code, language):
+        return await CodeInteraction.objects.acreate(
+            session=session,
+            prompt=prompt,
+            response=ai_response,
+            code_snippet=formatted_code[0]['code'] if formatted_code else '',
+            language=language
+        )
+
+    def extract_code_snippets(self, response, language):
+        snippets = extract_snippets(response, language)
+        return snippets if snippets else [{"language": language, "code": ""}]
+
+
+class GenerationEvents:
+    """Streaming content that gives back the generation's admission slot when closed.
+
+    A generator closed before its first iteration (the client left straight
+    away) never runs its ``finally`` block, so the slot is released here too.
+    """
+
+    def __init__(self, events, generation):
+        self.events = events
+        self.generation = generation
+
+    def __iter__(self):
+        return iter(self.events)
+
+    def close(self):
+        self.events.close()
+        admission.release(self.generation.ticket)
+
+
+class AsyncGenerationEvents:
+    def __init__(self, events, generation):
+        self.events = events
+        self.generation = generation
+
+    def __aiter__(self):
+        return aiter(self.events)
+
+    def close(self):
+        admission.release(self.generation.ticket)
+
+
+def event_stream_response(events):
+    response = StreamingHttpResponse(events, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def too_many_requests(error, response_class=Response):
+    response = response_class(
+        {"error": f"{str(error)}. Please try again shortly!"},
+        status=status.HTTP_429_TOO_MANY_REQUESTS
+    )
+    response['Retry-After'] = str(int(error.retry_after))
+    return response
+
+
+class CodeInteractionViewSet(CodeInteractionMixin, viewsets.ModelViewSet):
+    serializer_class = CodeInteractionSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = InteractionCursorPagination
+
+    def get_queryset(self):
+        queryset = CodeInteraction.objects.filter(session__user=self.request.user)
+        if self.action in ('list', 'retrieve'):
+            queryset = queryset.only(*CodeInteractionSerializer.columns(self.request))
+        return queryset
+
+    def create(self, request):
+        error = self._validate(request)
+        if error:
+            return error
+
+        session_id = request.data.get('session_id')
+        prompt = request.data.get('prompt')
+        language = request.data.get('language', 'python')
+        think_mode = request.data.get('think_mode', False)
+
+        session = get_object_or_404(CodeSession, id=session_id, user=request.user)
+        if request.data.get('background'):
+            return enqueue_job(request, session)
+
+        try:
+            generation = self.prepare_generation(
+                session, prompt, language, think_mode, request.data, self.build_context(session)
             )
+            self.admit(generation)
+            payload = self.generate_response(generation)
+            interaction = self.finish_generation(generation, payload)
 
             serializer = self.get_serializer(interaction)
             return Response({
                 **serializer.data,
-                'code_snippets': formatted_code
-            }, status=status.HTTP_201_CREATED)
+                'code_snippets': payload['code_snippets']
+            }, status=status.HTTP_201_CREATED, headers={
+                'X-Cache': generation.cache_status, 'X-Model': generation.kwargs['model'],
+            })
 
+        except AdmissionRejected as e:
+            return too_many_requests(e)
+        except OllamaUnavailable as e:
+            return Response(
+                {"error": f"{str(e)}. Please try again shortly!"},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                headers={'Retry-After': str(int(e.retry_after) + 1)}
+            )
         except Exception as e:
             return Response(
                 {"error": f"Oops, something went wrong with Ollama: {str(e)}. Please try again!"},
                 status=status.HTTP_503_SERVICE_UNAVAILABLE
             )
 
-    def extract_code_snippets(self, response, language):
-        pattern = r"```(?:{lang})?\s*([\s\S]*?)```".format(lang=re.escape(language))
-        matches = re.findall(pattern, response, re.IGNORECASE)
-        snippets = [{"language": language, "code": match.strip()} for match in matches]
-        inline_pattern = r"`([^`]+)`"
-        inline_matches = re.findall(inline_pattern, response)
-        snippets.extend([{"language": "text", "code": match.strip()} for match in inline_matches])
-        return snippets if snippets else [{"language": language, "code": ""}]
+    @action(detail=False, methods=['post'], renderer_classes=[EventStreamRenderer, JSONRenderer])
+    def stream(self, request):
+        """Server-sent events variant of ``create``, see ``event_stream``."""
+        error = self._validate(request)
+        if error:
+            return error
+
+        session_id = request.data.get('session_id')
+        prompt = request.data.get('prompt')
+        language = request.data.get('language', 'python')
+        think_mode = request.data.get('think_mode', False)
+
+        session = get_object_or_404(CodeSession, id=session_id, user=request.user)
+
+        generation = self.prepare_generation(
+            session, prompt, language, think_mode, request.data, self.build_context(session)
+        )
+        # Admit before streaming starts so an overloaded server can still answer 429.
+        try:
+            self.admit(generation)
+        except AdmissionRejected as e:
+            return too_many_requests(e)
+        return event_stream_response(GenerationEvents(self.event_stream(generation), generation))
+
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        """``?q=`` over the user's interactions, best match first, with highlighted excerpts."""
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response({"error": "q is required"}, status=status.HTTP_400_BAD_REQUEST)
+        paginator = SearchPagination()
+        page = paginator.paginate_queryset(search.search(request.user, query), request, view=self)
+        serializer = SearchResultSerializer(page, many=True, context={'words': search.query_words(query)})
+        return paginator.get_paginated_response(serializer.data)
+
+    def _validate(self, request):
+        if not request.data.get('session_id'):
+            return Response({"error": "session_id is required"}, status=status.HTTP_400_BAD_REQUEST)
+        if not request.data.get('prompt'):
+            return Response({"error": "prompt is required"}, status=status.HTTP_400_BAD_REQUEST)
+        return None
+
+def enqueue_job(request, session):
+    """Queue the request's generation for the workers and answer 202 with the job.
+
+    A repeated ``Idempotency-Key`` gets the job it created the first time, with 200.
+    """
+    try:
+        priority = max(-10, min(10, int(request.data.get('priority', 0))))
+    except (TypeError, ValueError):
+        return Response({"error": "priority must be an integer"}, status=status.HTTP_400_BAD_REQUEST)
+    if not request.user.is_staff:
+        # Anyone may lower their own jobs' priority; only staff may raise it.
+        priority = min(priority, 0)
+    job, created = jobs.enqueue(
+        session,
+        request.data.get('prompt'),
+        request.data.get('language', 'python'),
+        options={
+            **{key: request.data[key] for key in ('think_mode', 'cache') if key in request.data},
+            # So the worker's trace and log lines carry the id of the request that queued the job.
+            'request_id': tracing.request_id(),
+        },
+        priority=priority,
+        idempotency_key=request.headers.get('Idempotency-Key') or request.data.get('idempotency_key'),
+    )
+    job = GenerationJob.objects.select_related('interaction').get(id=job.id)
+    return Response(
+        GenerationJobSerializer(job).data,
+        status=status.HTTP_202_ACCEPTED if created else status.HTTP_200_OK,
+        headers={'Location': reverse('coder:job-detail', args=[job.id])},
+    )
+
+
+class GenerationJobViewSet(viewsets.ReadOnlyModelViewSet):
+    """Background generations: create one, poll it, follow it as events, or cancel it."""
+    serializer_class = GenerationJobSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = JobCursorPagination
+
+    def get_queryset(self):
+        return GenerationJob.objects.filter(user=self.request.user).select_related('interaction')
+
+    def create(self, request):
+        if not request.data.get('session_id'):
+            return Response({"error": "session_id is required"}, status=status.HTTP_400_BAD_REQUEST)
+        if not request.data.get('prompt'):
+            return Response({"error": "prompt is required"}, status=status.HTTP_400_BAD_REQUEST)
+        session = get_object_or_404(CodeSession, id=request.data['session_id'], user=request.user)
+        return enqueue_job(request, session)
+
+    @action(detail=True, methods=['post'])
+    def cancel(self, request, pk=None):
+        job = jobs.cancel(self.get_object())
+        return Response(self.get_serializer(job).data)
+
+    @action(detail=True, methods=['get'], renderer_classes=[EventStreamRenderer, JSONRenderer])
+    def events(self, request, pk=None):
+        """Server-sent events for a job as it is now, see ``job_events``.
+
+        A sync worker doesn't wait for more: the response ends with a
+        ``retry`` field, so EventSource reconnects after
+        ``GENERATION_JOB_POLL_SECONDS`` and resumes from ``Last-Event-ID``.
+        Under ASGI, ``AsyncGenerationJobEventsView`` keeps one connection open.
+        """
+        job = self.get_object()
+        interaction = CodeInteraction.objects.get(id=job.interaction_id)
+        events, _ = job_events(job, interaction, event_offset(request), None)
+        if job.status not in GenerationJob.FINISHED:
+            events.append(f"retry: {int(GENERATION_JOB_POLL_SECONDS * 1000)}\n\n")
+        return event_stream_response(events)
+
+
+def event_offset(request):
+    """Characters of the response the client already has: ``Last-Event-ID`` or ``?offset=``."""
+    try:
+        return int(request.headers.get('Last-Event-ID') or request.GET.get('offset') or 0)
+    except ValueError:
+        return 0
+
+
+def job_events(job, interaction, offset, last_status):
+    """Events for one look at ``job``, and the offset reached.
+
+    A ``status`` event when the status differs from ``last_status``, a
+    ``progress`` event with new text (its id is the offset reached) and,
+    once the job has finished, one event named after the final status.
+    """
+    events = []
+    if job.status != last_status:
+        events.append(sse_event('status', {'status': job.status}))
+    if len(interaction.response) > offset:
+        text, offset = interaction.response[offset:], len(interaction.response)
+        events.append(f"id: {offset}\n" + sse_event('progress', {'text': text}))
+    if job.status in GenerationJob.FINISHED:
+        job.interaction = interaction
+        events.append(sse_event(job.status, GenerationJobSerializer(job).data))
+    return events, offset
+
+
+class AsyncGenerationJobEventsView(View):
+    """Job events over one connection for ASGI deployments, polling with ``asyncio.sleep``.
+
+    Ends after ``GENERATION_JOB_SUBSCRIBE_SECONDS``; reconnecting picks up from the last id.
+    """
+
+    async def get(self, request, pk):
+        user = await request.auser()
+        if not user.is_authenticated:
+            return JsonResponse({"detail": "Authentication credentials were not provided."}, status=status.HTTP_403_FORBIDDEN)
+        try:
+            job = await GenerationJob.objects.aget(id=pk, user=user)
+        except GenerationJob.DoesNotExist:
+            return JsonResponse({"detail": "No GenerationJob matches the given query."}, status=status.HTTP_404_NOT_FOUND)
+        return event_stream_response(self.event_stream(job, event_offset(request)))
+
+    async def event_stream(self, job, offset):
+        deadline = time.monotonic() + GENERATION_JOB_SUBSCRIBE_SECONDS
+        last_status = None
+        while True:
+            interaction = await CodeInteraction.objects.aget(id=job.interaction_id)
+            events, offset = job_events(job, interaction, offset, last_status)
+            last_status = job.status
+            for event in events:
+                yield event
+            if job.status in GenerationJob.FINISHED or time.monotonic() >= deadline:
+                return
+            await asyncio.sleep(GENERATION_JOB_POLL_SECONDS)
+            await job.arefresh_from_db()
+
+
+class AsyncCodeInteractionView(CodeInteractionMixin, View):
+    """Async twin of ``CodeInteractionViewSet.create`` for ASGI deployments.
+
+    Served by uvicorn the Ollama call is awaited rather than blocking a worker
+    thread; under WSGI it still works but gains nothing.
+    """
+
+    async def post(self, request):
+        user = await request.auser()
+        if not user.is_authenticated:
+            return JsonResponse({"detail": "Authentication credentials were not provided."}, status=status.HTTP_403_FORBIDDEN)
+
+        try:
+            data = json.loads(request.body or b'{}')
+        except ValueError:
+            return JsonResponse({"error": "Invalid JSON body"}, status=status.HTTP_400_BAD_REQUEST)
+
+        session_id = data.get('session_id')
+        prompt = data.get('prompt')
+        language = data.get('language', 'python')
+        think_mode = data.get('think_mode', False)
+
+        if not session_id:
+            return JsonResponse({"error": "session_id is required"}, status=status.HTTP_400_BAD_REQUEST)
+        if not prompt:
+            return JsonResponse({"error": "prompt is required"}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            session = await CodeSession.objects.aget(id=session_id, user=user)
+        except (CodeSession.DoesNotExist, ValueError):
+            return JsonResponse({"detail": "No CodeSession matches the given query."}, status=status.HTTP_404_NOT_FOUND)
+
+        generation = await self.aprepare_generation(
+            session, prompt, language, think_mode, data, await self.abuild_context(session)
+        )
+        return await self.respond(generation)
+
+    async def respond(self, generation):
+        try:
+            await self.aadmit(generation)
+            payload = await self.agenerate_response(generation)
+            interaction = await self.afinish_generation(generation, payload)
+
+            response = JsonResponse({
+                **CodeInteractionSerializer(interaction).data,
+                'code_snippets': payload['code_snippets']
+            }, status=status.HTTP_201_CREATED)
+            response['X-Cache'] = generation.cache_status
+            response['X-Model'] = generation.kwargs['model']
+            return response
+
+        except AdmissionRejected as e:
+            return too_many_requests(e, JsonResponse)
+        except OllamaUnavailable as e:
+            response = JsonResponse(
+                {"error": f"{str(e)}. Please try again shortly!"},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE
+            )
+            response['Retry-After'] = str(int(e.retry_after) + 1)
+            return response
+        except Exception as e:
+            return JsonResponse(
+                {"error": f"Oops, something went wrong with Ollama: {str(e)}. Please try again!"},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE
+            )
+
+
+class AsyncCodeInteractionStreamView(AsyncCodeInteractionView):
+    """Async twin of ``CodeInteractionViewSet.stream``."""
+
+    async def respond(self, generation):
+        try:
+            await self.aadmit(generation)
+        except AdmissionRejected as e:
+            return too_many_requests(e, JsonResponse)
+        return event_stream_response(AsyncGenerationEvents(self.aevent_stream(generation), generation))
 
 class CodeExecutionView(APIView):
     permission_classes = [permissions.IsAuthenticated]
@@ -141,54 +869,179 @@ class CodeExecutionView(APIView):
         code = request.data.get('code')
         language = request.data.get('language', 'python')
 
-        if language != 'python':
-            return Response({"error": "Only Python execution is supported currently"}, status=status.HTTP_400_BAD_REQUEST)
+        runner = get_runner(language)
+        if runner is None:
+            return Response({"error": f"Running {language} code is not supported"}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            result = subprocess.run(
-                ['python', '-c', code],
-                capture_output=True,
-                text=True,
-                timeout=5
-            )
-            output = result.stdout if result.stdout else result.stderr
-            return Response({"output": output})
-        except subprocess.TimeoutExpired:
-            return Response({"error": "Code execution timed out"}, status=status.HTTP_408_REQUEST_TIMEOUT)
+            execution, build = runner.open(code or "", user=request.user.id)
+            # A failed compile is reported like a run that printed the compiler's errors.
+            result = sandbox.collect(execution) if execution else build
+            if result['timed_out']:
+                return Response({"error": "Code execution timed out"}, status=status.HTTP_408_REQUEST_TIMEOUT)
+            output = result['stdout'] if result['stdout'] else result['stderr']
+            return Response({"output": output, **result, "compile": build})
+        except AdmissionRejected as e:
+            return too_many_requests(e)
+        except JobTooLarge as e:
+            return Response({"error": str(e)}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        except SandboxError as e:
+            return Response({"error": f"Execution failed: {str(e)}"}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
         except Exception as e:
             return Response({"error": f"Execution failed: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+class CodeExecutionStreamView(APIView):
+    """Server-sent events variant of ``CodeExecutionView``.
+
+    Emits ``stdout`` and ``stderr`` events, one line each, in the order the
+    snippet wrote them, then a single ``exit`` event with the exit code,
+    timings and whether output was cut at ``SANDBOX_OUTPUT_BYTES``. Compiled
+    languages send a ``compile`` event first; if the build failed it is
+    followed straight by ``exit``.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    renderer_classes = [EventStreamRenderer, JSONRenderer]
+
+    def post(self, request):
+        code = request.data.get('code')
+        language = request.data.get('language', 'python')
+
+        runner = get_runner(language)
+        if runner is None:
+            return Response({"error": f"Running {language} code is not supported"}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Compile and admit before streaming starts so a busy sandbox can still answer 429.
+        try:
+            execution, build = runner.open(code or "", user=request.user.id)
+        except AdmissionRejected as e:
+            return too_many_requests(e)
+        except JobTooLarge as e:
+            return Response({"error": str(e)}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        except SandboxError as e:
+            return Response({"error": f"Execution failed: {str(e)}"}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        return event_stream_response(ExecutionEvents(self.event_stream(execution, build), execution))
+
+    def event_stream(self, execution, build=None):
+        if build is not None:
+            yield sse_event('compile', build)
+        if execution is None:
+            yield sse_event('exit', {k: v for k, v in build.items() if k not in ('stdout', 'stderr')})
+            return
+        try:
+            for stream, data in execution.lines():
+                yield sse_event(stream, data if stream == 'exit' else {"text": data})
+        except Exception as e:
+            yield sse_event('error', {"error": f"Execution failed: {str(e)}"})
+        finally:
+            execution.close()
+
+
+class ExecutionEvents:
+    """Streaming content that stops the snippet and frees its slot when the client leaves."""
+
+    def __init__(self, events, execution):
+        self.events = events
+        self.execution = execution
+
+    def __iter__(self):
+        return iter(self.events)
+
+    def close(self):
+        self.events.close()
+        if self.execution is not None:
+            self.execution.close()
+
 class CodeFormattingView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def post(self, request):
+        """Format ``code``, or every ``{"code", "language"}`` item of ``snippets`` in one call."""
+        snippets = request.data.get('snippets')
+        if snippets is not None:
+            return self.format_batch(snippets)
+
         code = request.data.get('code')
         language = request.data.get('language', 'python')
 
         if language != 'python':
             return Response({"error": "Only Python formatting is supported currently"}, status=status.HTTP_400_BAD_REQUEST)
 
-        if not black:
+        if not formatter.available:
             return Response({"error": "Code formatting is not available (black not installed)"}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
 
         try:
-            formatted_code = black.format_str(code, mode=black.FileMode())
+            formatted_code = formatter.format(code or '')
             return Response({"formatted_code": formatted_code})
-        except Exception as e:
+        except FormattingError as e:
             return Response({"error": f"Formatting failed: {str(e)}"}, status=status.HTTP_400_BAD_REQUEST)
 
+    def format_batch(self, snippets):
+        if not isinstance(snippets, list) or not all(isinstance(s, dict) for s in snippets):
+            return Response({"error": "snippets must be a list of {code, language} objects"}, status=status.HTTP_400_BAD_REQUEST)
+        if len(snippets) > FORMAT_BATCH_MAX:
+            return Response({"error": f"At most {FORMAT_BATCH_MAX} snippets per request"}, status=status.HTTP_400_BAD_REQUEST)
+        if not formatter.available:
+            return Response({"error": "Code formatting is not available (black not installed)"}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+        python = [i for i, s in enumerate(snippets) if s.get('language', 'python') == 'python']
+        results = [{"error": "Only Python formatting is supported currently"} for _ in snippets]
+        formatted = formatter.format_many([str(snippets[i].get('code') or '') for i in python])
+        for i, (formatted_code, error) in zip(python, formatted):
+            results[i] = {"formatted_code": formatted_code} if error is None else {"error": f"Formatting failed: {error}"}
+        return Response({"results": results})
+
+class ResponseCacheStatsView(APIView):
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        stats = response_cache.stats()
+        if semantic_cache is not None:
+            stats['semantic'] = semantic_cache.stats()
+        stats['coalescing'] = coalescer.stats()
+        return Response(stats)
+
+class AdmissionStatsView(APIView):
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response({
+            **admission.stats(),
+            'model_tiers': model_policy.stats(),
+            'backends': get_router().snapshot(),
+        })
+
+class MetricsView(View):
+    """Prometheus scrape target, for every process sharing ``METRICS_DIR``."""
+
+    def get(self, request):
+        if METRICS_TOKEN:
+            supplied = request.headers.get('Authorization', '').removeprefix('Bearer ')
+            allowed = hmac.compare_digest(supplied.encode(), METRICS_TOKEN.encode())
+        else:
+            allowed = request.user.is_staff
+        if not allowed:
+            return HttpResponse(status=403)
+        return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 class CodeAssistantView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request):
-        session = CodeSession.objects.filter(user=request.user, is_active=True).first()
+        # At most one active session: a slice rather than first(), whose ORDER BY would need a sort.
+        session = next(iter(CodeSession.objects.filter(user=request.user, is_active=True).only('id')[:1]), None)
         if not session:
-            session = CodeSession.objects.create(
-                user=request.user,
-                title="Coding Session",
-                is_active=True
-            )
+            try:
+                with transaction.atomic():
+                    session = CodeSession.objects.create(
+                        user=request.user,
+                        title="Coding Session",
+                        is_active=True
+                    )
+            except IntegrityError:
+                # Another tab created the active session first.
+                session = CodeSession.objects.only('id').get(user=request.user, is_active=True)
         return render(request, 'coder/index.html', {
             'code_languages': CODE_LANGUAGES,
-            'active_session_id': session.id
+            'active_session_id': session.id,
+            'async_api': ASYNC_API
         })
\ No newline at end of file
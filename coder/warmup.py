@@ -0,0 +1,170 @@
+# coder/warmup.py
+"""Keep the models we route to loaded, so no request pays for a cold load.
+
+Ollama unloads a model ``OLLAMA_KEEP_ALIVE`` after its last request, and the
+next request then waits seconds for the load before its first token. The
+warmer loads the configured models (``MODEL_WARMUP_MODELS``, or every tier's
+model) on each healthy backend when it starts. Every
+``MODEL_WARMUP_INTERVAL`` it sends each model that served traffic in the last
+``MODEL_WARMUP_IDLE`` seconds an empty generate request. That loads the model
+if it was unloaded and renews its keep-alive without evaluating anything.
+Models nobody used for that long, in any process, are left to expire.
+
+While a backend loads a model every router ranks it last for that model, the
+tier policy treats a model loading on every backend as busy, and admission
+turns away generations for it (see ``coder/routing.py``).
+
+With ``MODEL_WARMUP`` every process starts a warmer thread, but only the one
+holding ``MODEL_WARMUP_LOCK_FILE`` warms; the others stand by in case it
+exits. ``manage.py warm_models --keep-alive`` takes the same lock.
+"""
+import fcntl
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+
+from .metrics import OLLAMA_MODEL_LOAD, OLLAMA_MODEL_RESIDENT
+from .routing import get_router, model_key
+from .services import get_client
+from .settings import (
+    MODEL_WARMUP_IDLE,
+    MODEL_WARMUP_INTERVAL,
+    MODEL_WARMUP_LOCK_FILE,
+    MODEL_WARMUP_MODELS,
+    OLLAMA_HEALTH_TIMEOUT,
+    OLLAMA_KEEP_ALIVE,
+)
+from .tiers import model_policy
+
+logger = logging.getLogger(__name__)
+
+
+class ModelWarmer:
+    def __init__(self, models=None, router=None, interval=MODEL_WARMUP_INTERVAL, idle=MODEL_WARMUP_IDLE,
+                 lock_file=MODEL_WARMUP_LOCK_FILE):
+        models = models or MODEL_WARMUP_MODELS or [tier.model for tier in model_policy.tiers]
+        self.models = list(dict.fromkeys(model_key(model) for model in models))
+        self.interval = interval
+        # 0 keeps the configured models loaded whatever the traffic.
+        self.idle = idle
+        self._router = router
+        self.lock_file = lock_file
+        self._lock = None
+        self.started = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def router(self):
+        return self._router or get_router()
+
+    def wanted(self):
+        """Models to keep loaded: configured or used ones with traffic within ``idle``.
+
+        Configured models count as used when the warmer starts, so they are
+        loaded straight away. Traffic counts from every process sharing the
+        model state, not just this one.
+        """
+        now = time.time()
+        started = self.started if self.started is not None else now
+        if not self.idle:
+            return self.models
+        used = dict.fromkeys(self.models, started)
+        for model, at in [*self.router.shared_last_used().items(), *list(self.router.last_used.items())]:
+            used[model] = max(at, used.get(model, at))
+        return [model for model, at in used.items() if now - at < self.idle]
+
+    def run_once(self):
+        """Load or renew the wanted models on every healthy backend, the backends in parallel."""
+        models = self.wanted()
+        backends = [b for b in self.router.backends if b.healthy and not b.breaker.is_open]
+        if not models or not backends:
+            return
+        with ThreadPoolExecutor(max_workers=len(backends)) as pool:
+            list(pool.map(lambda backend: self.warm(backend, models), backends))
+
+    def warm(self, backend, models):
+        resident = self.resident(backend)
+        if resident is None:
+            return
+        # Ollama loads one model at a time per server anyway.
+        for model in models:
+            self.load(backend, model, cold=model not in resident)
+
+    def resident(self, backend):
+        try:
+            response = httpx.get(f"{backend.host}/api/ps", timeout=OLLAMA_HEALTH_TIMEOUT)
+            response.raise_for_status()
+            models = {model_key(m["name"]) for m in response.json().get("models", [])}
+        except (httpx.HTTPError, ValueError) as e:
+            logger.warning("Listing the loaded models on %s failed: %s", backend.host, e)
+            return None
+        self.router.set_models(backend, models)
+        for model in self.models:
+            OLLAMA_MODEL_RESIDENT.set(int(model in models), backend=backend.host, model=model)
+        return models
+
+    def load(self, backend, model, cold):
+        if cold:
+            self.router.start_loading(backend, model)
+        started = time.monotonic()
+        loaded = False
+        try:
+            get_client(backend.host).generate(model=model, keep_alive=OLLAMA_KEEP_ALIVE or None)
+            loaded = True
+        except Exception as e:
+            logger.warning("Warming %s on %s failed: %s", model, backend.host, e)
+        finally:
+            if cold:
+                self.router.finish_loading(backend, model, loaded)
+        if cold and loaded:
+            OLLAMA_MODEL_LOAD.observe(time.monotonic() - started, model=model)
+            OLLAMA_MODEL_RESIDENT.set(1, backend=backend.host, model=model)
+            logger.info("Loaded %s on %s in %.1fs", model, backend.host, time.monotonic() - started)
+        return loaded
+
+    def hold_lock(self):
+        """Take the host's warmer lock if it is free; whether this warmer holds it."""
+        if self._lock is None:
+            lock = open(self.lock_file, "a")
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock.close()
+                return False
+            self._lock = lock
+            logger.info("Model warmer running in process %d", os.getpid())
+        return True
+
+    def release_lock(self):
+        if self._lock is not None:
+            self._lock.close()
+            self._lock = None
+
+    def run(self):
+        self.started = time.time()
+        try:
+            while not self._stop.is_set():
+                try:
+                    if self.hold_lock():
+                        self.run_once()
+                except Exception:
+                    logger.exception("Model warm-up failed")
+                self._stop.wait(self.interval)
+        finally:
+            self.release_lock()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.run, name="model-warmer", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+
+model_warmer = ModelWarmer()
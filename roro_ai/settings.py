@@ -54,6 +54,8 @@ INSTALLED_APPS = [
 TAILWIND_APP_NAME = 'theme'
 
 MIDDLEWARE = [
+    # First, so its timings and query counts cover every other middleware too.
+    'coder.middleware.ObservabilityMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -63,11 +65,15 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# EmailOrUsernameModelBackend also covers plain username logins, so a failed
+# attempt doesn't run a second lookup and hash in ModelBackend.
 AUTHENTICATION_BACKENDS = [
     'authentication.backends.EmailOrUsernameModelBackend',
-    'django.contrib.auth.backends.ModelBackend',
 ]
 
+# Seconds to remember a login identifier that matches no user (0 disables)
+LOGIN_MISS_CACHE_TTL = config('LOGIN_MISS_CACHE_TTL', default=30, cast=int)
+
 ROOT_URLCONF = 'roro_ai.urls'
 
 
@@ -113,6 +119,27 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+
+RESPONSE_CACHE_BACKEND = config('RESPONSE_CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache')
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Finished LLM answers, see coder/cache.py
+    'responses': {
+        'BACKEND': RESPONSE_CACHE_BACKEND,
+        'LOCATION': config('RESPONSE_CACHE_LOCATION', default='coder-responses'),
+        'TIMEOUT': config('RESPONSE_CACHE_TTL', default=60 * 60 * 24, cast=int),
+    },
+}
+if 'redis' not in RESPONSE_CACHE_BACKEND:
+    # Redis evicts through its own maxmemory-policy (use allkeys-lru)
+    CACHES['responses']['OPTIONS'] = {
+        'MAX_ENTRIES': config('RESPONSE_CACHE_MAX_ENTRIES', default=5000, cast=int),
+    }
 
 
 # Password validation
@@ -175,6 +202,30 @@ LOGOUT_REDIRECT_URL = 'home:home'
 # Session settings
 SESSION_COOKIE_AGE = 60 * 60 * 24 * 30  # 30 days
 
+# Logging: every line carries the request id (also sent back as X-Request-ID).
+# Request traces go to the coder.trace logger when TRACING_ENABLED is set.
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'filters': {
+        'request_id': {'()': 'coder.tracing.RequestIdFilter'},
+    },
+    'formatters': {
+        'default': {'format': '%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s'},
+        'trace': {'format': '%(message)s'},
+    },
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler', 'filters': ['request_id'], 'formatter': 'default'},
+        'trace': {'class': 'logging.StreamHandler', 'formatter': 'trace'},
+    },
+    'root': {'handlers': ['console'], 'level': os.getenv('LOG_LEVEL', 'INFO')},
+    'loggers': {
+        'coder.trace': {'handlers': ['trace'], 'level': 'INFO', 'propagate': False},
+        # One line per Ollama call otherwise.
+        'httpx': {'level': 'WARNING'},
+    },
+}
+
 
 ALLOWED_HOSTS = ['localhost', '127.0.0.1', '162.243.42.209', '162.243.42.209:8000', '*']
 
@@ -17,8 +17,11 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 
+from coder.views import MetricsView
+
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics', MetricsView.as_view(), name='metrics'),
     path('coder/', include('coder.urls', namespace='coder')),
     path('', include('home.urls', namespace='home')),
     path('auth/', include('authentication.urls', namespace='authentication')),